@@ -0,0 +1,146 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from pnl import parse_exit_times, realized_outcomes
+
+
+def compute_risk_reward(df: pd.DataFrame) -> np.ndarray:
+    """
+    Calculer le ratio risk/reward de tous les trades en une opération vectorisée.
+
+    Même règle que l'ancien calcul ligne par ligne : reward / risk, 0 si le risque est nul,
+    NaN si un prix est manquant.
+
+    Args:
+        df: DataFrame avec entry_price, stop_loss et take_profit
+
+    Returns:
+        Tableau float64 des R:R
+    """
+    entry = pd.to_numeric(df["entry_price"], errors="coerce").to_numpy(dtype=np.float64)
+    stop = pd.to_numeric(df["stop_loss"], errors="coerce").to_numpy(dtype=np.float64)
+    target = pd.to_numeric(df["take_profit"], errors="coerce").to_numpy(dtype=np.float64)
+
+    risk = np.abs(entry - stop)
+    reward = np.abs(target - entry)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(risk != 0, reward / risk, 0.0)
+
+
+def prepare_trades(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ajouter les colonnes typées utilisées par le dashboard, en parsant les dates une seule fois.
+
+    Colonnes ajoutées :
+    - created_at_dt : datetime64 UTC
+    - created_day : jour (datetime64 naïf, UTC) pour les filtres et comptages par jour
+    - label : date formatée « jj/mm/aaaa hh:mm » pour la sélection et le journal
+    - risk_reward : float64
+    - exit_time_dt : datetime64 UTC de la sortie, NaT pour un trade ouvert
+    - realized_r, pnl_points, pnl_usd : résultat réalisé des trades clôturés, NaN sinon (voir pnl.py)
+
+    Args:
+        df: Trades bruts (colonnes Supabase)
+
+    Returns:
+        Le même DataFrame enrichi
+    """
+    if df.empty:
+        return df
+    created = pd.to_datetime(df["created_at"], utc=True, format="ISO8601")
+    df["created_at_dt"] = created
+    df["created_day"] = created.dt.tz_convert(None).dt.normalize()
+    df["label"] = created.dt.strftime("%d/%m/%Y %H:%M")
+    df["risk_reward"] = compute_risk_reward(df)
+    if "exit_time" in df:
+        df["exit_time_dt"] = parse_exit_times(df["exit_time"])
+    outcome = realized_outcomes(df)
+    for column in ("realized_r", "pnl_points", "pnl_usd"):
+        df[column] = outcome[column]
+    return df
+
+
+def calculate_win_rate(df: pd.DataFrame) -> float:
+    """
+    Calculer le win rate prévisionnel basé sur le R:R.
+
+    Indicateur de repli quand aucun trade n'est clôturé : le win rate réalisé
+    (P&L des trades clôturés) est calculé par pnl.PnlEngine.
+    """
+    if df.empty:
+        return 0
+    # Pour l'instant, on considère un trade gagnant si R:R >= 1
+    return float((df["risk_reward"].to_numpy() >= 1).mean() * 100)
+
+
+def summary_stats(df: pd.DataFrame, today: Optional[pd.Timestamp] = None) -> Dict[str, Any]:
+    """
+    Statistiques générales du dashboard, calculées sur des colonnes préparées.
+
+    Args:
+        df: Trades passés par prepare_trades
+        today: Jour de référence (par défaut aujourd'hui)
+
+    Returns:
+        Dict avec total_trades, trades_today, long_ratio, avg_rr et win_rate
+    """
+    total = len(df)
+    if total == 0:
+        return {"total_trades": 0, "trades_today": 0, "long_ratio": 0, "avg_rr": 0.0, "win_rate": 0}
+
+    today = (today or pd.Timestamp.now()).normalize()
+    longs = int((df["direction"].to_numpy() == "LONG").sum())
+    return {
+        "total_trades": total,
+        "trades_today": int((df["created_day"] == today).sum()),
+        "long_ratio": longs / total * 100,
+        "avg_rr": float(df["risk_reward"].mean()),
+        "win_rate": calculate_win_rate(df),
+    }
+
+
+def summary_from_daily_stats(rows: List[Dict[str, Any]], today: Optional[pd.Timestamp] = None) -> Dict[str, Any]:
+    """
+    Statistiques générales du dashboard à partir des agrégats de trade_daily_stats.
+
+    Mêmes valeurs que summary_stats sur le journal complet : le R:R moyen ignore
+    les R:R inconnus (0.0 si aucun n'est connu), le win rate les compte comme perdants.
+
+    Args:
+        rows: Lignes de trade_daily_stats (day, direction, trade_count, rr_sum, rr_count, win_count)
+        today: Jour de référence (par défaut aujourd'hui en UTC, comme la colonne day)
+
+    Returns:
+        Dict avec total_trades, trades_today, long_ratio, avg_rr et win_rate
+    """
+    total = sum(int(row["trade_count"]) for row in rows)
+    if total == 0:
+        return {"total_trades": 0, "trades_today": 0, "long_ratio": 0, "avg_rr": 0.0, "win_rate": 0}
+
+    today = (today or pd.Timestamp.now(tz="UTC")).normalize().date().isoformat()
+    longs = sum(int(row["trade_count"]) for row in rows if row["direction"] == "LONG")
+    rr_count = sum(int(row["rr_count"]) for row in rows)
+    return {
+        "total_trades": total,
+        "trades_today": sum(int(row["trade_count"]) for row in rows if str(row["day"]) == today),
+        "long_ratio": longs / total * 100,
+        "avg_rr": sum(float(row["rr_sum"]) for row in rows) / rr_count if rr_count else 0.0,
+        "win_rate": sum(int(row["win_count"]) for row in rows) / total * 100,
+    }
+
+
+def daily_counts(df: pd.DataFrame) -> pd.Series:
+    """
+    Nombre de trades par jour.
+
+    Args:
+        df: Trades passés par prepare_trades
+
+    Returns:
+        Série indexée par jour, triée chronologiquement
+    """
+    if df.empty:
+        return pd.Series(dtype="int64")
+    return df["created_day"].value_counts().sort_index()
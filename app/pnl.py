@@ -0,0 +1,440 @@
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Valeur d'un point en dollars pour un contrat (tick de 0,25 : 12,50 $ sur ES, 5 $ sur NQ)
+POINT_VALUES = {"ES": 50.0, "NQ": 20.0, "MES": 5.0, "MNQ": 2.0}
+
+# Racine du contrat : « ES », « ESZ6 », « ESZ2026 », « ES1! » et « CME_MINI:ES1! » (TradingView) donnent ES
+ROOT_PATTERN = re.compile(r"^([A-Z]+?)(?:[FGHJKMNQUVXZ]\d{1,4}|\d!)?$")
+
+NS_PER_DAY = 86_400 * 10**9
+
+
+@lru_cache(maxsize=256)
+def point_value(instrument: Any) -> float:
+    """Valeur du point d'un instrument en dollars par contrat, NaN si l'instrument est inconnu"""
+    match = ROOT_PATTERN.match(str(instrument).split(":")[-1].strip().upper())
+    return POINT_VALUES.get(match.group(1), np.nan) if match else np.nan
+
+
+def _numbers(df: pd.DataFrame, column: str) -> np.ndarray:
+    """Colonne en float64, NaN si elle est absente (mois exportés avant la migration)"""
+    if column not in df:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+
+
+def parse_exit_times(values: pd.Series) -> pd.Series:
+    """Heures de sortie en datetime64 UTC, NaT pour les trades ouverts"""
+    return pd.to_datetime(values, utc=True, format="ISO8601", errors="coerce")
+
+
+def realized_outcomes(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Résultat réalisé de tous les trades en une opération vectorisée.
+
+    Un trade est clôturé quand exit_price et exit_time sont renseignés. Pour les
+    trades ouverts, les résultats valent NaN. La colonne exit_time_dt, si
+    prepare_trades l'a ajoutée, évite de reparser les dates.
+
+    - pnl_points : (sortie - entrée) dans le sens du trade
+    - realized_r : pnl_points / |entrée - stop|, NaN si le risque est nul
+    - pnl_usd : pnl_points x valeur du point x quantité (1 contrat par défaut), NaN si l'instrument est inconnu
+
+    Args:
+        df: Trades (colonnes Supabase)
+
+    Returns:
+        Dict de tableaux alignés sur df : closed, exit_ns (horodatage UTC en ns), pnl_points, realized_r, pnl_usd
+    """
+    entry = _numbers(df, "entry_price")
+    stop = _numbers(df, "stop_loss")
+    exit_price = _numbers(df, "exit_price")
+    quantity = _numbers(df, "quantity")
+
+    if "exit_time_dt" in df or "exit_time" in df:
+        exit_time = df["exit_time_dt"] if "exit_time_dt" in df else parse_exit_times(df["exit_time"])
+        exit_ns = exit_time.dt.tz_convert(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        closed = exit_time.notna().to_numpy()
+    else:
+        exit_ns = np.zeros(len(df), dtype=np.int64)
+        closed = np.zeros(len(df), dtype=bool)
+    closed &= np.isfinite(exit_price) & np.isfinite(entry)
+
+    sign = np.where(df["direction"].to_numpy() == "SHORT", -1.0, 1.0) if "direction" in df else np.ones(len(df))
+    points = np.where(closed, (exit_price - entry) * sign, np.nan)
+    risk = np.abs(entry - stop)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        realized_r = np.where(risk > 0, points / risk, np.nan)
+
+    # Valeur du point calculée une fois par instrument distinct
+    if "instrument" in df:
+        codes, uniques = pd.factorize(df["instrument"])
+        values = np.append(np.array([point_value(instrument) for instrument in uniques], dtype=np.float64), np.nan)
+        values = values[codes]  # code -1 (instrument manquant) : le NaN ajouté en dernier
+    else:
+        values = np.full(len(df), np.nan)
+    pnl_usd = points * values * np.where(np.isfinite(quantity), quantity, 1.0)
+
+    return {"closed": closed, "exit_ns": exit_ns, "pnl_points": points, "realized_r": realized_r, "pnl_usd": pnl_usd}
+
+
+def trade_outcome(trade: Mapping[str, Any]) -> Optional[Tuple[int, float, float, float]]:
+    """
+    Résultat réalisé d'un seul trade, mêmes règles que realized_outcomes sans passer par pandas.
+
+    Returns:
+        (exit_ns, pnl_points, realized_r, pnl_usd), ou None si le trade n'est pas clôturé
+    """
+    def number(key: str) -> float:
+        value = trade.get(key)
+        try:
+            return float(value) if value is not None else np.nan
+        except (TypeError, ValueError):
+            return np.nan
+
+    entry, stop, exit_price, quantity = (number(key) for key in ("entry_price", "stop_loss", "exit_price", "quantity"))
+    if trade.get("exit_time") is None or not (np.isfinite(entry) and np.isfinite(exit_price)):
+        return None
+    moment = pd.Timestamp(trade["exit_time"])
+    if pd.isna(moment):
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.tz_convert("UTC").tz_localize(None)
+
+    points = (exit_price - entry) * (-1.0 if trade.get("direction") == "SHORT" else 1.0)
+    risk = abs(entry - stop)
+    realized_r = points / risk if risk > 0 else np.nan
+    pnl_usd = points * point_value(trade.get("instrument")) * (quantity if np.isfinite(quantity) else 1.0)
+    return moment.value, points, realized_r, pnl_usd
+
+
+def longest_run(flags: np.ndarray) -> int:
+    """Plus longue suite de True consécutifs (longueurs des plages entre les changements de valeur)"""
+    if not flags.any():
+        return 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], flags.astype(np.int8), [0]))))
+    return int((edges[1::2] - edges[::2]).max())
+
+
+class PnlEngine:
+    """
+    Performance réalisée des trades clôturés : equity, drawdown, espérance et séries.
+
+    rebuild() calcule tout l'historique sur des colonnes NumPy, dans l'ordre des
+    sorties (exit_time). close() ajoute un trade qui vient d'être clôturé en O(1) :
+    equity, plus haut, drawdown, sommes et séries sont prolongés depuis le dernier
+    trade au lieu de reparcourir l'historique.
+
+    sync() suit un TradeStore par ses deltas : seules les clôtures nouvelles sont
+    ajoutées ; si un trade déjà compté change de résultat, ou si une clôture arrive
+    avant la dernière, l'historique est recalculé par rebuild().
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """
+        Initialiser un moteur vide.
+
+        Args:
+            capacity: Nombre de trades clôturés alloués d'avance (doublé au besoin)
+        """
+        self._lock = threading.Lock()
+        self.version: Optional[int] = None
+        self.stats = {"rebuilds": 0, "incremental_closes": 0}
+        self._reset(capacity)
+
+    def _reset(self, capacity: int) -> None:
+        self._n = 0
+        self._ids = np.empty(capacity, dtype=object)
+        self._times = np.empty(capacity, dtype=np.int64)
+        self._points = np.empty(capacity, dtype=np.float64)
+        self._r = np.empty(capacity, dtype=np.float64)
+        self._usd = np.empty(capacity, dtype=np.float64)
+        self._equity = np.empty(capacity, dtype=np.float64)
+        self._drawdown = np.empty(capacity, dtype=np.float64)
+        # Ids du dernier rebuild (table de hachage pandas), puis ceux ajoutés par close()
+        self._index = pd.Index([], dtype=object)
+        self._recent: Dict[Any, int] = {}
+
+        self._peak = 0.0
+        self._max_drawdown = 0.0
+        self._wins = 0
+        self._losses = 0
+        self._r_sum = 0.0
+        self._r_count = 0
+        self._usd_count = 0
+        self._gross_win = 0.0
+        self._gross_loss = 0.0
+        # > 0 : gains consécutifs en cours, < 0 : pertes consécutives, 0 après un trade à l'équilibre
+        self._streak = 0
+        self._longest_win = 0
+        self._longest_loss = 0
+
+    def rebuild(self, df: pd.DataFrame) -> None:
+        """
+        Recalculer toutes les métriques à partir des trades, sur des colonnes entières.
+
+        Args:
+            df: Trades (colonnes Supabase), ouverts et clôturés
+        """
+        with self._lock:
+            self._rebuild(df)
+
+    def _rebuild(self, df: pd.DataFrame) -> None:
+        self.stats["rebuilds"] += 1
+        outcome = realized_outcomes(df) if not df.empty else None
+        closed = np.flatnonzero(outcome["closed"]) if outcome is not None else np.empty(0, dtype=np.int64)
+        n = len(closed)
+        self._reset(max(1024, 2 * n))
+        if n == 0:
+            return
+
+        order = closed[np.argsort(outcome["exit_ns"][closed], kind="stable")]
+        ids = df["id"].to_numpy()[order]
+        points = outcome["pnl_points"][order]
+        realized_r = outcome["realized_r"][order]
+        usd = outcome["pnl_usd"][order]
+
+        # Equity en dollars, partant de 0 ; un trade sans valeur de point compte pour 0 $
+        equity = np.cumsum(np.nan_to_num(usd))
+        peak = np.maximum.accumulate(np.maximum(equity, 0.0))
+        drawdown = equity - peak
+
+        self._n = n
+        self._ids[:n] = ids
+        self._times[:n] = outcome["exit_ns"][order]
+        self._points[:n] = points
+        self._r[:n] = realized_r
+        self._usd[:n] = usd
+        self._equity[:n] = equity
+        self._drawdown[:n] = drawdown
+        self._index = pd.Index(ids)
+        # Table de hachage construite ici plutôt qu'au premier close()
+        self._index.get_loc(ids[-1])
+
+        wins = points > 0
+        losses = points < 0
+        priced = np.isfinite(usd)
+        finite_r = np.isfinite(realized_r)
+        self._peak = float(peak[-1])
+        self._max_drawdown = float(drawdown.min())
+        self._wins = int(wins.sum())
+        self._losses = int(losses.sum())
+        self._r_sum = float(realized_r[finite_r].sum())
+        self._r_count = int(finite_r.sum())
+        self._usd_count = int(priced.sum())
+        self._gross_win = float(usd[wins & priced].sum())
+        self._gross_loss = float(-usd[losses & priced].sum())
+        self._longest_win = longest_run(wins)
+        self._longest_loss = longest_run(losses)
+
+        # Série en cours : trades depuis le dernier qui n'a pas le même signe que le dernier
+        current = wins if wins[-1] else losses if losses[-1] else None
+        if current is not None:
+            breaks = np.flatnonzero(~current)
+            length = n - 1 - breaks[-1] if breaks.size else n
+            self._streak = int(length) if wins[-1] else -int(length)
+
+    def close(self, trade: Mapping[str, Any]) -> bool:
+        """
+        Ajouter un trade qui vient d'être clôturé, sans recalculer l'historique.
+
+        Args:
+            trade: Ligne du trade (id, instrument, direction, entry_price, stop_loss, exit_price, exit_time, quantity)
+
+        Returns:
+            True si le trade a été ajouté ; False s'il n'est pas clôturé, s'il est déjà
+            compté ou si sa sortie précède la dernière clôture (rebuild() nécessaire)
+        """
+        outcome = trade_outcome(trade)
+        if outcome is None:
+            return False
+        with self._lock:
+            if self._position(trade.get("id")) >= 0:
+                return False
+            if self._n and outcome[0] < self._times[self._n - 1]:
+                return False
+            self._append(trade.get("id"), *outcome)
+            return True
+
+    def _position(self, trade_id: Any) -> int:
+        """Position du trade dans les tableaux, -1 s'il n'est pas compté"""
+        try:
+            return self._index.get_loc(trade_id)
+        except KeyError:
+            return self._recent.get(trade_id, -1)
+
+    def _append(self, trade_id: Any, exit_ns: int, points: float, realized_r: float, usd: float) -> None:
+        n = self._n
+        if n == len(self._times):
+            for name in ("_ids", "_times", "_points", "_r", "_usd", "_equity", "_drawdown"):
+                array = getattr(self, name)
+                grown = np.empty(2 * len(array), dtype=array.dtype)
+                grown[:n] = array[:n]
+                setattr(self, name, grown)
+
+        equity = (self._equity[n - 1] if n else 0.0) + (usd if np.isfinite(usd) else 0.0)
+        self._peak = max(self._peak, equity)
+        drawdown = equity - self._peak
+        self._max_drawdown = min(self._max_drawdown, drawdown)
+
+        self._ids[n] = trade_id
+        self._times[n] = exit_ns
+        self._points[n] = points
+        self._r[n] = realized_r
+        self._usd[n] = usd
+        self._equity[n] = equity
+        self._drawdown[n] = drawdown
+        self._recent[trade_id] = n
+        self._n = n + 1
+
+        if np.isfinite(realized_r):
+            self._r_sum += realized_r
+            self._r_count += 1
+        if np.isfinite(usd):
+            self._usd_count += 1
+        if points > 0:
+            self._wins += 1
+            self._gross_win += usd if np.isfinite(usd) else 0.0
+            self._streak = self._streak + 1 if self._streak > 0 else 1
+            self._longest_win = max(self._longest_win, self._streak)
+        elif points < 0:
+            self._losses += 1
+            self._gross_loss -= usd if np.isfinite(usd) else 0.0
+            self._streak = self._streak - 1 if self._streak < 0 else -1
+            self._longest_loss = max(self._longest_loss, -self._streak)
+        else:
+            self._streak = 0
+        self.stats["incremental_closes"] += 1
+
+    def _apply(self, delta: pd.DataFrame) -> bool:
+        """
+        Appliquer les lignes modifiées d'un refresh du TradeStore.
+
+        Returns:
+            False si l'historique doit être recalculé
+        """
+        if delta.empty or "id" not in delta:
+            return True
+        outcome = realized_outcomes(delta)
+        ids = delta["id"].to_numpy()
+        positions = self._index.get_indexer(ids)
+        if self._recent:
+            for i in np.flatnonzero(positions < 0):
+                positions[i] = self._recent.get(ids[i], -1)
+
+        # Trade déjà compté (notes, feedback IA...) : rien à faire si son résultat n'a pas changé
+        known = positions >= 0
+        if known.any():
+            at = positions[known]
+            unchanged = (
+                outcome["closed"][known]
+                & (outcome["exit_ns"][known] == self._times[at])
+                & np.isclose(outcome["pnl_points"][known], self._points[at], equal_nan=True)
+                & np.isclose(outcome["pnl_usd"][known], self._usd[at], equal_nan=True)
+                & np.isclose(outcome["realized_r"][known], self._r[at], equal_nan=True)
+            )
+            if not unchanged.all():
+                return False
+
+        new = np.flatnonzero(outcome["closed"] & ~known)
+        if new.size == 0:
+            return True
+        new = new[np.argsort(outcome["exit_ns"][new], kind="stable")]
+        if self._n and outcome["exit_ns"][new[0]] < self._times[self._n - 1]:
+            return False
+        for i in new:
+            self._append(ids[i], int(outcome["exit_ns"][i]), float(outcome["pnl_points"][i]),
+                         float(outcome["realized_r"][i]), float(outcome["pnl_usd"][i]))
+        return True
+
+    def sync(self, store) -> None:
+        """
+        Mettre le moteur à jour avec un TradeStore (voir trade_store.py).
+
+        Les deltas reçus depuis la dernière synchronisation sont appliqués un par
+        un ; sans deltas disponibles (premier appel, rechargement complet du store)
+        ou si un delta ne peut pas être appliqué, tout est recalculé. Appliquer deux
+        fois un même delta est sans effet : les trades déjà comptés sont ignorés.
+
+        Args:
+            store: TradeStore déjà rafraîchi
+        """
+        with self._lock:
+            version, changes = store.changes_since(self.version)
+            if changes is None or not all(self._apply(delta) for delta in changes):
+                self._rebuild(store.df)
+            self.version = version
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Statistiques des trades clôturés.
+
+        Le win rate compte les trades à P&L en points > 0 parmi tous les trades
+        clôturés (un trade à l'équilibre n'est ni gagnant ni perdant). Les montants
+        en dollars ignorent les instruments sans valeur de point connue.
+
+        Returns:
+            Dict avec closed_trades, wins, losses, win_rate, net_pnl_usd, expectancy_r,
+            expectancy_usd, profit_factor, max_drawdown_usd, longest_win_streak,
+            longest_loss_streak et current_streak (> 0 : gains, < 0 : pertes)
+        """
+        with self._lock:
+            n = self._n
+            net = float(self._equity[n - 1]) if n else 0.0
+            if self._gross_loss:
+                profit_factor = self._gross_win / self._gross_loss
+            else:
+                profit_factor = float("inf") if self._gross_win else float("nan")
+            return {
+                "closed_trades": n,
+                "wins": self._wins,
+                "losses": self._losses,
+                "win_rate": self._wins / n * 100 if n else 0,
+                "net_pnl_usd": net,
+                "expectancy_r": self._r_sum / self._r_count if self._r_count else float("nan"),
+                "expectancy_usd": net / self._usd_count if self._usd_count else float("nan"),
+                "profit_factor": profit_factor,
+                "max_drawdown_usd": self._max_drawdown,
+                "longest_win_streak": self._longest_win,
+                "longest_loss_streak": self._longest_loss,
+                "current_streak": self._streak,
+            }
+
+    def curve(self) -> pd.DataFrame:
+        """
+        Equity et drawdown par jour de clôture (UTC), pour les graphiques.
+
+        Returns:
+            DataFrame indexé par jour : equity en fin de journée, drawdown le plus bas de la journée
+        """
+        with self._lock:
+            n = self._n
+            if n == 0:
+                return pd.DataFrame({"equity": [], "drawdown": []}, index=pd.DatetimeIndex([], name="day"))
+            days = self._times[:n] // NS_PER_DAY
+            starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+            ends = np.append(starts[1:], n) - 1
+            return pd.DataFrame(
+                {"equity": self._equity[ends], "drawdown": np.minimum.reduceat(self._drawdown[:n], starts)},
+                index=pd.DatetimeIndex(pd.to_datetime(days[starts] * NS_PER_DAY), name="day"),
+            )
+
+    def trades(self) -> pd.DataFrame:
+        """Trades clôturés dans l'ordre des sorties, avec leur résultat et l'equity après chacun"""
+        with self._lock:
+            n = self._n
+            return pd.DataFrame({
+                "id": self._ids[:n].copy(),
+                "exit_time": pd.to_datetime(self._times[:n], utc=True),
+                "pnl_points": self._points[:n].copy(),
+                "realized_r": self._r[:n].copy(),
+                "pnl_usd": self._usd[:n].copy(),
+                "equity": self._equity[:n].copy(),
+                "drawdown": self._drawdown[:n].copy(),
+            })
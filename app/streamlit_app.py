@@ -1,14 +1,9 @@
 import os
+import sys
+import time
 import streamlit as st
-from supabase import create_client, Client
 from dotenv import load_dotenv
-import pandas as pd
-from datetime import datetime
-import uuid
-import sys
-import asyncio
-sys.path.append("server")
-from ai_feedback import generate_trade_feedback
+from datetime import date, datetime, timezone
 
 # Configuration de la page Streamlit (doit être le premier appel Streamlit)
 st.set_page_config(
@@ -17,70 +12,102 @@ st.set_page_config(
     layout="wide"
 )
 
+# Titre de l'application, envoyé au navigateur avant le chargement de pandas et des clients
+st.title("📈 TradeMind AI Journal")
+st.markdown("---")
+
+# Modules lourds importés après le premier rendu (mis en cache par Python après le premier run)
+import pandas as pd  # noqa: E402
+sys.path.append("server")
+from ai_feedback import generate_trade_feedback  # noqa: E402
+import clients  # noqa: E402
+from image_pipeline import thumbnail_url  # noqa: E402
+from trade_store import TradeStore  # noqa: E402
+from parquet_export import read_history  # noqa: E402
+from metrics import prepare_trades, summary_from_daily_stats  # noqa: E402
+from pnl import PnlEngine, parse_exit_times  # noqa: E402
+from trade_query import fetch_trade_page  # noqa: E402
+
 # Charger les variables d'environnement
 load_dotenv()
 
-# Configuration de Supabase
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
+@st.cache_resource
+def get_supabase_client():
+    """SupabaseClient partagé par tous les reruns et sessions (pool de connexions, TLS établi une fois)"""
+    return clients.get_supabase_client()
 
-# Titre de l'application
-st.title("📈 TradeMind AI Journal")
-st.markdown("---")
+# Client supabase-py sous-jacent, pour les requêtes directes sur les tables
+supabase = get_supabase_client().client
 
 def upload_screenshot(file):
-    """Upload un screenshot vers Supabase Storage"""
+    """Traiter (WebP + miniature) et uploader un screenshot vers Supabase Storage"""
     try:
-        # Générer un nom de fichier unique
-        file_extension = file.name.split(".")[-1]
-        file_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4()}.{file_extension}"
-        
-        # Lire le contenu du fichier
-        file_bytes = file.read()
-        
-        # Upload vers le bucket 'screenshots'
-        supabase.storage.from_("screenshots").upload(
-            path=file_name,
-            file=file_bytes,
-            file_options={"content-type": file.type}
-        )
-        
-        # Générer l'URL publique
-        file_url = supabase.storage.from_("screenshots").get_public_url(file_name)
-        return file_url
+        # Nom dérivé du contenu : un même screenshot n'est stocké qu'une fois
+        return get_supabase_client().store_screenshot(file.getvalue())
     except Exception as e:
         st.error(f"Erreur lors de l'upload du screenshot: {str(e)}")
         return None
 
-def calculate_rr(row):
-    """Calculer le ratio risk/reward pour un trade"""
-    try:
-        if row["direction"] == "LONG":
-            risk = abs(row["entry_price"] - row["stop_loss"])
-            reward = abs(row["take_profit"] - row["entry_price"])
-        else:  # SHORT
-            risk = abs(row["entry_price"] - row["stop_loss"])
-            reward = abs(row["entry_price"] - row["take_profit"])
-        
-        return reward / risk if risk != 0 else 0
-    except:
-        return 0
+# Colonnes des trades clôturés lues par le moteur de P&L (notes, feedback et images ne sont pas chargés)
+PNL_COLUMNS = (
+    "id", "created_at", "updated_at", "instrument", "direction", "entry_price", "stop_loss",
+    "exit_price", "exit_time", "quantity",
+)
+
+def prepare_outcomes(df):
+    """Parser les dates de sortie une seule fois par ligne reçue"""
+    if not df.empty:
+        df["exit_time_dt"] = parse_exit_times(df["exit_time"])
+    return df
+
+@st.cache_resource
+def get_closed_trade_store():
+    """Trades clôturés, réduits aux colonnes du P&L, partagés entre les reruns (synchronisation par delta)"""
+    # DASHBOARD_HISTORY_MONTHS > 0 : seuls les derniers mois sont chargés (les autres partitions ne sont pas lues)
+    months = int(os.getenv("DASHBOARD_HISTORY_MONTHS", "0"))
+    since = (pd.Timestamp.now(tz="UTC").normalize() - pd.DateOffset(months=months)) if months > 0 else None
+
+    def history():
+        # Historique lu dans l'export Parquet local (python server/parquet_export.py), s'il existe
+        rows, cutoff = read_history("trades", columns=PNL_COLUMNS, since=since)
+        if not rows.empty:
+            rows = rows[rows["exit_time"].notna()]
+        return rows, cutoff
+
+    return TradeStore(
+        supabase,
+        enrich=prepare_outcomes,
+        history=history,
+        since=since.isoformat() if since is not None else None,
+        columns=", ".join(PNL_COLUMNS),
+        where=lambda query: query.not_.is_("exit_time", "null")
+    )
 
-def load_trades():
-    """Charger les trades depuis Supabase"""
+@st.cache_resource
+def get_pnl_engine():
+    """Moteur de P&L partagé entre les reruns, tenu à jour par les deltas du store"""
+    return PnlEngine()
+
+def load_performance():
+    """Performance réalisée des trades clôturés (seules les nouvelles clôtures sont ajoutées)"""
+    store = get_closed_trade_store()
+    store.refresh()
+    engine = get_pnl_engine()
+    engine.sync(store)
+    return engine
+
+def load_daily_stats():
+    """Agrégats de trade_daily_stats (quelques centaines de lignes), None si la table est absente"""
     try:
-        response = supabase.table("trades").select("*").order("created_at", desc=True).execute()
-        if response.data:
-            df = pd.DataFrame(response.data)
-            # Calculer le R:R pour chaque trade
-            df["risk_reward"] = df.apply(calculate_rr, axis=1)
-            return df
-        return pd.DataFrame()
+        return get_supabase_client().fetch_daily_stats()
     except Exception as e:
-        st.error(f"Erreur lors du chargement des trades: {str(e)}")
-        return pd.DataFrame()
+        st.error(f"Statistiques indisponibles (migration trade_daily_stats non appliquée ?) : {str(e)}")
+        return None
+
+def notify_saved(message):
+    """Relancer le script après une sauvegarde pour réafficher le journal, en gardant le message"""
+    st.session_state.sidebar_notice = message
+    st.rerun()
 
 def update_trade_screenshot(trade_id, screenshot_url):
     """Mettre à jour l'URL du screenshot pour un trade"""
@@ -100,22 +127,52 @@ def update_trade_notes(trade_id, notes):
         st.error(f"Erreur lors de la mise à jour des notes: {str(e)}")
         return False
 
-def get_ai_feedback(trade_data):
-    """Obtenir le feedback IA pour un trade"""
+def update_trade_exit(trade_id, exit_price, exit_time, quantity):
+    """Enregistrer la sortie réelle d'un trade (prix, heure UTC, nombre de contrats)"""
+    values = {"exit_price": exit_price, "exit_time": exit_time, "quantity": quantity}
     try:
-        feedback = generate_trade_feedback(trade_data)
-        return feedback
+        supabase.table("trades").update(values).eq("id", trade_id).execute()
+        # La clôture entre dans la performance réalisée dès le rerun suivant
+        get_closed_trade_store().refresh(force=True)
+        return True
     except Exception as e:
-        st.error(f"Erreur lors de la génération du feedback IA: {str(e)}")
-        return None
+        st.error(f"Erreur lors de l'enregistrement de la sortie: {str(e)}")
+        return False
 
-def calculate_win_rate(df):
-    """Calculer le win rate basé sur le R:R (temporaire en attendant les résultats réels)"""
-    if df.empty:
-        return 0
-    # Pour l'instant, on considère un trade gagnant si R:R >= 1
-    winning_trades = df[df["risk_reward"] >= 1]
-    return len(winning_trades) / len(df) * 100
+def format_outcome(trade):
+    """Résultat réalisé d'un trade clôturé (« +1.50R, +6.00 pts, +600 $ »), ou None s'il est ouvert"""
+    if pd.isna(trade.get("pnl_points")):
+        return None
+    text = f"{trade['realized_r']:+.2f}R, " if pd.notna(trade["realized_r"]) else ""
+    text += f"{trade['pnl_points']:+.2f} pts"
+    if pd.notna(trade["pnl_usd"]):
+        text += f", {trade['pnl_usd']:+,.0f} $"
+    return text
+
+def stream_ai_feedback(trade_data, bypass_cache=False, on_first_token=None):
+    """
+    Générer le feedback IA d'un trade morceau par morceau (réutilise le cache sauf si bypass_cache)
+
+    on_first_token est appelé avec le délai en ms avant le premier morceau reçu.
+    """
+    started = time.perf_counter()
+    first = True
+    for text in generate_trade_feedback(trade_data, bypass_cache=bypass_cache, stream=True):
+        if first and on_first_token:
+            on_first_token((time.perf_counter() - started) * 1000)
+        first = False
+        yield text
+
+def format_structure(trade):
+    """Structure BOS/CHoCH précédant le trade (« BOS ↑ 4500.25, 12 min avant »), ou None"""
+    if not isinstance(trade.get("structure_type"), str):
+        return None
+    arrow = "↑" if trade["structure_direction"] == "BULLISH" else "↓"
+    text = f"{trade['structure_type']} {arrow} {trade['structure_price']}"
+    if pd.notna(trade.get("structure_at")) and pd.notna(trade.get("created_at")):
+        minutes = (pd.Timestamp(trade["created_at"]) - pd.Timestamp(trade["structure_at"])).total_seconds() / 60
+        text += f", {minutes:.0f} min avant"
+    return text
 
 def get_trend_icon(current, target):
     """Retourner l'icône de tendance appropriée"""
@@ -131,130 +188,32 @@ def get_rr_color(rr):
         return "orange"
     return "red"
 
-# Section Sélection du Trade
-st.sidebar.header("🎯 Sélection du Trade")
-
-# Charger les trades pour la sélection
-trades_df = load_trades()
-if not trades_df.empty:
-    # Créer une liste de trades pour la sélection
-    trade_options = trades_df.apply(
-        lambda x: pd.to_datetime(x['created_at']).strftime('%d/%m/%Y %H:%M'),
-        axis=1
-    ).tolist()
-    trade_ids = trades_df['id'].tolist()
-    
-    # Sélection du trade
-    selected_trade_index = st.sidebar.selectbox(
-        "Sélectionner une date",
-        range(len(trade_options)),
-        format_func=lambda x: trade_options[x]
-    )
-    selected_trade_id = trade_ids[selected_trade_index]
-    
-    # Afficher les détails du trade sélectionné
-    selected_trade = trades_df.loc[trades_df['id'] == selected_trade_id].iloc[0]
-    st.sidebar.markdown(f"""
-    **Trade sélectionné :**
-    - Instrument : {selected_trade['instrument']}
-    - Direction : {selected_trade['direction']}
-    - Prix d'entrée : {selected_trade['entry_price']}
-    """)
-    
-    # Section Screenshot
-    st.sidebar.markdown("---")
-    st.sidebar.header("📸 Screenshot du Trade")
-    uploaded_file = st.sidebar.file_uploader("Ajouter une capture d'écran", type=["png", "jpg", "jpeg"])
-
-    if uploaded_file:
-        # Afficher l'aperçu
-        st.sidebar.image(uploaded_file, caption="Aperçu", use_column_width=True)
-        
-        # Bouton pour sauvegarder
-        if st.sidebar.button("💾 Sauvegarder le screenshot"):
-            with st.spinner("Upload en cours..."):
-                screenshot_url = upload_screenshot(uploaded_file)
-                if screenshot_url:
-                    # Mettre à jour le trade avec l'URL du screenshot
-                    if update_trade_screenshot(selected_trade_id, screenshot_url):
-                        st.sidebar.success("Screenshot sauvegardé !")
-                        # Recharger les trades pour afficher les changements
-                        trades_df = load_trades()
-                    else:
-                        st.sidebar.error("Erreur lors de la sauvegarde")
-                else:
-                    st.sidebar.error("Erreur lors de l'upload")
-    
-    # Section Notes
-    st.sidebar.markdown("---")
-    st.sidebar.header("📝 Notes du Trade")
-    current_notes = trades_df.loc[trades_df['id'] == selected_trade_id, 'notes'].iloc[0]
-    new_notes = st.sidebar.text_area(
-        "Ajouter/modifier les notes",
-        value=current_notes if pd.notna(current_notes) else "",
-        height=150,
-        placeholder="Écrivez vos notes ici..."
-    )
-    
-    if st.sidebar.button("💾 Sauvegarder les notes"):
-        if update_trade_notes(selected_trade_id, new_notes):
-            st.sidebar.success("Notes sauvegardées !")
-            trades_df = load_trades()
-        else:
-            st.sidebar.error("Erreur lors de la sauvegarde")
-    
-    # Section Analyse IA
-    st.sidebar.markdown("---")
-    st.sidebar.header("🤖 Analyse IA")
-    
-    def handle_analyze_button():
-        progress_placeholder = st.sidebar.empty()
-        progress_placeholder.info("Analyse en cours...")
-        trade_data = {
-            "instrument": selected_trade["instrument"],
-            "direction": selected_trade["direction"],
-            "entry_price": selected_trade["entry_price"],
-            "stop_loss": selected_trade["stop_loss"],
-            "take_profit": selected_trade["take_profit"],
-            "risk_reward": selected_trade["risk_reward"],
-            "notes": selected_trade["notes"] if pd.notna(selected_trade["notes"]) else ""
-        }
-        try:
-            feedback = get_ai_feedback(trade_data)
-            progress_placeholder.empty()
-            if feedback:
-                # Mettre à jour le trade avec le feedback
-                try:
-                    supabase.table("trades").update({"ai_feedback": feedback}).eq("id", selected_trade_id).execute()
-                    trades_df = load_trades()
-                    st.sidebar.success("✅ Analyse IA générée avec succès !")
-                except Exception as e:
-                    st.sidebar.error(f"Erreur lors de la sauvegarde du feedback: {str(e)}")
-        except Exception as e:
-            progress_placeholder.error(f"Erreur lors de l'analyse: {str(e)}")
-
-    if st.sidebar.button("📊 Analyser ce trade"):
-        handle_analyze_button()
-
-else:
-    st.sidebar.info("Aucun trade disponible pour le moment.")
-
-# Charger les trades
-trades_df = load_trades()
+# Statistiques tenues à jour par les triggers de trade_daily_stats, sans charger le journal
+daily_stats = load_daily_stats()
+stats = summary_from_daily_stats(daily_stats or [])
+filtered_df = pd.DataFrame()
 
-if not trades_df.empty:
+if daily_stats is None or stats["total_trades"]:
     # Afficher les statistiques générales
     st.subheader("📊 Statistiques Générales")
     col1, col2, col3, col4 = st.columns(4)
-    
-    # Calcul des statistiques
-    total_trades = len(trades_df)
-    longs = trades_df[trades_df["direction"] == "LONG"]
-    shorts = trades_df[trades_df["direction"] == "SHORT"]
-    long_ratio = len(longs) / total_trades * 100 if total_trades > 0 else 0
-    avg_rr = trades_df["risk_reward"].mean()
-    trades_today = len(trades_df[pd.to_datetime(trades_df["created_at"]).dt.date == pd.Timestamp.now().date()])
-    win_rate = calculate_win_rate(trades_df)
+
+    total_trades = stats["total_trades"]
+    long_ratio = stats["long_ratio"]
+    avg_rr = stats["avg_rr"]
+    trades_today = stats["trades_today"]
+    win_rate = stats["win_rate"]
+    win_rate_basis = "Basé sur R:R ≥ 1"
+    # Win rate réalisé dès qu'au moins un trade est clôturé (R:R ≥ 1 en repli)
+    try:
+        performance = load_performance()
+        realized = performance.summary()
+    except Exception as e:
+        st.error(f"Erreur lors du calcul de la performance: {str(e)}")
+        performance, realized = None, {"closed_trades": 0}
+    if realized["closed_trades"]:
+        win_rate = realized["win_rate"]
+        win_rate_basis = f"Sur {realized['closed_trades']} trades clôturés"
     trend_icon = get_trend_icon(avg_rr, 2.0)
     
     # Style CSS pour les statistiques
@@ -315,28 +274,66 @@ if not trades_df.empty:
         <div class="stat-box">
             <div class="stat-title">🎯 Win Rate</div>
             <div class="stat-value">{win_rate:.1f}%</div>
-            <div class="stat-delta">Basé sur R:R ≥ 1</div>
+            <div class="stat-delta">{win_rate_basis}</div>
         </div>
         """, unsafe_allow_html=True)
 
+    # Performance réalisée : equity et drawdown des trades clôturés, dans l'ordre des sorties
+    if realized["closed_trades"]:
+        st.subheader("💰 Performance Réalisée")
+        col1, col2, col3, col4, col5 = st.columns(5)
+        with col1:
+            st.metric("P&L net", f"{realized['net_pnl_usd']:+,.0f} $")
+        with col2:
+            st.metric(
+                "Espérance",
+                f"{realized['expectancy_r']:+.2f}R" if pd.notna(realized["expectancy_r"]) else "—",
+                f"{realized['expectancy_usd']:+,.0f} $ / trade" if pd.notna(realized["expectancy_usd"]) else None
+            )
+        with col3:
+            st.metric("Drawdown max", f"{realized['max_drawdown_usd']:,.0f} $")
+        with col4:
+            profit_factor = realized["profit_factor"]
+            st.metric("Profit factor", "∞" if profit_factor == float("inf") else f"{profit_factor:.2f}" if pd.notna(profit_factor) else "—")
+        with col5:
+            streak = realized["current_streak"]
+            st.metric(
+                "Série en cours",
+                f"{abs(streak)} {'gain' if streak > 0 else 'perte' if streak < 0 else 'trade'}{'s' if abs(streak) > 1 else ''}",
+                f"Records : {realized['longest_win_streak']} gains, {realized['longest_loss_streak']} pertes",
+                delta_color="off"
+            )
+
+        curve = performance.curve()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Courbe d'equity ($)**")
+            st.line_chart(curve["equity"])
+        with col2:
+            st.markdown("**Drawdown ($)**")
+            st.area_chart(curve["drawdown"])
+
+        # Les deltas ne voient ni les suppressions ni les sorties effacées : rechargement complet à la demande
+        if st.button("🔄 Recharger la performance", help="Recompter les trades clôturés depuis Supabase"):
+            get_closed_trade_store().invalidate()
+            st.rerun()
+
     # Filtres
     st.subheader("🔍 Filtres")
-    col1, col2, col3, col4, col5 = st.columns(5)
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
+
+    # Période couverte et instruments tradés, lus dans les agrégats (vides si la table est absente)
+    active_groups = [row for row in daily_stats or [] if int(row["trade_count"])]
+    days = sorted(str(row["day"])[:10] for row in active_groups)
+    journal_period = (date.fromisoformat(days[0]), date.fromisoformat(days[-1])) if days else ()
 
     with col1:
         # Filtre par date
-        date_range = st.date_input(
-            "Période",
-            value=(
-                pd.to_datetime(trades_df["created_at"]).min().date(),
-                pd.to_datetime(trades_df["created_at"]).max().date()
-            ) if not trades_df.empty else (datetime.now().date(), datetime.now().date()),
-            key="date_filter"
-        )
+        date_range = st.date_input("Période", value=journal_period, key="date_filter")
 
     with col2:
         # Filtre par instrument
-        instruments = ["Tous"] + sorted(trades_df["instrument"].unique().tolist())
+        instruments = ["Tous"] + sorted({row["instrument"] for row in active_groups if row["instrument"]})
         selected_instrument = st.selectbox("Instrument", instruments)
 
     with col3:
@@ -350,49 +347,58 @@ if not trades_df.empty:
         selected_performance = st.selectbox("Performance", performances)
 
     with col5:
+        # Filtre par structure précédente (BOS/CHoCH dans la fenêtre STRUCTURE_LOOKBACK_MINUTES)
+        structures = ["Toutes", "BOS", "CHoCH", "Sans structure"]
+        selected_structure = st.selectbox("Structure", structures)
+
+    with col6:
         # Recherche par mots-clés
         search_query = st.text_input("Rechercher dans les notes", placeholder="Mots-clés...")
 
     # Bouton pour réinitialiser les filtres
     if st.button("🔄 Réinitialiser les filtres"):
-        st.session_state.date_filter = (
-            pd.to_datetime(trades_df["created_at"]).min().date(),
-            pd.to_datetime(trades_df["created_at"]).max().date()
-        )
+        st.session_state.date_filter = journal_period
         selected_instrument = "Tous"
         selected_direction = "Tous"
         selected_performance = "Tous"
+        selected_structure = "Toutes"
         search_query = ""
 
-    # Appliquer les filtres
-    filtered_df = trades_df.copy()
-
-    # Filtre par date
-    filtered_df = filtered_df[
-        (pd.to_datetime(filtered_df["created_at"]).dt.date >= date_range[0]) &
-        (pd.to_datetime(filtered_df["created_at"]).dt.date <= date_range[1])
-    ]
-
-    # Filtre par instrument
-    if selected_instrument != "Tous":
-        filtered_df = filtered_df[filtered_df["instrument"] == selected_instrument]
+    # Filtres appliqués côté serveur (prédicats Supabase), une page à la fois
+    filters = {
+        "date_range": date_range if len(date_range) == 2 else None,
+        "instrument": selected_instrument if selected_instrument != "Tous" else None,
+        "direction": selected_direction if selected_direction != "Tous" else None,
+        "performance": {
+            "Gagnants (R:R ≥ 1)": "winners",
+            "Perdants (R:R < 1)": "losers"
+        }.get(selected_performance),
+        "structure": {"BOS": "BOS", "CHoCH": "CHoCH", "Sans structure": "none"}.get(selected_structure),
+        "search": search_query
+    }
 
-    # Filtre par direction
-    if selected_direction != "Tous":
-        filtered_df = filtered_df[filtered_df["direction"] == selected_direction]
+    # Revenir à la première page quand les filtres changent
+    filters_key = repr(filters)
+    if st.session_state.get("journal_filters") != filters_key:
+        st.session_state.journal_filters = filters_key
+        st.session_state.journal_cursors = [None]
 
-    # Filtre par performance
-    if selected_performance == "Gagnants (R:R ≥ 1)":
-        filtered_df = filtered_df[filtered_df["risk_reward"] >= 1]
-    elif selected_performance == "Perdants (R:R < 1)":
-        filtered_df = filtered_df[filtered_df["risk_reward"] < 1]
+    # La recherche est un filtre de la requête du journal (fts sur search_vector, voir apply_filters)
+    if search_query.strip() and get_supabase_client().search_backend == "local":
+        # Base locale sans colonne search_vector : ids trouvés par l'index en mémoire
+        filters["search"] = None
+        try:
+            filters["ids"] = [match["id"] for match in get_supabase_client().search_trades(search_query)]
+        except Exception as e:
+            st.error(f"Erreur lors de la recherche: {str(e)}")
+            filters["ids"] = []
 
-    # Filtre par mots-clés
-    if search_query:
-        filtered_df = filtered_df[
-            filtered_df["notes"].fillna("").str.contains(search_query, case=False) |
-            filtered_df["ai_feedback"].fillna("").str.contains(search_query, case=False)
-        ]
+    try:
+        page_rows, has_next_page = fetch_trade_page(supabase, filters, st.session_state.journal_cursors[-1])
+    except Exception as e:
+        st.error(f"Erreur lors du chargement du journal: {str(e)}")
+        page_rows, has_next_page = [], False
+    filtered_df = prepare_trades(pd.DataFrame(page_rows))
 
     # Afficher les trades filtrés
     st.subheader("📝 Journal de Trading")
@@ -408,10 +414,16 @@ if not trades_df.empty:
                 badges.append("🤖")
             if trade["risk_reward"] >= 1:
                 badges.append("✨")
+            outcome = format_outcome(trade)
+            if outcome:
+                badges.append("✅" if trade["pnl_points"] > 0 else "❌" if trade["pnl_points"] < 0 else "➖")
+            structure = format_structure(trade)
+            if structure:
+                badges.append(f"🧭 {trade['structure_type']}")
             
             # Créer le titre de l'expandeur avec les badges
             expander_title = (
-                f"🔸 {pd.to_datetime(trade['created_at']).strftime('%d/%m/%Y %H:%M')} - "
+                f"🔸 {trade['label']} - "
                 f"{trade['instrument']} ({trade['direction']}) - "
                 f"R:R: :{rr_color}[{trade['risk_reward']:.2f}] "
                 f"{' '.join(badges)}"
@@ -429,6 +441,8 @@ if not trades_df.empty:
                     - **Stop Loss:** {trade['stop_loss']}
                     - **Take Profit:** {trade['take_profit']}
                     - **Ratio R:R:** :{rr_color}[{trade['risk_reward']:.2f}]
+                    - **Structure précédente:** {structure or "aucune"}
+                    - **Résultat:** {outcome or "trade ouvert"}
                     """)
                     
                     if pd.notna(trade['notes']) and trade['notes'].strip():
@@ -442,9 +456,185 @@ if not trades_df.empty:
                 with col2:
                     if pd.notna(trade['screenshot_url']) and trade['screenshot_url'].strip():
                         st.markdown("### 📸 Screenshot")
-                        st.image(trade['screenshot_url'], use_column_width=True)
+                        # Miniature dans le journal, image complète seulement à la demande
+                        thumb = thumbnail_url(trade['screenshot_url'])
+                        if thumb:
+                            st.image(thumb, use_column_width=True)
+                        if st.toggle("Image complète", key=f"full_screenshot_{trade['id']}"):
+                            st.image(trade['screenshot_url'], use_column_width=True)
     else:
         st.info("Aucun trade ne correspond aux filtres sélectionnés.")
 
+    # Pagination
+    def go_to_next_page():
+        last = page_rows[-1]
+        st.session_state.journal_cursors.append((last["created_at"], last["id"]))
+
+    def go_to_previous_page():
+        st.session_state.journal_cursors.pop()
+
+    page_number = len(st.session_state.journal_cursors)
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("⬅️ Précédent", on_click=go_to_previous_page, disabled=page_number == 1)
+    with col_page:
+        st.markdown(f"<div style='text-align: center'>Page {page_number}</div>", unsafe_allow_html=True)
+    with col_next:
+        st.button("Suivant ➡️", on_click=go_to_next_page, disabled=not has_next_page)
+
+else:
+    st.info("Aucun trade enregistré pour le moment.") 
+
+# Section Sélection du Trade (trades de la page affichée du journal)
+st.sidebar.header("🎯 Sélection du Trade")
+if "sidebar_notice" in st.session_state:
+    st.sidebar.success(st.session_state.pop("sidebar_notice"))
+
+if not filtered_df.empty:
+    # Créer une liste de trades pour la sélection
+    trade_options = filtered_df["label"].tolist()
+    trade_ids = filtered_df['id'].tolist()
+    
+    # Sélection du trade
+    selected_trade_index = st.sidebar.selectbox(
+        "Sélectionner une date",
+        range(len(trade_options)),
+        format_func=lambda x: trade_options[x]
+    )
+    selected_trade_id = trade_ids[selected_trade_index]
+    
+    # Afficher les détails du trade sélectionné
+    selected_trade = filtered_df.loc[filtered_df['id'] == selected_trade_id].iloc[0]
+    st.sidebar.markdown(f"""
+    **Trade sélectionné :**
+    - Instrument : {selected_trade['instrument']}
+    - Direction : {selected_trade['direction']}
+    - Prix d'entrée : {selected_trade['entry_price']}
+    - Structure précédente : {format_structure(selected_trade) or "aucune"}
+    """)
+    
+    # Section Screenshot
+    st.sidebar.markdown("---")
+    st.sidebar.header("📸 Screenshot du Trade")
+    uploaded_file = st.sidebar.file_uploader("Ajouter une capture d'écran", type=["png", "jpg", "jpeg"])
+
+    if uploaded_file:
+        # Afficher l'aperçu
+        st.sidebar.image(uploaded_file, caption="Aperçu", use_column_width=True)
+        
+        # Bouton pour sauvegarder
+        if st.sidebar.button("💾 Sauvegarder le screenshot"):
+            with st.spinner("Upload en cours..."):
+                screenshot_url = upload_screenshot(uploaded_file)
+                if screenshot_url:
+                    # Mettre à jour le trade avec l'URL du screenshot
+                    if update_trade_screenshot(selected_trade_id, screenshot_url):
+                        notify_saved("Screenshot sauvegardé !")
+                    else:
+                        st.sidebar.error("Erreur lors de la sauvegarde")
+                else:
+                    st.sidebar.error("Erreur lors de l'upload")
+    
+    # Section Notes
+    st.sidebar.markdown("---")
+    st.sidebar.header("📝 Notes du Trade")
+    current_notes = selected_trade['notes']
+    new_notes = st.sidebar.text_area(
+        "Ajouter/modifier les notes",
+        value=current_notes if pd.notna(current_notes) else "",
+        height=150,
+        placeholder="Écrivez vos notes ici..."
+    )
+    
+    if st.sidebar.button("💾 Sauvegarder les notes"):
+        if update_trade_notes(selected_trade_id, new_notes):
+            notify_saved("Notes sauvegardées !")
+        else:
+            st.sidebar.error("Erreur lors de la sauvegarde")
+
+    # Section Clôture
+    st.sidebar.markdown("---")
+    st.sidebar.header("🏁 Clôture du Trade")
+    outcome = format_outcome(selected_trade)
+    if outcome:
+        st.sidebar.markdown(f"**Résultat :** {outcome}")
+    closed_at = (
+        pd.Timestamp(selected_trade["exit_time"]).tz_convert("UTC")
+        if pd.notna(selected_trade.get("exit_time")) else pd.Timestamp.now(tz="UTC")
+    )
+    exit_price = st.sidebar.number_input(
+        "Prix de sortie",
+        value=float(selected_trade["exit_price"] if pd.notna(selected_trade.get("exit_price")) else selected_trade["entry_price"]),
+        step=0.25,
+        format="%.2f"
+    )
+    exit_day = st.sidebar.date_input("Date de sortie (UTC)", value=closed_at.date())
+    exit_clock = st.sidebar.time_input("Heure de sortie (UTC)", value=closed_at.time().replace(microsecond=0))
+    quantity = st.sidebar.number_input(
+        "Contrats",
+        min_value=1,
+        value=int(selected_trade["quantity"]) if pd.notna(selected_trade.get("quantity")) else 1,
+        step=1
+    )
+
+    if st.sidebar.button("💾 Enregistrer la sortie"):
+        exit_time = datetime.combine(exit_day, exit_clock, tzinfo=timezone.utc).isoformat()
+        if update_trade_exit(selected_trade_id, exit_price, exit_time, quantity):
+            notify_saved("Sortie enregistrée !")
+        else:
+            st.sidebar.error("Erreur lors de la sauvegarde")
+    
+    # Section Analyse IA
+    st.sidebar.markdown("---")
+    st.sidebar.header("🤖 Analyse IA")
+    
+    def handle_analyze_button():
+        progress_placeholder = st.sidebar.empty()
+        progress_placeholder.info("Analyse en cours...")
+        trade_data = {
+            "instrument": selected_trade["instrument"],
+            "direction": selected_trade["direction"],
+            "entry_price": selected_trade["entry_price"],
+            "stop_loss": selected_trade["stop_loss"],
+            "take_profit": selected_trade["take_profit"],
+            "risk_reward": selected_trade["risk_reward"],
+            "notes": selected_trade["notes"] if pd.notna(selected_trade["notes"]) else ""
+        }
+        # Contexte de marché : structure BOS/CHoCH précédant le trade (structure_context.py)
+        if isinstance(selected_trade.get("structure_type"), str):
+            for column in ("structure_type", "structure_direction", "structure_price", "structure_at"):
+                trade_data[column] = selected_trade[column]
+        first_token = {}
+
+        def on_first_token(elapsed_ms):
+            # Le texte remplace le message d'attente dès le premier token
+            first_token["ms"] = elapsed_ms
+            progress_placeholder.empty()
+
+        try:
+            with st.sidebar:
+                feedback = st.write_stream(
+                    stream_ai_feedback(trade_data, bypass_cache=force_new_analysis, on_first_token=on_first_token)
+                )
+            progress_placeholder.empty()
+            if "ms" in first_token:
+                st.sidebar.caption(f"Premier token après {first_token['ms']:.0f} ms")
+            if feedback:
+                # Mettre à jour le trade avec le feedback
+                try:
+                    supabase.table("trades").update({"ai_feedback": feedback}).eq("id", selected_trade_id).execute()
+                    st.sidebar.success("✅ Analyse IA générée avec succès !")
+                except Exception as e:
+                    st.sidebar.error(f"Erreur lors de la sauvegarde du feedback: {str(e)}")
+        except Exception as e:
+            progress_placeholder.error(f"Erreur lors de l'analyse: {str(e)}")
+
+    force_new_analysis = st.sidebar.checkbox(
+        "Forcer une nouvelle analyse",
+        help="Ignorer le cache et rappeler l'API OpenAI"
+    )
+    if st.sidebar.button("📊 Analyser ce trade"):
+        handle_analyze_button()
+
 else:
-    st.info("Aucun trade enregistré pour le moment.") 
\ No newline at end of file
+    st.sidebar.info("Aucun trade sur la page affichée du journal.")
@@ -0,0 +1,112 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from supabase_client import or_groups_filter, order_by
+from text_search import prefix_tsquery
+
+# Nombre de trades affichés par page du journal
+PAGE_SIZE = 20
+
+JOURNAL_COLUMNS = (
+    "id, created_at, instrument, direction, entry_price, stop_loss, take_profit, risk_reward, computed_rr, "
+    "notes, ai_feedback, screenshot_url, structure_type, structure_direction, structure_price, structure_at, "
+    "exit_price, exit_time, quantity"
+)
+
+
+def _quote(value: str) -> str:
+    """Mettre une valeur entre guillemets pour un filtre PostgREST or=(...)"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _day_start(day: date) -> str:
+    """Début du jour en UTC, au format ISO"""
+    return datetime.combine(day, time.min, tzinfo=timezone.utc).isoformat()
+
+
+def apply_filters(query, filters: Dict[str, Any], or_groups: Optional[List[str]] = None):
+    """
+    Traduire les filtres du dashboard en prédicats PostgREST.
+
+    Args:
+        query: Requête postgrest (table trades)
+        filters: Dict avec date_range, instrument, direction, performance, structure
+            ("BOS", "CHoCH" ou "none" pour les trades sans structure précédente)
+            search (mots-clés, préfixes cherchés dans search_vector) et ids (ids trouvés
+            par l'index local de SupabaseClient.search_trades, SEARCH_BACKEND=local)
+        or_groups: Groupes de conditions OR supplémentaires (ex. curseur de pagination)
+
+    Returns:
+        La requête filtrée
+    """
+    or_groups = list(or_groups or [])
+
+    date_range = filters.get("date_range")
+    if date_range and len(date_range) == 2:
+        query = query.gte("created_at", _day_start(date_range[0]))
+        query = query.lt("created_at", _day_start(date_range[1] + timedelta(days=1)))
+
+    if filters.get("instrument"):
+        query = query.eq("instrument", filters["instrument"])
+
+    if filters.get("direction"):
+        query = query.eq("direction", filters["direction"])
+
+    # computed_rr est une colonne générée (même formule que metrics.compute_risk_reward)
+    if filters.get("performance") == "winners":
+        query = query.gte("computed_rr", 1)
+    elif filters.get("performance") == "losers":
+        query = query.lt("computed_rr", 1)
+
+    # Étiquette posée par structure_context.py (structure BOS/CHoCH précédant le trade)
+    if filters.get("structure") == "none":
+        query = query.is_("structure_type", "null")
+    elif filters.get("structure"):
+        query = query.eq("structure_type", filters["structure"])
+
+    # Recherche plein texte dans la requête du journal (index GIN sur search_vector), sans limite de résultats
+    tsquery = prefix_tsquery(filters.get("search"))
+    if tsquery:
+        query = query.filter("search_vector", "fts(simple)", tsquery)
+
+    # Recherche résolue en amont par l'index local
+    if filters.get("ids") is not None:
+        query = query.in_("id", filters["ids"])
+
+    return or_groups_filter(query, or_groups)
+
+
+def fetch_trade_page(
+    client,
+    filters: Dict[str, Any],
+    cursor: Optional[Tuple[str, str]] = None,
+    page_size: int = PAGE_SIZE
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Charger une page du journal, filtrée côté serveur et paginée par keyset.
+
+    Les trades sont triés par (created_at, id) décroissants ; la page suivante
+    commence strictement après le curseur, sans OFFSET, donc son coût ne dépend
+    pas de la profondeur de la page.
+
+    Args:
+        client: Client Supabase
+        filters: Filtres du dashboard (voir apply_filters)
+        cursor: (created_at, id) du dernier trade de la page précédente
+        page_size: Nombre de trades par page
+
+    Returns:
+        Tuple (lignes de la page, existence d'une page suivante)
+    """
+    # Recherche sans résultat : inutile d'interroger Supabase
+    if filters.get("ids") is not None and not filters["ids"]:
+        return [], False
+
+    or_groups = []
+    if cursor:
+        created_at, trade_id = cursor
+        or_groups.append(f"created_at.lt.{_quote(created_at)},and(created_at.eq.{_quote(created_at)},id.lt.{trade_id})")
+    query = apply_filters(client.table("trades").select(JOURNAL_COLUMNS), filters, or_groups)
+    # Une ligne de plus que la page pour savoir s'il reste des trades
+    rows = order_by(query, "created_at", "id", desc=True).limit(page_size + 1).execute().data
+    return rows[:page_size], len(rows) > page_size
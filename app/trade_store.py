@@ -0,0 +1,203 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# Taille des pages PostgREST (le serveur plafonne par défaut à 1000 lignes par requête)
+PAGE_SIZE = 1000
+
+# Nombre de deltas gardés pour les consommateurs incrémentaux (voir changes_since)
+CHANGE_LOG_SIZE = 32
+
+
+class TradeStore:
+    """
+    Cache en mémoire de la table trades, synchronisé par delta avec Supabase.
+
+    Le premier appel à refresh() télécharge tout l'historique ; les suivants ne
+    récupèrent que les lignes dont `updated_at` est postérieur au dernier
+    watermark connu, et les fusionnent par `id`. Une ligne supprimée (ou qui
+    sort du filtre `where`) n'apparaît dans aucun delta : invalidate() force
+    alors un rechargement complet.
+
+    Avec une source d'historique (export Parquet local, voir
+    server/parquet_export.py), le premier refresh() lit l'historique sur disque
+    et ne demande à Supabase que les lignes modifiées depuis le cutoff de
+    l'export : la queue vivante au lieu de toute la table.
+
+    Chaque modification du DataFrame incrémente `version` ; les derniers deltas
+    sont gardés pour qu'un consommateur (ex. pnl.PnlEngine) n'applique que les
+    lignes modifiées depuis sa dernière lecture (changes_since).
+    """
+
+    def __init__(
+        self,
+        client,
+        enrich: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+        min_interval: float = 2.0,
+        table: str = "trades",
+        history: Optional[Callable[[], Tuple[pd.DataFrame, Optional[str]]]] = None,
+        since: Optional[str] = None,
+        columns: str = "*",
+        where: Optional[Callable[[Any], Any]] = None
+    ):
+        """
+        Initialiser le store.
+
+        Args:
+            client: Client Supabase
+            enrich: Fonction appliquée aux nouvelles lignes uniquement (ex. calcul du R:R)
+            min_interval: Délai minimal en secondes entre deux requêtes delta
+            table: Table synchronisée
+            history: Fonction retournant (historique, cutoff), ex. parquet_export.read_history ;
+                cutoff à None si aucun export n'existe (chargement complet depuis Supabase)
+            since: Ne garder que les lignes créées depuis cette date (ISO)
+            columns: Colonnes demandées à Supabase (doivent inclure id, created_at et updated_at)
+            where: Fonction ajoutant des filtres à la requête, ex. les trades clôturés seulement ;
+                une ligne qui cesse d'y correspondre reste dans le cache, comme une ligne supprimée
+        """
+        self.client = client
+        self.enrich = enrich
+        self.min_interval = min_interval
+        self.table = table
+        self.history = history
+        self.since = since
+        self.columns = columns
+        self.where = where
+
+        self._df = pd.DataFrame()
+        self._watermark: Optional[str] = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        self.version = 0
+        # Version du dernier chargement complet, puis (version, lignes modifiées) des changements suivants
+        self._base_version = 0
+        self._changes: deque = deque(maxlen=CHANGE_LOG_SIZE)
+        self.stats = {"full_loads": 0, "delta_loads": 0, "rows_fetched": 0, "history_rows": 0}
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """DataFrame courant, trié par created_at décroissant (ne pas modifier en place)."""
+        return self._df
+
+    def _fetch_since(self, watermark: Optional[str]) -> pd.DataFrame:
+        """Télécharger, page par page, les lignes modifiées depuis le watermark."""
+        rows = []
+        start = 0
+        while True:
+            query = self.client.table(self.table).select(self.columns)
+            if watermark:
+                # gte plutôt que gt : les lignes exactement au watermark sont refusionnées sans risque
+                query = query.gte("updated_at", watermark)
+            if self.since:
+                query = query.gte("created_at", self.since)
+            if self.where is not None:
+                query = self.where(query)
+            # Un seul paramètre order avec id en départage, pour une pagination stable
+            query = query.order("updated_at,id").limit(PAGE_SIZE)
+            # offset/limit plutôt que range() : en postgrest-py 0.11, range(start, end) exclut `end`,
+            # la page faisait 999 lignes et la boucle s'arrêtait après la première
+            query.params = query.params.add("offset", start)
+            page = query.execute().data
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+        return pd.DataFrame(rows)
+
+    def refresh(self, force: bool = False) -> pd.DataFrame:
+        """
+        Synchroniser le cache avec Supabase.
+
+        Args:
+            force: Ignorer min_interval
+
+        Returns:
+            Le DataFrame à jour
+        """
+        with self._lock:
+            if not force and self._watermark and time.monotonic() - self._last_refresh < self.min_interval:
+                return self._df
+
+            first_load = self._watermark is None
+            if first_load and self.history is not None:
+                self._load_history()
+
+            delta = self._fetch_since(self._watermark)
+            self._last_refresh = time.monotonic()
+            if first_load:
+                self.stats["full_loads"] += 1
+            else:
+                self.stats["delta_loads"] += 1
+            self.stats["rows_fetched"] += len(delta)
+
+            if delta.empty:
+                if first_load:
+                    self._record(None)
+                return self._df
+
+            if self.enrich is not None:
+                delta = self.enrich(delta)
+
+            if self._df.empty:
+                merged = delta
+            else:
+                merged = pd.concat([self._df[~self._df["id"].isin(delta["id"])], delta], ignore_index=True)
+
+            self._watermark = delta["updated_at"].max() if "updated_at" in delta else None
+            self._df = merged.sort_values("created_at", ascending=False, ignore_index=True)
+            self._record(None if first_load else delta)
+            return self._df
+
+    def _record(self, delta: Optional[pd.DataFrame]) -> None:
+        """Nouvelle version du DataFrame ; delta à None pour un chargement complet."""
+        self.version += 1
+        if delta is None:
+            self._base_version = self.version
+            self._changes.clear()
+        else:
+            self._changes.append((self.version, delta))
+
+    def changes_since(self, version: Optional[int]) -> Tuple[int, Optional[List[pd.DataFrame]]]:
+        """
+        Lignes modifiées depuis une version du store.
+
+        Args:
+            version: Version lue lors du dernier appel (None au premier)
+
+        Returns:
+            (version courante, deltas dans l'ordre), deltas à None si les changements
+            ne sont plus connus (premier appel, chargement complet, plus de
+            CHANGE_LOG_SIZE changements) : relire df en entier
+        """
+        with self._lock:
+            if version == self.version:
+                return self.version, []
+            if version is None or not self._base_version <= version < self.version:
+                return self.version, None
+            if not self._changes or self._changes[0][0] > version + 1:
+                return self.version, None
+            return self.version, [delta for changed, delta in self._changes if changed > version]
+
+    def _load_history(self) -> None:
+        """Partir de l'historique exporté : la synchronisation reprend au cutoff de l'export."""
+        history, cutoff = self.history()
+        if cutoff is None:
+            return
+        if not history.empty:
+            if self.enrich is not None:
+                history = self.enrich(history)
+            history = history.sort_values("created_at", ascending=False, ignore_index=True)
+        self._df = history
+        # Les lignes créées ou modifiées depuis le cutoff sont redemandées à Supabase
+        self._watermark = cutoff
+        self.stats["history_rows"] += len(history)
+
+    def invalidate(self) -> None:
+        """Oublier le cache : le prochain refresh() recharge toute la table."""
+        with self._lock:
+            self._df = pd.DataFrame()
+            self._watermark = None
+            self._record(None)
@@ -0,0 +1,133 @@
+"""
+Micro-benchmark of per-request latency with and without HTTP client reuse.
+
+"fresh" builds a new httpx client for every request (new TCP connection and,
+over HTTPS, a new TLS handshake), like calling create_client() on every
+Streamlit rerun. "shared" reuses one pooled keep-alive client, as returned by
+server/clients.py.
+
+By default the requests go to a local HTTPS server with a self-signed
+certificate (needs the openssl CLI; use --no-tls otherwise). Point --url at a
+real endpoint (e.g. $SUPABASE_URL/rest/v1/) to include network round trips.
+
+Usage:
+    python benchmarks/bench_client_reuse.py
+    python benchmarks/bench_client_reuse.py --requests 500 --json results.json
+    python benchmarks/bench_client_reuse.py --url https://xyz.supabase.co/rest/v1/ --header "apikey: ..."
+"""
+import os
+import ssl
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+from clients import http_client_options  # noqa: E402
+from latency_tracker import LatencyTracker  # noqa: E402
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """Answers every GET with a small JSON body, keeping the connection open."""
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes: avoid the Nagle / delayed-ACK stall on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'[{"id": 1}]'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def self_signed_context(directory: str) -> ssl.SSLContext:
+    """Create a throwaway certificate for localhost with the openssl CLI."""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+        check=True, capture_output=True
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def start_local_server(tls: bool, directory: str) -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    scheme = "http"
+    if tls:
+        server.socket = self_signed_context(directory).wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"{scheme}://localhost:{server.server_address[1]}/"
+
+
+def run_fresh(url: str, headers: dict, n: int, verify: bool) -> LatencyTracker:
+    tracker = LatencyTracker(window=n)
+    for _ in range(n):
+        started = time.perf_counter()
+        with httpx.Client(headers=headers, verify=verify, **http_client_options()) as client:
+            client.get(url).raise_for_status()
+        tracker.record(time.perf_counter() - started)
+    return tracker
+
+
+def run_shared(url: str, headers: dict, n: int, verify: bool) -> LatencyTracker:
+    tracker = LatencyTracker(window=n)
+    with httpx.Client(headers=headers, verify=verify, **http_client_options()) as client:
+        client.get(url).raise_for_status()  # warm-up: the one handshake of the process
+        for _ in range(n):
+            started = time.perf_counter()
+            client.get(url).raise_for_status()
+            tracker.record(time.perf_counter() - started)
+    return tracker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per mode")
+    parser.add_argument("--url", help="Endpoint to call instead of the local server")
+    parser.add_argument("--header", action="append", default=[], help="Extra header, 'Name: value' (repeatable)")
+    parser.add_argument("--no-tls", action="store_true", help="Local server over plain HTTP")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    headers = dict(h.split(":", 1) for h in args.header)
+    headers = {k.strip(): v.strip() for k, v in headers.items()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or start_local_server(not args.no_tls, directory)
+        # The local certificate is self-signed
+        verify = bool(args.url)
+
+        results = {}
+        print(f"{args.requests} requests to {url}")
+        print(f"{'mode':>8} {'avg (ms)':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+        for mode, run in (("fresh", run_fresh), ("shared", run_shared)):
+            snapshot = run(url, headers, args.requests, verify).snapshot()
+            results[mode] = snapshot
+            print(f"{mode:>8} {snapshot['avg_ms']:>10.2f} {snapshot['p50_ms']:>10.2f} {snapshot['p95_ms']:>10.2f} {snapshot['p99_ms']:>10.2f}")
+
+    speedup = results["fresh"]["avg_ms"] / results["shared"]["avg_ms"] if results["shared"]["avg_ms"] else None
+    if speedup:
+        print(f"reuse is {speedup:.1f}x faster per request")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "client_reuse", "url": url, "requests": args.requests, "results": results, "speedup": speedup}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
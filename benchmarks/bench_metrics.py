@@ -0,0 +1,116 @@
+"""
+Benchmark of the dashboard metrics: legacy row-wise pandas code vs app/metrics.py.
+
+Usage:
+    python benchmarks/bench_metrics.py
+    python benchmarks/bench_metrics.py --sizes 10000 100000 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from metrics import prepare_trades, summary_stats, daily_counts  # noqa: E402
+
+
+def synthetic_trades(n: int, seed: int = 42) -> pd.DataFrame:
+    """Build a journal of n trades shaped like the Supabase `trades` rows."""
+    rng = np.random.default_rng(seed)
+    entry = rng.uniform(4000, 5000, n).round(2)
+    direction = rng.choice(["LONG", "SHORT"], n)
+    sign = np.where(direction == "LONG", 1, -1)
+    stop = (entry - sign * rng.uniform(2, 20, n)).round(2)
+    target = (entry + sign * rng.uniform(2, 60, n)).round(2)
+    created = pd.Timestamp("2022-01-01", tz="UTC") + pd.to_timedelta(rng.integers(0, 3 * 365 * 86400, n), unit="s")
+    return pd.DataFrame({
+        "id": np.arange(n),
+        "created_at": created.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+        "instrument": rng.choice(["ES", "NQ"], n),
+        "direction": direction,
+        "entry_price": entry,
+        "stop_loss": stop,
+        "take_profit": target,
+    })
+
+
+# Reference implementation: the dashboard code before app/metrics.py
+def legacy_calculate_rr(row):
+    try:
+        if row["direction"] == "LONG":
+            risk = abs(row["entry_price"] - row["stop_loss"])
+            reward = abs(row["take_profit"] - row["entry_price"])
+        else:
+            risk = abs(row["entry_price"] - row["stop_loss"])
+            reward = abs(row["entry_price"] - row["take_profit"])
+        return reward / risk if risk != 0 else 0
+    except Exception:
+        return 0
+
+
+def legacy_pipeline(df: pd.DataFrame) -> dict:
+    df = df.copy()
+    df["risk_reward"] = df.apply(legacy_calculate_rr, axis=1)
+    labels = df.apply(lambda x: pd.to_datetime(x["created_at"]).strftime("%d/%m/%Y %H:%M"), axis=1).tolist()
+    total = len(df)
+    long_ratio = len(df[df["direction"] == "LONG"]) / total * 100
+    avg_rr = df["risk_reward"].mean()
+    today = len(df[pd.to_datetime(df["created_at"]).dt.date == pd.Timestamp.now().date()])
+    win_rate = len(df[df["risk_reward"] >= 1]) / total * 100
+    start = pd.to_datetime(df["created_at"]).min().date()
+    end = pd.to_datetime(df["created_at"]).max().date()
+    filtered = df[
+        (pd.to_datetime(df["created_at"]).dt.date >= start) &
+        (pd.to_datetime(df["created_at"]).dt.date <= end)
+    ]
+    return {"labels": len(labels), "long_ratio": long_ratio, "avg_rr": avg_rr, "today": today, "win_rate": win_rate, "filtered": len(filtered)}
+
+
+def vectorized_pipeline(df: pd.DataFrame) -> dict:
+    df = prepare_trades(df.copy())
+    stats = summary_stats(df)
+    start, end = df["created_day"].min(), df["created_day"].max()
+    filtered = df[(df["created_day"] >= start) & (df["created_day"] <= end)]
+    per_day = daily_counts(df)
+    return {"labels": len(df["label"]), **stats, "filtered": len(filtered), "days": len(per_day)}
+
+
+def timed(fn, df):
+    started = time.perf_counter()
+    result = fn(df)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--legacy-max", type=int, default=100_000, help="Skip the legacy pipeline above this size (the row-wise code takes ~10 min at 1M)")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'trades':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>9}")
+    for n in args.sizes:
+        df = synthetic_trades(n)
+        vec_time, vec = timed(vectorized_pipeline, df)
+        legacy_time = None
+        if n <= args.legacy_max:
+            legacy_time, legacy = timed(legacy_pipeline, df)
+            assert abs(legacy["avg_rr"] - vec["avg_rr"]) < 1e-9
+            assert abs(legacy["win_rate"] - vec["win_rate"]) < 1e-9
+        speedup = f"{legacy_time / vec_time:.1f}x" if legacy_time else "-"
+        legacy_label = f"{legacy_time:.3f}" if legacy_time else "skipped"
+        print(f"{n:>10} {legacy_label:>12} {vec_time:>15.3f} {speedup:>9}")
+        results.append({"trades": n, "legacy_s": legacy_time, "vectorized_s": vec_time})
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "metrics", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
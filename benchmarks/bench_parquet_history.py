@@ -0,0 +1,169 @@
+"""
+Benchmark of the dashboard's first trade load: full JSON download vs the
+local Parquet history (server/parquet_export.py) plus the live tail.
+
+For each journal size, the backends (fake_backends.py) are seeded, the
+history is exported once (timed, then an incremental run after a few edits
+and new trades), and each load path runs in a fresh process so its memory
+is measured alone: the peak resident set size (VmHWM) minus the resident
+size before the load. Arrow buffers are outside tracemalloc, hence a
+process per path instead of run_suite.py's measure().
+
+Paths:
+    json            TradeStore.refresh() without history (every row over PostgREST)
+    parquet         history read with the dashboard columns, then rows updated since the cutoff
+    parquet_recent  same, limited to the last 12 months of the journal (partition pruning)
+
+Usage:
+    python benchmarks/bench_parquet_history.py
+    python benchmarks/bench_parquet_history.py --sizes 100000 1000000 --latency-ms 30 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import subprocess
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, os.path.join(ROOT_DIR, "server"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "app"))
+
+PATHS = ("json", "parquet", "parquet_recent")
+
+# The columns streamlit_app.py reads from the history
+DASHBOARD_COLUMNS = (
+    "id", "created_at", "updated_at", "instrument", "direction", "entry_price", "stop_loss", "take_profit",
+    "risk_reward", "notes", "ai_feedback", "screenshot_url",
+    "structure_id", "structure_type", "structure_direction", "structure_price", "structure_at",
+    "exit_price", "exit_time", "quantity",
+)
+
+
+def memory_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def child(path: str, export_dir: str, since: str) -> None:
+    """One load in this process; prints seconds, rows and peak memory as JSON."""
+    import clients
+    from metrics import prepare_trades
+    from parquet_export import read_history
+    from trade_store import TradeStore
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    client = clients.create_supabase()
+    history = None
+    if path != "json":
+        recent = since if path == "parquet_recent" else None
+        history = lambda: read_history("trades", columns=DASHBOARD_COLUMNS, since=recent, root=export_dir)  # noqa: E731
+    store = TradeStore(client, enrich=prepare_trades, history=history, since=since if path == "parquet_recent" else None)
+
+    # Imports and the client are paid before the baseline, as on a dashboard rerun
+    client.table("trades").select("id").limit(1).execute()
+    before = memory_kb("VmRSS")
+    started = time.perf_counter()
+    df = store.refresh()
+    seconds = time.perf_counter() - started
+    print(json.dumps({
+        "seconds": round(seconds, 4),
+        "peak_mb": round((memory_kb("VmHWM") - before) / 1024, 1),
+        "rows": len(df),
+        "rows_fetched": store.stats["rows_fetched"],
+    }))
+
+
+def run_child(path: str, export_dir: str, since: str, env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", path, "--dir", export_dir, "--since", since],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def directory_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Latency of each backend call")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--child", choices=PATHS, help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    parser.add_argument("--since", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.dir, args.since)
+        return
+
+    import pandas as pd
+    from run_suite import journal_rows, seed, start_backends, stop
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    results = []
+    print(f"backends with {args.latency_ms:.0f} ms per call")
+    print(f"{'trades':>8} {'path':>15} {'seconds':>9} {'peak MB':>9} {'rows fetched':>13}")
+    for n in args.sizes:
+        backends, backend_url = start_backends(args.latency_ms)
+        export_dir = tempfile.mkdtemp(prefix="parquet_bench_")
+        try:
+            rows = journal_rows(n)
+            seed(backend_url, rows)
+            env = {**os.environ, "SUPABASE_URL": backend_url, "SUPABASE_KEY": "load.test.key", "HTTP2_ENABLED": "false"}
+            os.environ.update(env)
+
+            import clients
+            from parquet_export import ParquetExporter
+            from supabase_client import SupabaseClient
+
+            client = clients.create_supabase()
+            exporter = ParquetExporter(SupabaseClient(batch_writes=False, client=client), root=export_dir, lag_minutes=0)
+            full = exporter.export_table("trades")
+            # Later runs: a few trades edited (AI feedback) and a few new ones since the export
+            for row in rows[:20]:
+                client.table("trades").update({"ai_feedback": "Reviewed"}).eq("id", row["id"]).execute()
+            client.table("trades").insert([
+                {"instrument": "ES", "direction": "LONG", "entry_price": 4500, "stop_loss": 4490, "take_profit": 4520}
+                for _ in range(20)
+            ]).execute()
+            incremental = exporter.export_table("trades")
+
+            # parquet_recent: the last 12 months of the synthetic journal
+            since = (pd.Timestamp(max(row["created_at"] for row in rows)) - pd.DateOffset(months=12)).isoformat()
+            result = {
+                "trades": n,
+                "json_mb": round(len(json.dumps(rows, default=str)) / 1024 / 1024, 1),
+                "parquet_mb": round(directory_mb(export_dir), 1),
+                "export_full_s": full["elapsed_s"],
+                "export_incremental_s": incremental["elapsed_s"],
+                "incremental_rows": incremental["rows_fetched"],
+            }
+            for path in PATHS:
+                timing = run_child(path, export_dir, since, env)
+                result[path] = timing
+                print(f"{n:>8} {path:>15} {timing['seconds']:>9.3f} {timing['peak_mb']:>9.1f} {timing['rows_fetched']:>13}", flush=True)
+            print(f"{n:>8} {'export':>15} full {full['elapsed_s']:.2f} s, incremental {incremental['elapsed_s']:.2f} s "
+                  f"({incremental['rows_fetched']} rows); JSON {result['json_mb']} MB vs Parquet {result['parquet_mb']} MB")
+            results.append(result)
+        finally:
+            stop(backends)
+            shutil.rmtree(export_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "parquet_history", "latency_ms": args.latency_ms, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Benchmark of the realized P&L engine (app/pnl.py): equity curve, drawdown,
+expectancy and streaks over the whole journal.
+
+Paths:
+    naive        Python loop over the closed trades in exit order (what a row-by-row implementation does)
+    parse        exit_time parsed once, as prepare_trades does when the TradeStore receives the rows
+    rebuild      PnlEngine.rebuild() on the prepared rows: NumPy over whole columns
+    close        PnlEngine.close() for each of the last --closes trades, after a rebuild on the others
+                 (one trade closing vs recomputing the whole history)
+
+The three paths must give the same summary; the run fails otherwise.
+
+Usage:
+    python benchmarks/bench_pnl.py
+    python benchmarks/bench_pnl.py --sizes 100000 1000000 --closes 1000 --json results.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+from bench_metrics import synthetic_trades  # noqa: E402
+from pnl import PnlEngine, parse_exit_times, point_value  # noqa: E402
+
+
+def journal_with_exits(n: int, seed: int = 7) -> pd.DataFrame:
+    """Synthetic journal with outcomes: target, stop or breakeven exits, 5% of trades still open."""
+    df = synthetic_trades(n)
+    rng = np.random.default_rng(seed)
+    outcome = rng.choice(["target", "stop", "breakeven", "open"], n, p=[0.4, 0.45, 0.1, 0.05])
+    exit_price = np.select(
+        [outcome == "target", outcome == "stop", outcome == "breakeven"],
+        [df["take_profit"], df["stop_loss"], df["entry_price"]],
+        np.nan,
+    )
+    exit_time = pd.to_datetime(df["created_at"], utc=True) + pd.to_timedelta(rng.integers(60, 4 * 3600, n), unit="s")
+    df["exit_price"] = exit_price
+    df["exit_time"] = exit_time.dt.strftime("%Y-%m-%dT%H:%M:%S+00:00").where(outcome != "open")
+    df["quantity"] = rng.integers(1, 4, n).astype(np.float64)
+    return df
+
+
+def naive_summary(records: list) -> dict:
+    """Row-by-row reference: sort the closed trades, then one pass with running totals."""
+    closed = sorted(
+        (row for row in records if isinstance(row["exit_time"], str) and not math.isnan(row["exit_price"])),
+        key=lambda row: row["exit_time"]
+    )
+    equity = peak = max_drawdown = 0.0
+    wins = losses = streak = longest_win = longest_loss = 0
+    r_sum = 0.0
+    r_count = 0
+    for row in closed:
+        points = (row["exit_price"] - row["entry_price"]) * (-1 if row["direction"] == "SHORT" else 1)
+        risk = abs(row["entry_price"] - row["stop_loss"])
+        if risk > 0:
+            r_sum += points / risk
+            r_count += 1
+        equity += points * point_value(row["instrument"]) * row["quantity"]
+        peak = max(peak, equity)
+        max_drawdown = min(max_drawdown, equity - peak)
+        if points > 0:
+            wins += 1
+            streak = streak + 1 if streak > 0 else 1
+            longest_win = max(longest_win, streak)
+        elif points < 0:
+            losses += 1
+            streak = streak - 1 if streak < 0 else -1
+            longest_loss = max(longest_loss, -streak)
+        else:
+            streak = 0
+    return {
+        "closed_trades": len(closed),
+        "win_rate": wins / len(closed) * 100,
+        "net_pnl_usd": equity,
+        "expectancy_r": r_sum / r_count,
+        "max_drawdown_usd": max_drawdown,
+        "longest_win_streak": longest_win,
+        "longest_loss_streak": longest_loss,
+        "current_streak": streak,
+    }
+
+
+def same(expected: dict, actual: dict) -> bool:
+    return all(math.isclose(expected[key], actual[key], rel_tol=1e-9, abs_tol=1e-6) for key in expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--closes", type=int, default=1000, help="Trades closed one by one after the rebuild")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'trades':>9} {'closed':>9} {'naive s':>9} {'parse s':>9} {'rebuild s':>10} {'close us':>9} {'rebuild/close':>14}")
+    for n in args.sizes:
+        df = journal_with_exits(n)
+        records = df.to_dict("records")
+
+        started = time.perf_counter()
+        expected = naive_summary(records)
+        naive_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        df["exit_time_dt"] = parse_exit_times(df["exit_time"])
+        parse_s = time.perf_counter() - started
+
+        engine = PnlEngine()
+        started = time.perf_counter()
+        engine.rebuild(df)
+        rebuild_s = time.perf_counter() - started
+        full = engine.summary()
+
+        # The last trades to close, in exit order: rebuild without them, then close() one by one
+        exit_ns = df["exit_time_dt"].dt.tz_convert(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        closed = np.flatnonzero(df["exit_time_dt"].notna().to_numpy())
+        last = closed[np.argsort(exit_ns[closed], kind="stable")][-args.closes:]
+        incremental = PnlEngine()
+        incremental.rebuild(df.drop(index=last))
+        closing = df.iloc[last].drop(columns="exit_time_dt").to_dict("records")
+        started = time.perf_counter()
+        for trade in closing:
+            incremental.close(trade)
+        close_us = (time.perf_counter() - started) / len(closing) * 1e6
+        after = incremental.summary()
+
+        if not (same(expected, full) and same(expected, after)):
+            raise SystemExit(f"summaries differ at {n} trades:\nnaive {expected}\nrebuild {full}\nclose {after}")
+        if not np.allclose(engine.trades()["equity"], incremental.trades()["equity"]):
+            raise SystemExit(f"equity curves differ at {n} trades")
+
+        result = {
+            "trades": n,
+            "closed_trades": full["closed_trades"],
+            "naive_s": round(naive_s, 3),
+            "parse_s": round(parse_s, 3),
+            "rebuild_s": round(rebuild_s, 3),
+            "close_us": round(close_us, 1),
+            "summary": {key: value for key, value in full.items() if not (isinstance(value, float) and math.isinf(value))},
+        }
+        results.append(result)
+        print(f"{n:>9} {full['closed_trades']:>9} {naive_s:>9.3f} {parse_s:>9.3f} {rebuild_s:>10.3f} {close_us:>9.1f} "
+              f"{rebuild_s * 1e6 / close_us:>13.0f}x", flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "pnl", "closes": args.closes, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark of the trade -> preceding structure join: nested scan vs server/structure_context.py.
+
+The nested scan is what a naive labeling does: for each trade, look through
+every structure of its instrument for the latest one before it. The index
+answers with one bisect per trade (webhook path) or one np.searchsorted per
+instrument (history labeling).
+
+Usage:
+    python benchmarks/bench_structure_join.py
+    python benchmarks/bench_structure_join.py --years 5 --trades 100000 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server"))
+from structure_context import StructureIndex  # noqa: E402
+
+INSTRUMENTS = ["ES", "NQ"]
+START = 1_640_995_200.0  # 2022-01-01 UTC
+
+
+def synthetic_structures(years: float, per_day: int, seed: int = 42) -> list:
+    """Structures spread over `years`, `per_day` per instrument and day on average."""
+    rng = np.random.default_rng(seed)
+    n = int(years * 365 * per_day * len(INSTRUMENTS))
+    times = np.sort(START + rng.uniform(0, years * 365 * 86400, n))
+    instruments = rng.choice(INSTRUMENTS, n)
+    types = rng.choice(["BOS", "CHoCH"], n)
+    directions = rng.choice(["BULLISH", "BEARISH"], n)
+    prices = rng.uniform(4000, 5000, n).round(2)
+    return [
+        {"id": f"s{i}", "instrument": instruments[i], "structure_type": types[i], "direction": directions[i],
+         "price_level": float(prices[i]), "created_at": float(times[i])}
+        for i in range(n)
+    ]
+
+
+def synthetic_trades(years: float, n: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    return rng.choice(INSTRUMENTS, n).tolist(), (START + rng.uniform(0, years * 365 * 86400, n)).tolist()
+
+
+def nested_scan(structures: list, instruments: list, times: list, lookback: float) -> list:
+    """Reference: for each trade, scan every structure."""
+    result = []
+    for instrument, at in zip(instruments, times):
+        best = None
+        for structure in structures:
+            if structure["instrument"] == instrument and structure["created_at"] <= at:
+                if best is None or structure["created_at"] >= best["created_at"]:
+                    best = structure
+        result.append(best["id"] if best is not None and at - best["created_at"] <= lookback else None)
+    return result
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=float, default=3, help="History covered by the structures and trades")
+    parser.add_argument("--per-day", type=int, default=20, help="Structures per instrument and day")
+    parser.add_argument("--trades", type=int, default=100_000)
+    parser.add_argument("--lookback-minutes", type=float, default=120)
+    parser.add_argument("--nested-trades", type=int, default=200, help="Trades checked with the nested scan (it is quadratic)")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    structures = synthetic_structures(args.years, args.per_day)
+    instruments, times = synthetic_trades(args.years, args.trades)
+    index = StructureIndex(args.lookback_minutes)
+
+    load_time, _ = timed(index.add_many, structures)
+    index.join(instruments[:1], times[:1])  # numpy import and array cache, paid once per process
+    join_time, joined = timed(index.join, instruments, times)
+    lookup_time, looked_up = timed(lambda: [index.lookup(i, t) for i, t in zip(instruments, times)])
+    assert all(a is b for a, b in zip(joined, looked_up))
+
+    sample = args.nested_trades
+    nested_time, nested = timed(nested_scan, structures, instruments[:sample], times[:sample], index.lookback)
+    assert nested == [s["id"] if s else None for s in joined[:sample]]
+    nested_estimate = nested_time / sample * args.trades
+
+    # Live path: one structure then one trade, as the webhook server sees them
+    live = StructureIndex(args.lookback_minutes)
+    live.add_many(structures)
+    last = structures[-1]["created_at"]
+    started = time.perf_counter()
+    for i in range(10_000):
+        live.add({**structures[-1], "id": f"live{i}", "created_at": last + i})
+        live.lookup("ES", last + i + 1)
+    live_us = (time.perf_counter() - started) / 10_000 * 1e6
+
+    labeled = sum(s is not None for s in joined)
+    print(f"{len(structures)} structures, {args.trades} trades, {labeled} labeled")
+    print(f"{'bulk load (sort)':<28} {load_time:>10.3f} s")
+    print(f"{'join (searchsorted)':<28} {join_time:>10.3f} s")
+    print(f"{'lookup per trade (bisect)':<28} {lookup_time:>10.3f} s")
+    print(f"{'nested scan (estimated)':<28} {nested_estimate:>10.1f} s   ({nested_estimate / join_time:.0f}x the join)")
+    print(f"{'add + lookup (live)':<28} {live_us:>10.1f} us")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "structure_join", "structures": len(structures), "trades": args.trades,
+                       "labeled": labeled, "load_s": load_time, "join_s": join_time, "lookup_s": lookup_time,
+                       "nested_estimate_s": nested_estimate, "live_add_lookup_us": live_us}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Local stand-ins for PostgREST, Supabase Storage and the OpenAI API.
+
+One aiohttp server answers on a single port:
+- POST/PATCH/GET /rest/v1/<table>: rows kept in memory, POST returns the
+  row with an id and timestamps (409 / 23505 on a duplicate idempotency_key),
+  PATCH refreshes updated_at, upserts with resolution=ignore-duplicates
+  skip existing ids, GET supports eq/neq/gt/gte/lt/lte/in, is.null and not.is.null
+  filters, order, limit/offset and Range pagination
+- POST /storage/v1/object/<bucket>/<path>: stores the size of the object,
+  answers like Storage (400 with statusCode 409) when it already exists
+- POST /v1/chat/completions: a canned completion with token usage; with
+  "stream": true, the words of the completion as server-sent events, one
+  every --token-ms, then the usage chunk if stream_options asks for it
+
+Every request waits --latency-ms before answering, to stand in for the
+network round trip and the backend's own work. Point the servers at it with
+SUPABASE_URL=http://127.0.0.1:<port> and OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Usage:
+    python benchmarks/fake_backends.py --port 8900 --latency-ms 20 --token-ms 15
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+def _coerce(actual: Any, value: str) -> Any:
+    """Compare numbers as numbers, everything else (ISO timestamps included) as text."""
+    return float(value) if isinstance(actual, (int, float)) and not isinstance(actual, bool) else value
+
+
+FILTERS = {
+    "eq": lambda actual, value: str(actual) == value,
+    "neq": lambda actual, value: str(actual) != value,
+    "gt": lambda actual, value: actual > _coerce(actual, value),
+    "gte": lambda actual, value: actual >= _coerce(actual, value),
+    "lt": lambda actual, value: actual < _coerce(actual, value),
+    "lte": lambda actual, value: actual <= _coerce(actual, value),
+    "in": lambda actual, value: str(actual) in {item.strip('"') for item in value.strip("()").split(",")},
+}
+
+COMPLETION = "Solid risk management. Entry was early relative to the structure; wait for the retest. Score: 7/10."
+
+
+class FakeBackends:
+    """In-memory tables and objects, with a fixed (optionally jittered) latency per request."""
+
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 0.0, token_ms: float = 15.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.objects: Dict[str, int] = {}
+        self.versions: Dict[str, int] = {}
+        self._sorted: Dict[tuple, List[Dict[str, Any]]] = {}
+        self.requests = 0
+
+    async def _wait(self) -> None:
+        self.requests += 1
+        delay = self.latency_ms + (random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    async def insert(self, request: web.Request) -> web.Response:
+        await self._wait()
+        body = await request.json()
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        rows = [
+            {"id": str(uuid.uuid4()), "created_at": now, "updated_at": now, "ai_feedback": None, **row}
+            for row in (body if isinstance(body, list) else [body])
+        ]
+        table = self.tables.setdefault(request.match_info["table"], [])
+        # Upsert ignoring duplicates (on_conflict=id): rows whose id exists are skipped
+        if "ignore-duplicates" in request.headers.get("Prefer", ""):
+            ids = {row["id"] for row in table}
+            rows = [row for row in rows if row["id"] not in ids]
+        # Unique idempotency_key, answered like PostgREST
+        keys = [row.get("idempotency_key") for row in table + rows if row.get("idempotency_key")]
+        if len(set(keys)) < len(keys):
+            return web.json_response(
+                {"code": "23505", "message": "duplicate key value violates unique constraint", "details": None, "hint": None},
+                status=409
+            )
+        table.extend(rows)
+        self.versions[request.match_info["table"]] = self.versions.get(request.match_info["table"], 0) + 1
+        if "return=minimal" in request.headers.get("Prefer", ""):
+            return web.Response(status=201)
+        return web.json_response(rows, status=201)
+
+    async def update(self, request: web.Request) -> web.Response:
+        await self._wait()
+        values = await request.json()
+        row_id = request.query.get("id", "").replace("eq.", "", 1)
+        # Like the set_updated_at trigger
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        updated = []
+        for row in self.tables.get(request.match_info["table"], []):
+            if row["id"] == row_id:
+                row.update(values, updated_at=now)
+                updated.append(row)
+        self.versions[request.match_info["table"]] = self.versions.get(request.match_info["table"], 0) + 1
+        return web.json_response(updated)
+
+    def _ordered(self, table: str, order: Optional[str]) -> List[Dict[str, Any]]:
+        """Rows of a table sorted by a PostgREST order ("a,b.desc"), cached until the table changes."""
+        rows = self.tables.get(table, [])
+        if not order:
+            return rows
+        key = (table, order, self.versions.get(table, 0))
+        if key not in self._sorted:
+            # Stable sorts from the least significant column
+            for term in reversed(order.split(",")):
+                column, _, direction = term.partition(".")
+                rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column)), reverse=direction == "desc")
+            self._sorted = {key: rows}
+        return self._sorted[key]
+
+    async def select(self, request: web.Request) -> web.Response:
+        await self._wait()
+        rows = self._ordered(request.match_info["table"], request.query.get("order"))
+        for column, condition in request.query.items():
+            if column in ("select", "order", "limit", "offset"):
+                continue
+            operator, _, value = condition.partition(".")
+            if operator == "is" and value == "null":
+                rows = [row for row in rows if row.get(column) is None]
+                continue
+            if condition == "not.is.null":
+                rows = [row for row in rows if row.get(column) is not None]
+                continue
+            if operator not in FILTERS:
+                return web.json_response({"code": "PGRST100", "message": f"unsupported filter {condition}"}, status=400)
+            rows = [row for row in rows if row.get(column) is not None and FILTERS[operator](row[column], value)]
+        # Pagination: offset/limit parameters or a Range header ("start-end", inclusive)
+        start = int(request.query.get("offset", 0))
+        end = start + int(request.query["limit"]) if "limit" in request.query else len(rows)
+        if "Range" in request.headers:
+            first, _, last = request.headers["Range"].partition("-")
+            start, end = int(first), min(end, int(last) + 1)
+        return web.json_response(rows[start:end])
+
+    async def upload(self, request: web.Request) -> web.Response:
+        await self._wait()
+        key = request.match_info["path"]
+        data = await request.read()
+        if key in self.objects:
+            return web.json_response(
+                {"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"}, status=400
+            )
+        self.objects[key] = len(data)
+        return web.json_response({"Key": key})
+
+    async def chat_completion(self, request: web.Request) -> web.Response:
+        await self._wait()
+        body = await request.json()
+        prompt_tokens = sum(len(m["content"]) for m in body.get("messages", [])) // 4
+        if body.get("stream"):
+            return await self.stream_completion(request, body, prompt_tokens)
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": COMPLETION}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 30, "total_tokens": prompt_tokens + 30},
+        })
+
+    async def stream_completion(self, request: web.Request, body: Dict[str, Any], prompt_tokens: int) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model")}
+
+        async def send(chunk: Dict[str, Any]) -> None:
+            await response.write(f"data: {json.dumps({**base, **chunk})}\n\n".encode())
+
+        words = COMPLETION.split(" ")
+        for i, word in enumerate(words):
+            if i and self.token_ms > 0:
+                await asyncio.sleep(self.token_ms / 1000)
+            delta = {"content": word if i == 0 else f" {word}"}
+            if i == 0:
+                delta["role"] = "assistant"
+            await send({"choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        await send({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send({"choices": [], "usage": {
+                "prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)
+            }})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "requests": self.requests,
+            "rows": {table: len(rows) for table, rows in self.tables.items()},
+            "objects": len(self.objects),
+        })
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_get("/_stats", self.stats)
+        app.router.add_post("/rest/v1/{table}", self.insert)
+        app.router.add_patch("/rest/v1/{table}", self.update)
+        app.router.add_get("/rest/v1/{table}", self.select)
+        app.router.add_post("/storage/v1/object/{path:.+}", self.upload)
+        app.router.add_post("/v1/chat/completions", self.chat_completion)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Delay added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter on the delay")
+    parser.add_argument("--token-ms", type=float, default=15.0, help="Delay between streamed completion tokens")
+    args = parser.parse_args()
+
+    backends = FakeBackends(args.latency_ms, args.jitter_ms, args.token_ms)
+    print(json.dumps({"listening": f"http://{args.host}:{args.port}", "latency_ms": args.latency_ms}), flush=True)
+    web.run_app(backends.app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Load test of the webhook servers: Flask (server/app.py) vs async (server/async_app.py).
+
+Starts the local backend stand-ins (fake_backends.py), then each server in
+its own process, and fires /webhook/trade alerts with a fixed number of
+requests in flight. Reports p50/p95/p99 latency and requests/sec per server
+and concurrency level.
+
+Flask runs threaded without the debugger or reloader, i.e. the best the
+current entry point can do on one process; its outbound calls share the
+pooled httpx client (HTTP_MAX_CONNECTIONS).
+
+Usage:
+    python benchmarks/load_test_webhooks.py
+    python benchmarks/load_test_webhooks.py --concurrency 10,100,300 --requests 2000 --latency-ms 50
+    python benchmarks/load_test_webhooks.py --notes --screenshot --json webhooks.json
+    python benchmarks/load_test_webhooks.py --ingest-mode wal --latency-ms 200
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import itertools
+import base64
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "server"))
+sys.path.insert(0, SERVER_DIR)
+from latency_tracker import LatencyTracker  # noqa: E402
+
+# Unique alert ids: every request is a new alert, not a retry answered from the idempotency index
+RUN_ID = uuid.uuid4().hex[:8]
+ALERT_IDS = itertools.count()
+
+FLASK_SERVER = "import app; app.app.run(host='127.0.0.1', port={port}, threaded=True, debug=False, use_reloader=False)"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"process exited with status {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout:.0f}s")
+
+
+def server_env(backend_url: str, data_dir: str, ingest_mode: str = "direct") -> dict:
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": backend_url,
+        "SUPABASE_KEY": "load.test.key",
+        "OPENAI_API_KEY": "sk-load-test",
+        "OPENAI_BASE_URL": f"{backend_url}/v1",
+        "AI_JOB_QUEUE_PATH": os.path.join(data_dir, "jobs.sqlite3"),
+        "INGEST_MODE": ingest_mode,
+        "INGEST_LOG_PATH": os.path.join(data_dir, "ingest_log.sqlite3"),
+        "AI_CACHE_ENABLED": "false",
+        "SCREENSHOT_SPOOL_DIR": os.path.join(data_dir, "screenshot_spool"),
+        "HTTP2_ENABLED": "false",
+        # Every alert comes from one source: measure the servers, not the limiter
+        "RATE_LIMIT_ENABLED": "false",
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def sample_screenshot() -> str:
+    """A small PNG, base64-encoded as TradingView sends it."""
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new("RGB", (640, 360), (18, 22, 30)).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def trade_payload(i: int, notes: bool, screenshot: Optional[str]) -> Dict[str, Any]:
+    entry = 4500 + (i % 50) * 0.25
+    payload = {
+        "instrument": "ES" if i % 2 else "NQ",
+        "direction": "LONG" if i % 3 else "SHORT",
+        "entry_price": entry,
+        "stop_loss": entry - 10,
+        "take_profit": entry + 20,
+        "alert_id": f"load-test-{RUN_ID}-{next(ALERT_IDS)}",
+    }
+    if notes:
+        payload["notes"] = f"Load test alert {i}"
+    if screenshot:
+        payload["screenshot"] = screenshot
+    return payload
+
+
+async def drive(url: str, total: int, concurrency: int, notes: bool, screenshot: Optional[str]) -> Dict[str, Any]:
+    """Send `total` alerts keeping `concurrency` requests in flight."""
+    tracker = LatencyTracker(window=total)
+    statuses: Counter = Counter()
+    counter = iter(range(total))
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def client() -> None:
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    async with session.post(f"{url}/webhook/trade", json=trade_payload(i, notes, screenshot)) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                except Exception as e:
+                    statuses[type(e).__name__] += 1
+                tracker.record(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    snapshot = tracker.snapshot()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(total / elapsed, 1),
+        "p50_ms": snapshot["p50_ms"],
+        "p95_ms": snapshot["p95_ms"],
+        "p99_ms": snapshot["p99_ms"],
+        "max_ms": snapshot["max_ms"],
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+def run_server(name: str, command: List[str], env: dict, port: int, levels: List[int], args, screenshot) -> List[Dict[str, Any]]:
+    process = subprocess.Popen(command, cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+        url = f"http://127.0.0.1:{port}"
+        # Warm-up: client construction, first connections, imports done on first use
+        asyncio.run(drive(url, 20, 4, args.notes, screenshot))
+
+        results = []
+        for concurrency in levels:
+            result = asyncio.run(drive(url, max(args.requests, concurrency), concurrency, args.notes, screenshot))
+            results.append({"server": name, **result})
+            print(
+                f"{name:>6} {concurrency:>6} {result['requests_per_s']:>10.1f} {result['p50_ms']:>10.1f} "
+                f"{result['p95_ms']:>10.1f} {result['p99_ms']:>10.1f}   {result['statuses']}",
+                flush=True
+            )
+        return results
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="10,50,200", help="Comma-separated numbers of requests in flight")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Latency of every backend call")
+    parser.add_argument("--servers", default="flask,async", help="Servers to test")
+    parser.add_argument("--notes", action="store_true", help="Include notes, so every alert also queues an AI job")
+    parser.add_argument("--screenshot", action="store_true", help="Include a base64 screenshot in every alert")
+    parser.add_argument("--ingest-mode", choices=["direct", "wal"], default="direct",
+                        help="wal: acknowledge once the alert is in the local ingest log")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    screenshot = sample_screenshot() if args.screenshot else None
+
+    backend_port = free_port()
+    backends = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_backends.py"), "--port", str(backend_port), "--latency-ms", str(args.latency_ms)],
+        stdout=subprocess.DEVNULL
+    )
+    results = []
+    try:
+        wait_for_port(backend_port, backends)
+        backend_url = f"http://127.0.0.1:{backend_port}"
+        print(f"Backends at {backend_url} with {args.latency_ms:.0f} ms per call, {args.requests} requests per level")
+        print(f"{'server':>6} {'in flight':>6} {'req/s':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}   statuses")
+
+        for name in args.servers.split(","):
+            port = free_port()
+            with tempfile.TemporaryDirectory() as data_dir:
+                env = server_env(backend_url, data_dir, args.ingest_mode)
+                if name == "flask":
+                    command = [sys.executable, "-c", FLASK_SERVER.format(port=port)]
+                elif name == "async":
+                    command = [sys.executable, "async_app.py", "--port", str(port)]
+                else:
+                    raise SystemExit(f"Unknown server: {name}")
+                results.extend(run_server(name, command, env, port, levels, args, screenshot))
+    finally:
+        backends.terminate()
+        backends.wait(10)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "benchmark": "webhooks",
+                "latency_ms": args.latency_ms,
+                "ingest_mode": args.ingest_mode,
+                "notes": args.notes,
+                "screenshot": args.screenshot,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""
+End-to-end benchmark suite: the webhook server and the dashboard data functions,
+against local stand-ins for PostgREST, Storage and OpenAI (fake_backends.py).
+
+webhooks:  starts the backends with --latency-ms and the Flask server
+           (server/app.py, threaded, no debugger), then drives /webhook/trade
+           and /webhook/structure at fixed arrival rates, with and without
+           notes and screenshots. The driver is open loop: requests leave on
+           schedule whether or not earlier ones have answered, and latency is
+           measured from the scheduled send time, so a server falling behind
+           shows in the percentiles instead of slowing the driver down. Server
+           memory is its resident set size, sampled from /proc.
+
+dashboard: seeds the backends with synthetic journals of increasing size and
+           times what streamlit_app.py runs on each rerun: load_trades
+           (TradeStore full load, then a delta refresh), prepare_trades (R:R
+           and dates), summary_stats, daily_counts, the stat boxes read from
+           the trade_daily_stats aggregates (seeded here, kept by triggers in
+           Supabase) and the first filtered page of the journal
+           (fetch_trade_page). Peak memory is measured with
+           tracemalloc in a separate run.
+
+Results go to one JSON report (--json) with the run settings, git commit and
+machine; --compare prints the change of every metric against an earlier report.
+
+Usage:
+    python benchmarks/run_suite.py
+    python benchmarks/run_suite.py --rates 10,50 --duration 10 --latency-ms 30 --json suite.json
+    python benchmarks/run_suite.py --only dashboard --sizes 1000 10000 100000
+    python benchmarks/run_suite.py --json new.json --compare suite.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, os.path.join(ROOT_DIR, "server"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "app"))
+from latency_tracker import LatencyTracker  # noqa: E402
+from load_test_webhooks import FLASK_SERVER, free_port, wait_for_port, server_env, sample_screenshot, trade_payload  # noqa: E402
+from bench_metrics import synthetic_trades  # noqa: E402
+
+VARIANTS = {
+    "plain": (False, False),
+    "notes": (True, False),
+    "screenshot": (False, True),
+    "notes+screenshot": (True, True),
+}
+
+# Journal filters of the dashboard benchmark: one instrument, one direction, winners, last 30 days
+JOURNAL_FILTERS = {"instrument": "ES", "direction": "LONG", "performance": "winners"}
+
+
+def start_backends(latency_ms: float) -> tuple:
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_backends.py"), "--port", str(port), "--latency-ms", str(latency_ms)],
+        stdout=subprocess.DEVNULL
+    )
+    wait_for_port(port, process)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of a process in MB (Linux only, None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def structure_payload(i: int, notes: bool, screenshot: Optional[str]) -> Dict[str, Any]:
+    payload = {
+        "instrument": "ES" if i % 2 else "NQ",
+        "structure_type": "BOS" if i % 3 else "CHoCH",
+        "price_level": 4500 + (i % 50) * 0.25,
+        "direction": "BULLISH" if i % 2 else "BEARISH",
+        # Every alert is new, not a retry answered from the idempotency index
+        "alert_id": trade_payload(i, False, None)["alert_id"],
+    }
+    if notes:
+        payload["notes"] = f"Benchmark structure {i}"
+    if screenshot:
+        payload["screenshot"] = screenshot
+    return payload
+
+
+async def fixed_rate(
+    url: str,
+    make_payload: Callable[[int], Dict[str, Any]],
+    rate: float,
+    duration: float,
+    pid: int
+) -> Dict[str, Any]:
+    """Send rate * duration requests on a fixed schedule (open loop) and sample the server memory."""
+    total = max(1, int(rate * duration))
+    payloads = [make_payload(i) for i in range(total)]
+    tracker = LatencyTracker(window=total)
+    statuses: Counter = Counter()
+    loop = asyncio.get_running_loop()
+    rss = [rss_mb(pid)]
+
+    async def sample_memory() -> None:
+        while True:
+            rss.append(rss_mb(pid))
+            await asyncio.sleep(0.2)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+        start = loop.time() + 0.05
+
+        async def send(i: int) -> None:
+            scheduled = start + i / rate
+            await asyncio.sleep(max(0.0, scheduled - loop.time()))
+            try:
+                async with session.post(url, json=payloads[i]) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+            tracker.record(loop.time() - scheduled)
+
+        sampler = asyncio.create_task(sample_memory())
+        await asyncio.gather(*(send(i) for i in range(total)))
+        elapsed = loop.time() - start
+        sampler.cancel()
+
+    rss = [value for value in rss + [rss_mb(pid)] if value is not None]
+    snapshot = tracker.snapshot()
+    succeeded = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 400)
+    return {
+        "target_rate": rate,
+        "requests": total,
+        "throughput_per_s": round(succeeded / elapsed, 1),
+        "p50_ms": snapshot["p50_ms"],
+        "p95_ms": snapshot["p95_ms"],
+        "p99_ms": snapshot["p99_ms"],
+        "max_ms": snapshot["max_ms"],
+        "rss_start_mb": round(rss[0], 1) if rss else None,
+        "rss_peak_mb": round(max(rss), 1) if rss else None,
+        "rss_end_mb": round(rss[-1], 1) if rss else None,
+        "statuses": {str(k): v for k, v in statuses.items()},
+    }
+
+
+async def backlog(url: str) -> Dict[str, Any]:
+    """AI jobs and screenshot uploads still waiting when the requests are done."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{url}/jobs/stats") as response:
+            jobs = await response.json()
+        async with session.get(f"{url}/screenshots/stats") as response:
+            uploads = (await response.json())["uploads"]
+    return {"ai_jobs_pending": jobs["depth"], "uploads_pending": uploads["pending"]}
+
+
+def run_webhooks(args) -> List[Dict[str, Any]]:
+    """Fixed-rate webhook scenarios against the Flask server."""
+    screenshot = sample_screenshot()
+    backends, backend_url = start_backends(args.latency_ms)
+    results = []
+    print(f"webhooks: backends at {backend_url} with {args.latency_ms:.0f} ms per call, {args.duration:.0f}s per scenario")
+    print(f"{'endpoint':>10} {'variant':>17} {'rate':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'rss MB':>7}   statuses")
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, "-c", FLASK_SERVER.format(port=port)], cwd=os.path.join(ROOT_DIR, "server"),
+                env=server_env(backend_url, data_dir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_for_port(port, server)
+                url = f"http://127.0.0.1:{port}"
+                # Warm-up: client construction, first connections, imports done on first use
+                asyncio.run(fixed_rate(f"{url}/webhook/trade", lambda i: trade_payload(i, True, screenshot), 20, 1, server.pid))
+
+                for endpoint, make in (("trade", trade_payload), ("structure", structure_payload)):
+                    for variant, (notes, with_screenshot) in VARIANTS.items():
+                        for rate in args.rates:
+                            result = asyncio.run(fixed_rate(
+                                f"{url}/webhook/{endpoint}",
+                                lambda i: make(i, notes, screenshot if with_screenshot else None),
+                                rate, args.duration, server.pid
+                            ))
+                            result = {"suite": "webhooks", "endpoint": endpoint, "variant": variant, **result, **asyncio.run(backlog(url))}
+                            results.append(result)
+                            print(
+                                f"{endpoint:>10} {variant:>17} {rate:>6g} {result['throughput_per_s']:>7.1f} {result['p50_ms']:>8.1f} "
+                                f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['rss_peak_mb'] or 0:>7.1f}   {result['statuses']}",
+                                flush=True
+                            )
+            finally:
+                stop(server)
+    finally:
+        stop(backends)
+    return results
+
+
+def journal_rows(n: int) -> List[Dict[str, Any]]:
+    """Synthetic trades shaped like the Supabase rows, computed_rr included (a generated column there)."""
+    from metrics import compute_risk_reward
+
+    df = synthetic_trades(n)
+    df["id"] = [f"00000000-0000-4000-8000-{i:012d}" for i in range(n)]
+    df["updated_at"] = df["created_at"]
+    df["computed_rr"] = compute_risk_reward(df).round(4)
+    df["risk_reward"] = df["computed_rr"]
+    df["notes"] = None
+    df["ai_feedback"] = None
+    df["screenshot_url"] = None
+    return df.to_dict("records")
+
+
+def daily_stats_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The trade_daily_stats rows the triggers would maintain for these trades."""
+    from stats_reconciler import aggregate_trades
+
+    return [
+        {"day": day, "instrument": instrument, "direction": direction, **stats}
+        for (day, instrument, direction), stats in aggregate_trades(rows).items()
+    ]
+
+
+def seed(backend_url: str, rows: List[Dict[str, Any]], chunk: int = 5000, table: str = "trades") -> None:
+    async def post_all() -> None:
+        async with aiohttp.ClientSession() as session:
+            for start in range(0, len(rows), chunk):
+                async with session.post(f"{backend_url}/rest/v1/{table}", json=rows[start:start + chunk],
+                                        headers={"Prefer": "return=minimal"}) as response:
+                    response.raise_for_status()
+
+    asyncio.run(post_all())
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Median wall time over `repeat` runs, then the tracemalloc peak of one more run."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(statistics.median(times), 5), "peak_mb": round(peak / 1024 / 1024, 2)}
+
+
+def run_dashboard(args) -> List[Dict[str, Any]]:
+    """Dashboard data functions over journals of increasing size."""
+    results = []
+    # One INFO line per PostgREST page otherwise
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    print(f"dashboard: backends with {args.latency_ms:.0f} ms per call, median of {args.repeat} runs")
+    print(f"{'trades':>8} {'function':>18} {'seconds':>9} {'peak MB':>9}")
+    for n in args.sizes:
+        backends, backend_url = start_backends(args.latency_ms)
+        try:
+            rows = journal_rows(n)
+            seed(backend_url, rows)
+            seed(backend_url, daily_stats_rows(rows), table="trade_daily_stats")
+            os.environ.update({"SUPABASE_URL": backend_url, "SUPABASE_KEY": "load.test.key", "HTTP2_ENABLED": "false"})
+
+            import clients
+            from metrics import prepare_trades, summary_stats, summary_from_daily_stats, daily_counts
+            from supabase_client import SupabaseClient
+            from trade_query import fetch_trade_page
+            from trade_store import TradeStore
+
+            # A new client per journal: each one has its own backends
+            client = clients.create_supabase()
+
+            # load_trades: what get_trade_store().refresh() does on the first run, then on later reruns
+            loaded = {}
+
+            def full_load() -> None:
+                loaded["store"] = TradeStore(client, enrich=prepare_trades)
+                loaded["df"] = loaded["store"].refresh()
+
+            def delta_load() -> None:
+                # A rerun with nothing new: one request for the rows at the watermark
+                loaded["store"].refresh(force=True)
+
+            raw = pd.DataFrame(rows)
+            timings = {"load_trades_full": measure(full_load, args.repeat)}
+            if len(loaded["df"]) != n:
+                raise SystemExit(f"load_trades returned {len(loaded['df'])} trades out of {n}")
+            timings["load_trades_delta"] = measure(delta_load, args.repeat)
+            prepared = loaded["df"]
+            timings["prepare_trades"] = measure(lambda: prepare_trades(raw.copy()), args.repeat)
+            timings["summary_stats"] = measure(lambda: summary_stats(prepared), args.repeat)
+            timings["daily_counts"] = measure(lambda: daily_counts(prepared), args.repeat)
+            # load_summary_stats: the aggregate rows instead of the journal
+            stats_client = SupabaseClient(batch_writes=False, client=client)
+            timings["daily_stats"] = measure(
+                lambda: summary_from_daily_stats(stats_client.fetch_daily_stats()), args.repeat
+            )
+            if summary_from_daily_stats(stats_client.fetch_daily_stats())["total_trades"] != n:
+                raise SystemExit("trade_daily_stats does not add up to the seeded journal")
+            last_day = prepared["created_day"].max().date()
+            filters = {**JOURNAL_FILTERS, "date_range": (last_day - timedelta(days=30), last_day)}
+            timings["journal_page"] = measure(lambda: fetch_trade_page(client, filters), args.repeat)
+
+            for function, timing in timings.items():
+                results.append({"suite": "dashboard", "function": function, "trades": n, **timing})
+                print(f"{n:>8} {function:>18} {timing['seconds']:>9.4f} {timing['peak_mb']:>9.2f}", flush=True)
+        finally:
+            stop(backends)
+    return results
+
+
+def result_key(result: Dict[str, Any]) -> tuple:
+    if result["suite"] == "webhooks":
+        return ("webhooks", result["endpoint"], result["variant"], result["target_rate"])
+    return ("dashboard", result["function"], result["trades"])
+
+
+COMPARED = ("throughput_per_s", "p50_ms", "p95_ms", "p99_ms", "rss_peak_mb", "seconds", "peak_mb")
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    """Print the relative change of every metric against a previous report."""
+    with open(baseline_path) as f:
+        baseline = {result_key(result): result for result in json.load(f)["results"]}
+    print(f"\nChange against {baseline_path} (negative is faster or smaller, except throughput):")
+    for result in results:
+        before = baseline.get(result_key(result))
+        if before is None:
+            continue
+        changes = [
+            f"{metric} {(result[metric] - before[metric]) / before[metric] * 100:+.1f}%"
+            for metric in COMPARED
+            if result.get(metric) is not None and before.get(metric)
+        ]
+        print(f"  {' / '.join(str(part) for part in result_key(result))}: {', '.join(changes)}")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", choices=["webhooks", "dashboard"], help="Run one part of the suite")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Latency of every backend call")
+    parser.add_argument("--rates", type=lambda value: [float(rate) for rate in value.split(",")], default=[10.0, 50.0],
+                        help="Comma-separated webhook arrival rates (requests/s)")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per webhook scenario")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="Journal sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per dashboard function (median reported)")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    results = []
+    if args.only in (None, "webhooks"):
+        results.extend(run_webhooks(args))
+    if args.only in (None, "dashboard"):
+        results.extend(run_dashboard(args))
+
+    report = {
+        "benchmark": "suite",
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": git_commit(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {
+            "latency_ms": args.latency_ms, "rates": args.rates, "duration_s": args.duration,
+            "sizes": args.sizes, "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
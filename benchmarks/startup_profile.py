@@ -0,0 +1,223 @@
+"""
+Startup profile: import-time breakdown and cold-start timings.
+
+- Import breakdown of the Flask server (`import app`) and of the dashboard
+  (`import streamlit_app` in bare mode), from `python -X importtime`,
+  grouped by top-level package
+- Time to first request: fresh interpreter -> `import app` -> first response
+  from the Flask test client (plus the first webhook, which needs Supabase)
+- Time to first render: fresh interpreter -> first complete run of the
+  dashboard script through streamlit.testing.AppTest
+
+Both timings run against a tiny local PostgREST stand-in started by this
+script, so no network or credentials are needed.
+
+Usage:
+    python benchmarks/startup_profile.py
+    python benchmarks/startup_profile.py --check            # exit 1 above the thresholds
+    python benchmarks/startup_profile.py --top 15 --json startup.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+SERVER_DIR = os.path.join(ROOT, "server")
+APP_DIR = os.path.join(ROOT, "app")
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_thresholds.json")
+
+# Child scripts print wall-clock timestamps; the parent subtracts its spawn time,
+# so interpreter startup is included but interpreter shutdown is not
+FLASK_FIRST_REQUEST = """
+import time, json
+import app
+client = app.app.test_client()
+assert client.get('/jobs/stats').status_code == 200
+first_request = time.time()
+response = client.post('/webhook/trade', json={
+    'instrument': 'ES', 'direction': 'LONG', 'entry_price': 4500, 'stop_loss': 4490, 'take_profit': 4520
+})
+assert response.status_code == 201, response.get_data(as_text=True)
+print(json.dumps({'first_request': first_request, 'first_webhook': time.time()}))
+"""
+
+DASHBOARD_FIRST_RENDER = """
+import time, json
+from streamlit.testing.v1 import AppTest
+imported = time.time()
+at = AppTest.from_file({path!r}, default_timeout=120)
+at.run()
+assert not at.exception, [e.value for e in at.exception]
+print(json.dumps({{'streamlit_imported': imported, 'first_render': time.time()}}))
+"""
+
+
+class StubPostgrest(BaseHTTPRequestHandler):
+    """Empty tables: GET returns [], POST echoes the row with an id."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._send(200, [])
+
+    def do_HEAD(self):
+        self._send(200, [])
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        rows = body if isinstance(body, list) else [body]
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        self._send(201, [{"id": str(uuid.uuid4()), "created_at": now, "updated_at": now, **row} for row in rows])
+
+    def do_PATCH(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._send(200, [])
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubPostgrest)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def child_env(supabase_url: str, data_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": supabase_url,
+        "SUPABASE_KEY": "profile.key.local",
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "sk-profile"),
+        "AI_JOB_QUEUE_PATH": os.path.join(data_dir, "jobs.sqlite3"),
+        "AI_CACHE_PATH": os.path.join(data_dir, "llm_cache.sqlite3"),
+        "SCREENSHOT_SPOOL_DIR": os.path.join(data_dir, "screenshot_spool"),
+        # Every run sends the same alert: the index would answer the repeats with a replay
+        "IDEMPOTENCY_ENABLED": "false",
+        "PYTHONPATH": os.pathsep.join([SERVER_DIR, APP_DIR]),
+    })
+    return env
+
+
+def import_breakdown(statement: str, cwd: str, env: dict, top: int) -> dict:
+    """Run `python -X importtime` and group self time by top-level package."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=cwd, env=env, capture_output=True, text=True
+    )
+    per_package = defaultdict(int)
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:"):].split("|")
+            self_us = int(self_us)
+        except ValueError:
+            continue  # header line
+        per_package[name.strip().split(".")[0]] += self_us
+        total_us += self_us
+
+    ranked = sorted(per_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "packages": [{"package": name, "self_ms": round(us / 1000, 1)} for name, us in ranked],
+    }
+
+
+def timed_child(script: str, cwd: str, env: dict) -> dict:
+    """Run a script in a fresh interpreter; returns ms from spawn to each timestamp it prints."""
+    spawned = time.time()
+    result = subprocess.run([sys.executable, "-c", script], cwd=cwd, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "child failed")
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+    return {f"{name}_ms": round((at - spawned) * 1000, 1) for name, at in marks.items()}
+
+
+def best_of(runs: int, key: str, fn, *args) -> dict:
+    """Keep the fastest of several runs (the others include disk cache noise)."""
+    return min((fn(*args) for _ in range(runs)), key=lambda r: r[key])
+
+
+def print_breakdown(title: str, breakdown: dict) -> None:
+    print(f"\n{title}: {breakdown['total_ms']:.0f} ms of imports")
+    for entry in breakdown["packages"]:
+        print(f"  {entry['package']:<28} {entry['self_ms']:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=10, help="Packages shown per import breakdown")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per cold-start timing (best is kept)")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if a threshold is exceeded")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH, help="JSON file with the regression thresholds")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    with open(args.thresholds) as f:
+        thresholds = json.load(f)
+
+    supabase_url = start_stub()
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = child_env(supabase_url, data_dir)
+
+        server_imports = import_breakdown("import app", SERVER_DIR, env, args.top)
+        dashboard_imports = import_breakdown("import streamlit_app", ROOT, env, args.top)
+        flask = best_of(args.runs, "first_request_ms", timed_child, FLASK_FIRST_REQUEST, SERVER_DIR, env)
+        dashboard_script = DASHBOARD_FIRST_RENDER.format(path=os.path.join(APP_DIR, "streamlit_app.py"))
+        dashboard = best_of(args.runs, "first_render_ms", timed_child, dashboard_script, ROOT, env)
+
+    print_breakdown("Flask server (import app)", server_imports)
+    print_breakdown("Dashboard (import streamlit_app)", dashboard_imports)
+
+    print("\nCold start (fresh interpreter, best of %d)" % args.runs)
+    print(f"  Flask time to first request     {flask['first_request_ms']:>7.0f} ms   (first webhook at {flask['first_webhook_ms']:.0f} ms)")
+    print(f"  Dashboard time to first render  {dashboard['first_render_ms']:>7.0f} ms   (streamlit imported at {dashboard['streamlit_imported_ms']:.0f} ms)")
+
+    checks = {
+        "flask_first_request_ms": flask["first_request_ms"],
+        "dashboard_first_render_ms": dashboard["first_render_ms"],
+    }
+    failures = []
+    print("\nThresholds")
+    for name, value in checks.items():
+        limit = thresholds.get(name)
+        ok = limit is None or value <= limit
+        if not ok:
+            failures.append(name)
+        print(f"  {name:<28} {value:>8.0f} ms  (limit {limit} ms)  {'ok' if ok else 'REGRESSION'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "benchmark": "startup",
+                "imports": {"server": server_imports, "dashboard": dashboard_imports},
+                "flask": flask,
+                "dashboard": dashboard,
+                "thresholds": thresholds,
+                "failures": failures,
+            }, f, indent=2)
+
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
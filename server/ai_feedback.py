@@ -1,111 +1,323 @@
-import os
+import time
 import logging
-from openai import OpenAI
+from typing import Iterator, Union
 from dotenv import load_dotenv
 
+from llm_cache import get_cache, make_cache_key
+from clients import get_openai
+from model_router import Route, compact_prompt, get_router
+from structure_context import describe
+import tracing
+
 # Load environment variables
 load_dotenv()
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# The model and output budget of each call come from the routing tier (model_router.py)
+TEMPERATURE = 0.7
+
+# Bump when a prompt template changes so stale cached completions are not reused
+PROMPT_VERSION = 3
 
-def generate_trade_feedback(trade_data: dict) -> str:
+TRADE_SYSTEM_PROMPT = "You are an expert futures trading coach specializing in ES and NQ futures. You provide concise, actionable feedback on trades."
+STRUCTURE_SYSTEM_PROMPT = "You are an expert in market structure analysis, specializing in Break of Structure (BOS) and Change of Character (CHoCH) patterns in futures markets."
+
+def build_trade_prompt(trade_data: dict) -> str:
     """
-    Generate AI feedback for a trade using OpenAI API
-    
+    Build the user prompt for a trade
+
     Args:
-        trade_data: Dictionary containing trade information
-        
+        trade_data: Dictionary containing trade information, with the label of
+            its preceding BOS/CHoCH when it has one (structure_context.py)
+
     Returns:
-        AI-generated feedback string
+        Prompt string
     """
-    try:
-        # Construct the prompt
-        prompt = f"""
+    structure = describe(trade_data)
+    structure_line = f"Preceding Market Structure: {structure}" if structure else ""
+    return f"""
         Analyze this futures trade and provide professional feedback:
-        
+
         Instrument: {trade_data['instrument']}
         Direction: {trade_data['direction']}
         Entry Price: {trade_data['entry_price']}
         Stop Loss: {trade_data['stop_loss']}
         Take Profit: {trade_data['take_profit']}
         Risk/Reward: {trade_data.get('risk_reward', 'Not specified')}
-        
+        {structure_line}
+
         Trader's Notes: {trade_data.get('notes', 'No notes provided')}
-        
+
         Please provide feedback on:
         1. Risk management
         2. Trade setup and execution
         3. Areas for improvement
         4. Overall trade quality score (1-10)
         """
-        
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",  # or another appropriate model
-            messages=[
-                {"role": "system", "content": "You are an expert futures trading coach specializing in ES and NQ futures. You provide concise, actionable feedback on trades."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        feedback = response.choices[0].message.content
-        logger.info(f"Successfully generated AI feedback for {trade_data['instrument']} trade")
-        return feedback
-        
-    except Exception as e:
-        logger.error(f"Error generating AI feedback: {str(e)}")
-        raise
 
-def analyze_market_structure(structure_data: dict) -> str:
+def build_structure_prompt(structure_data: dict) -> str:
     """
-    Generate AI analysis for a market structure (BOS/CHoCH)
-    
+    Build the user prompt for a market structure
+
     Args:
         structure_data: Dictionary containing structure information
-        
+
     Returns:
-        AI-generated analysis string
+        Prompt string
     """
-    try:
-        # Construct the prompt
-        prompt = f"""
+    return f"""
         Analyze this market structure formation:
-        
+
         Instrument: {structure_data['instrument']}
         Type: {structure_data['structure_type']}
         Direction: {structure_data['direction']}
         Price Level: {structure_data['price_level']}
-        
+
         Notes: {structure_data.get('notes', 'No notes provided')}
-        
+
         Please provide analysis on:
         1. Significance of this structure
         2. Potential trading opportunities
         3. Key levels to watch
         4. Risk considerations
         """
-        
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",  # or another appropriate model
-            messages=[
-                {"role": "system", "content": "You are an expert in market structure analysis, specializing in Break of Structure (BOS) and Change of Character (CHoCH) patterns in futures markets."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.7
+
+def _cache_inputs(kind: str, data: dict, fields: tuple) -> dict:
+    """Select the fields a prompt depends on, so unrelated payload keys don't change the cache key"""
+    return {
+        "kind": kind,
+        "prompt_version": PROMPT_VERSION,
+        "fields": {field: data.get(field) for field in fields},
+    }
+
+def _compact_notes(data: dict) -> tuple:
+    """Data with its notes compacted/truncated for the prompt, and the token count of the notes"""
+    if not data.get('notes'):
+        return data, 0
+    notes, note_tokens = get_router().compact_notes(data['notes'])
+    return {**data, 'notes': notes}, note_tokens
+
+def _completion_request(system_prompt: str, prompt: str, cache_inputs: dict, route: Route) -> dict:
+    """Model parameters, messages and cache key for one completion"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": compact_prompt(prompt)}
+    ]
+    return {
+        "kind": cache_inputs["kind"],
+        "tier": route.tier,
+        "model": route.model,
+        "messages": messages,
+        "prompt_tokens": sum(get_router().count_tokens(m["content"]) for m in messages),
+        "max_tokens": route.max_tokens,
+        "temperature": TEMPERATURE,
+        "cache_key": make_cache_key(cache_inputs, route.model, TEMPERATURE, route.max_tokens),
+    }
+
+def trade_completion_request(trade_data: dict) -> dict:
+    """
+    Describe the completion used for trade feedback, so other callers (e.g. the
+    async backlog analyzer) share the prompt, model and cache key
+
+    Args:
+        trade_data: Dictionary containing trade information
+
+    Returns:
+        Dict with kind, tier, model, messages, prompt_tokens, max_tokens, temperature and cache_key
+    """
+    prompt_data, note_tokens = _compact_notes(trade_data)
+    return _completion_request(
+        TRADE_SYSTEM_PROMPT,
+        build_trade_prompt(prompt_data),
+        _cache_inputs("trade", trade_data, (
+            "instrument", "direction", "entry_price", "stop_loss", "take_profit", "risk_reward", "notes",
+            "structure_type", "structure_direction", "structure_price", "structure_at"
+        )),
+        get_router().route("trade", trade_data.get('instrument'), note_tokens)
+    )
+
+def structure_completion_request(structure_data: dict) -> dict:
+    """
+    Describe the completion used for structure analysis
+
+    Args:
+        structure_data: Dictionary containing structure information
+
+    Returns:
+        Dict with kind, tier, model, messages, prompt_tokens, max_tokens, temperature and cache_key
+    """
+    prompt_data, note_tokens = _compact_notes(structure_data)
+    return _completion_request(
+        STRUCTURE_SYSTEM_PROMPT,
+        build_structure_prompt(prompt_data),
+        _cache_inputs("structure", structure_data, ("instrument", "structure_type", "direction", "price_level", "notes")),
+        get_router().route("structure", structure_data.get('instrument'), note_tokens)
+    )
+
+def _complete(request: dict, bypass_cache: bool = False) -> str:
+    """
+    Run a chat completion through the LLM cache
+
+    Args:
+        request: Completion description from trade_completion_request / structure_completion_request
+        bypass_cache: Skip the cache lookup and always call the API (the result is still stored)
+
+    Returns:
+        Completion text
+    """
+    cache = get_cache()
+
+    if cache:
+        if bypass_cache:
+            cache.record_bypass()
+        else:
+            cached = cache.get(request["cache_key"])
+            if cached is not None:
+                logger.info(f"LLM cache hit for {request['kind']} prompt")
+                return cached
+
+    # Call OpenAI API
+    started = time.perf_counter()
+    try:
+        with tracing.stage("openai_completion"):
+            response = get_openai().chat.completions.create(
+                model=request["model"],
+                messages=request["messages"],
+                max_tokens=request["max_tokens"],
+                temperature=request["temperature"]
+            )
+    except Exception:
+        tracing.OPENAI_REQUESTS.inc(request["kind"], "error")
+        raise
+    tracing.record_openai_usage(request["kind"], request["model"], response.usage)
+    get_router().record(request, time.perf_counter() - started, response.usage)
+    completion = response.choices[0].message.content
+
+    if cache and completion:
+        cache.set(request["cache_key"], completion, time.perf_counter() - started)
+    return completion
+
+def _stream(request: dict, bypass_cache: bool = False) -> Iterator[str]:
+    """
+    Streamed counterpart of _complete: yield the completion text as it arrives
+
+    A cache hit is yielded as one chunk. The full text is stored in the cache
+    once the stream completes; an abandoned stream is not cached.
+
+    Args:
+        request: Completion description from trade_completion_request / structure_completion_request
+        bypass_cache: Skip the cache lookup and always call the API (the result is still stored)
+
+    Yields:
+        Pieces of the completion text
+    """
+    cache = get_cache()
+
+    if cache:
+        if bypass_cache:
+            cache.record_bypass()
+        else:
+            cached = cache.get(request["cache_key"])
+            if cached is not None:
+                logger.info(f"LLM cache hit for {request['kind']} prompt")
+                yield cached
+                return
+
+    started = time.perf_counter()
+    parts = []
+    usage = None
+    try:
+        with tracing.stage("openai_completion"):
+            response = get_openai().chat.completions.create(
+                model=request["model"],
+                messages=request["messages"],
+                max_tokens=request["max_tokens"],
+                temperature=request["temperature"],
+                stream=True,
+                # Token usage comes in a last chunk without choices
+                extra_body={"stream_options": {"include_usage": True}}
+            )
+            for chunk in response:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if not text:
+                    continue
+                if not parts:
+                    tracing.OPENAI_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, request["kind"])
+                parts.append(text)
+                yield text
+    except Exception:
+        tracing.OPENAI_REQUESTS.inc(request["kind"], "error")
+        raise
+    tracing.record_openai_usage(request["kind"], request["model"], usage)
+    get_router().record(request, time.perf_counter() - started, usage)
+    completion = "".join(parts)
+
+    if cache and completion:
+        cache.set(request["cache_key"], completion, time.perf_counter() - started)
+
+def _logged_stream(chunks: Iterator[str], done_message: str, error_message: str) -> Iterator[str]:
+    """Pass a stream through, logging its completion or its error like the non-streamed calls"""
+    try:
+        yield from chunks
+        logger.info(done_message)
+    except Exception as e:
+        logger.error(f"{error_message}: {str(e)}")
+        raise
+
+def generate_trade_feedback(trade_data: dict, bypass_cache: bool = False, stream: bool = False) -> Union[str, Iterator[str]]:
+    """
+    Generate AI feedback for a trade using OpenAI API
+
+    Args:
+        trade_data: Dictionary containing trade information
+        bypass_cache: Force a fresh completion instead of reusing a cached one
+        stream: Return an iterator yielding the feedback as it is generated
+
+    Returns:
+        AI-generated feedback string, or an iterator of its pieces when streaming
+    """
+    if stream:
+        return _logged_stream(
+            _stream(trade_completion_request(trade_data), bypass_cache=bypass_cache),
+            f"Successfully generated AI feedback for {trade_data['instrument']} trade",
+            "Error generating AI feedback"
         )
-        
-        analysis = response.choices[0].message.content
+    try:
+        feedback = _complete(trade_completion_request(trade_data), bypass_cache=bypass_cache)
+        logger.info(f"Successfully generated AI feedback for {trade_data['instrument']} trade")
+        return feedback
+
+    except Exception as e:
+        logger.error(f"Error generating AI feedback: {str(e)}")
+        raise
+
+def analyze_market_structure(structure_data: dict, bypass_cache: bool = False, stream: bool = False) -> Union[str, Iterator[str]]:
+    """
+    Generate AI analysis for a market structure (BOS/CHoCH)
+
+    Args:
+        structure_data: Dictionary containing structure information
+        bypass_cache: Force a fresh completion instead of reusing a cached one
+        stream: Return an iterator yielding the analysis as it is generated
+
+    Returns:
+        AI-generated analysis string, or an iterator of its pieces when streaming
+    """
+    if stream:
+        return _logged_stream(
+            _stream(structure_completion_request(structure_data), bypass_cache=bypass_cache),
+            f"Successfully generated structure analysis for {structure_data['instrument']}",
+            "Error generating structure analysis"
+        )
+    try:
+        analysis = _complete(structure_completion_request(structure_data), bypass_cache=bypass_cache)
         logger.info(f"Successfully generated structure analysis for {structure_data['instrument']}")
         return analysis
-        
+
     except Exception as e:
         logger.error(f"Error generating structure analysis: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
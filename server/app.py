@@ -1,19 +1,30 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import os
+import time
+import threading
+from functools import wraps
 from datetime import datetime
 import logging
 from dotenv import load_dotenv
 
 # Local imports
-from supabase_client import SupabaseClient
+from clients import LazyProxy, get_supabase_client, warm_up_in_background
 from ai_feedback import generate_trade_feedback, analyze_market_structure
-from screenshot_handler import save_base64_screenshot
+from payloads import PayloadError, decode_screenshot, parse_structure, parse_trade
+from screenshot_uploader import ScreenshotUploader
+from job_queue import JobQueue
+from llm_cache import get_cache
+from image_pipeline import get_pipeline
+from model_router import get_router
+from rate_limiter import get_rate_limiter, retry_after_header
+from idempotency import DuplicateRowError, get_idempotency_index, webhook_key
+from ingest_log import IngestLog, Replayer, follow_up_job_id, ingest_mode
+from sse import SSE_HEADERS, STREAMABLE_TABLES, sse_event
+from structure_context import get_structure_index
+import tracing
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (request id on every line, LOG_FORMAT=json for structured logs)
+tracing.configure_logging()
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -21,9 +32,192 @@ load_dotenv()
 
 # Initialize Flask app
 app = Flask(__name__)
-supabase = SupabaseClient()
+# Built on first use; the warm-up thread usually gets there before the first webhook
+supabase = LazyProxy(get_supabase_client)
+if os.getenv("CLIENT_WARMUP", "true").lower() == "true":
+    warm_up_in_background()
+job_queue = JobQueue()
+
+# Last BOS/CHoCH per instrument, to label incoming trades; structures still inside
+# the lookback are loaded in the background, later ones are added by the webhook
+structure_index = get_structure_index()
+if structure_index.enabled:
+    threading.Thread(
+        target=structure_index.load_recent, args=(supabase,), name="structure-index-load", daemon=True
+    ).start()
+
+def run_trade_feedback_job(payload: dict) -> dict:
+    """Generate AI feedback for a stored trade and save it on the row"""
+    tracing.start_request(payload.get('request_id'))
+    feedback = generate_trade_feedback(payload['data'])
+    supabase.update_ai_feedback('trades', payload['row_id'], feedback)
+    return {"ai_feedback": feedback}
+
+def run_structure_analysis_job(payload: dict) -> dict:
+    """Generate AI analysis for a stored structure and save it on the row"""
+    tracing.start_request(payload.get('request_id'))
+    analysis = analyze_market_structure(payload['data'])
+    supabase.update_ai_feedback('structures', payload['row_id'], analysis)
+    return {"ai_feedback": analysis}
+
+job_queue.register('trade_feedback', run_trade_feedback_job)
+job_queue.register('structure_analysis', run_structure_analysis_job)
+job_queue.start()
+
+# Screenshots are uploaded after the row insert, off the request path
+screenshot_uploader = ScreenshotUploader(supabase)
+screenshot_uploader.start()
+
+def queue_screenshot_upload(table: str, row_id: str, image_data) -> str:
+    """Hand a decoded screenshot to the background uploader"""
+    if image_data is None:
+        return None
+    try:
+        return screenshot_uploader.submit(table, row_id, image_data)
+    except Exception as e:
+        logger.error(f"Error queueing screenshot upload: {str(e)}")
+        return None
+
+def run_follow_ups(table: str, row: dict, image_data, ai_job: str) -> None:
+    """Upload the screenshot and queue the AI analysis of a row replayed from the ingest log"""
+    # Errors propagate: the entry keeps its image and its follow-ups are retried
+    if image_data is not None:
+        screenshot_uploader.submit(table, row['id'], image_data)
+    if ai_job:
+        data = {k: v for k, v in row.items() if k not in ('id', 'idempotency_key')}
+        job_queue.enqueue(
+            ai_job, {"row_id": row['id'], "data": data, "request_id": tracing.current_request_id()},
+            job_id=follow_up_job_id(ai_job, row['id'])
+        )
+
+# INGEST_MODE=wal: alerts are acknowledged once fsynced to the local ingest log,
+# the replayer stores them in Supabase in order (see ingest_log.py)
+ingest_log = IngestLog() if ingest_mode() == 'wal' else None
+replayer = Replayer(ingest_log, supabase, on_replayed=run_follow_ups) if ingest_log else None
+if replayer:
+    replayer.start()
+
+# Backlogs exposed on /metrics, read at scrape time
+tracing.registry.gauge(
+    "trademind_ai_jobs_pending", "AI jobs waiting in the job queue.", lambda: job_queue.stats()['depth']
+)
+tracing.registry.gauge(
+    "trademind_screenshot_uploads_pending", "Screenshots waiting to be uploaded.",
+    lambda: screenshot_uploader.stats()['pending']
+)
+if replayer:
+    tracing.registry.gauge(
+        "trademind_ingest_lag_seconds", "Age of the oldest ingest log entry not yet replayed.",
+        lambda: replayer.stats()['lag_s']
+    )
+
+WEBHOOK_ENDPOINTS = ('handle_trade', 'handle_structure')
+
+@app.before_request
+def start_trace():
+    """Give the request an id (the caller's X-Request-Id if any) and start its stage breakdown"""
+    g.started = time.perf_counter()
+    g.request_id = tracing.start_request(request.headers.get('X-Request-Id'))
+    if request.endpoint in WEBHOOK_ENDPOINTS:
+        tracing.observe_size('webhook_body', request.content_length)
+
+@app.after_request
+def finish_trace(response):
+    """Record the request duration, return the request id and log the stage breakdown of webhooks"""
+    elapsed = time.perf_counter() - g.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    tracing.REQUEST_SECONDS.observe(elapsed, route, str(response.status_code))
+    response.headers['X-Request-Id'] = g.request_id
+    stages = tracing.finish_request()
+    if request.endpoint in WEBHOOK_ENDPOINTS:
+        logger.info(
+            f"{request.method} {route} {response.status_code} in {elapsed * 1000:.1f} ms",
+            extra={'stages_ms': stages}
+        )
+    return response
+
+def admission_control(view):
+    """Apply the webhook rate limits before the handler: 429 with Retry-After when refused"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        limiter = get_rate_limiter()
+        if limiter is None:
+            return view(*args, **kwargs)
+
+        data = request.get_json(silent=True)
+        instrument = data.get('instrument') if isinstance(data, dict) else None
+        source = request.headers.get('X-Webhook-Source') or request.remote_addr
+        decision = limiter.admit(source, instrument)
+        if not decision.allowed:
+            logger.warning(f"Rejected webhook from {source} ({instrument}): {decision.limit} limit")
+            return jsonify({
+                'error': 'Rate limit exceeded',
+                'limit': decision.limit,
+                'retry_after': round(decision.retry_after, 2)
+            }), 429, {'Retry-After': retry_after_header(decision)}
+
+        try:
+            return view(*args, **kwargs)
+        finally:
+            limiter.release()
+    return wrapper
+
+def admit_ai_job() -> bool:
+    """Whether the AI analysis budget allows one more job"""
+    limiter = get_rate_limiter()
+    return limiter is None or limiter.admit_ai()
+
+def alert_key(table: str, data: dict, row: dict):
+    """Idempotency key of an alert (None when idempotency is disabled)"""
+    if get_idempotency_index() is None:
+        return None
+    return webhook_key(table, data, row, request.headers.get('Idempotency-Key'))
+
+def original_response(key):
+    """Response already given to this alert, or None if it is new"""
+    if key is None:
+        return None
+    try:
+        with tracing.stage('idempotency_lookup'):
+            return get_idempotency_index().get(key.index_key)
+    except Exception as e:
+        logger.error(f"Error reading idempotency index: {str(e)}")
+        return None
+
+def remember_response(key, response_data: dict) -> None:
+    """Record the response so a retry of the alert gets it back"""
+    if key is None:
+        return
+    try:
+        get_idempotency_index().set(key.index_key, response_data, key.ttl)
+    except Exception as e:
+        logger.error(f"Error writing idempotency index: {str(e)}")
+
+def replay(response_data: dict):
+    """Answer a duplicate alert with the original response, without touching Supabase or OpenAI"""
+    return jsonify(response_data), 200, {'Idempotent-Replayed': 'true'}
+
+def log_alert(table: str, row: dict, key, image_data, ai_job: str):
+    """Acknowledge an alert once it is durably in the ingest log; Supabase gets it from the replayer"""
+    ai_rate_limited = bool(ai_job) and not admit_ai_job()
+    if key:
+        row = {**row, 'idempotency_key': key.row_key}
+    with tracing.stage('ingest_append'):
+        entry = ingest_log.append(table, row, image_data, None if ai_rate_limited else ai_job)
+    replayer.wake()
+    if table == 'structures':
+        # Indexed at acknowledgement: a trade logged right after it gets labeled
+        structure_index.add(entry['row'])
+
+    response_data = {**entry['row'], 'ingest_seq': entry['seq'], 'status': 'queued'}
+    if ai_rate_limited:
+        # Over the AI budget: the row is kept, the backlog analyzer can fill it later
+        response_data['ai_rate_limited'] = True
+    remember_response(key, response_data)
+    return jsonify(response_data), 202
 
 @app.route('/webhook/structure', methods=['POST'])
+@admission_control
 def handle_structure():
     """
     Webhook endpoint for receiving BOS/ChoCH structure signals from TradingView
@@ -39,53 +233,59 @@ def handle_structure():
     """
     try:
         data = request.json
-        required_fields = ['instrument', 'structure_type', 'price_level', 'direction']
-        
-        # Validate required fields
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-                
-        # Validate structure_type
-        if data['structure_type'] not in ['BOS', 'CHoCH']:
-            return jsonify({'error': 'Invalid structure_type. Must be BOS or CHoCH'}), 400
-            
-        # Validate direction
-        if data['direction'] not in ['BULLISH', 'BEARISH']:
-            return jsonify({'error': 'Invalid direction. Must be BULLISH or BEARISH'}), 400
-
-        # Handle screenshot if provided
-        screenshot_url = None
-        if data.get('screenshot'):
-            try:
-                screenshot_url = save_base64_screenshot(data['screenshot'])
-                logger.info(f"Screenshot saved successfully: {screenshot_url}")
-            except Exception as e:
-                logger.error(f"Error saving screenshot: {str(e)}")
+
+        # Validate the payload and build the row (shared with async_app.py)
+        try:
+            with tracing.stage('parse_payload'):
+                structure_data = parse_structure(data)
+        except PayloadError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # A retried alert gets the original response back
+        key = alert_key('structures', data, structure_data)
+        original = original_response(key)
+        if original is not None:
+            logger.info(f"Duplicate structure alert on {data['instrument']}, replaying the original response")
+            return replay(original)
+
+        # Decode the screenshot now, upload it once the row exists
+        image_data = decode_screenshot(data)
+
+        if ingest_log is not None:
+            return log_alert('structures', structure_data, key, image_data, 'structure_analysis' if data.get('notes') else None)
 
         # Insert structure into Supabase
-        structure_data = {
-            "instrument": data['instrument'],
-            "structure_type": data['structure_type'],
-            "price_level": float(data['price_level']),
-            "direction": data['direction'],
-            "screenshot_url": screenshot_url,
-            "notes": data.get('notes')
-        }
-        
-        result = supabase.insert_structure(**structure_data)
+        try:
+            result = supabase.insert_structure(**structure_data, idempotency_key=key.row_key if key else None)
+        except DuplicateRowError as e:
+            # Same alert inserted concurrently: caught by the unique idempotency_key constraint
+            get_idempotency_index().record_conflict()
+            remember_response(key, e.row)
+            return replay(e.row)
+        structure_index.add(result)
+        upload_id = queue_screenshot_upload('structures', result['id'], image_data)
 
-        # Generate AI analysis if notes are provided
-        analysis = None
+        # Queue AI analysis if notes are provided
+        job_id = None
+        ai_rate_limited = False
         if data.get('notes'):
-            try:
-                analysis = analyze_market_structure(data)
-                # TODO: Update the structure with AI analysis
-                logger.info("AI analysis generated successfully")
-            except Exception as e:
-                logger.error(f"Error generating AI analysis: {str(e)}")
+            if admit_ai_job():
+                try:
+                    job_id = job_queue.enqueue('structure_analysis', {
+                        "row_id": result['id'], "data": structure_data, "request_id": tracing.current_request_id()
+                    })
+                except Exception as e:
+                    logger.error(f"Error queueing AI analysis: {str(e)}")
+            else:
+                # Over the AI budget: the row is kept, the backlog analyzer can fill it later
+                ai_rate_limited = True
         
-        response_data = {**result, "ai_analysis": analysis} if analysis else result
+        response_data = {**result, "ai_job_id": job_id} if job_id else result
+        if ai_rate_limited:
+            response_data = {**response_data, "ai_rate_limited": True}
+        if upload_id:
+            response_data = {**response_data, "screenshot_upload_id": upload_id}
+        remember_response(key, response_data)
         logger.info(f"Successfully processed structure: {data['structure_type']} on {data['instrument']}")
         return jsonify(response_data), 201
         
@@ -94,6 +294,7 @@ def handle_structure():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/webhook/trade', methods=['POST'])
+@admission_control
 def handle_trade():
     """
     Webhook endpoint for receiving trade execution signals from TradingView
@@ -111,61 +312,62 @@ def handle_trade():
     """
     try:
         data = request.json
-        required_fields = ['instrument', 'direction', 'entry_price', 'stop_loss', 'take_profit']
-        
-        # Validate required fields
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-                
-        # Validate direction
-        if data['direction'] not in ['LONG', 'SHORT']:
-            return jsonify({'error': 'Invalid direction. Must be LONG or SHORT'}), 400
-
-        # Handle screenshot if provided
-        screenshot_url = None
-        if data.get('screenshot'):
-            try:
-                screenshot_url = save_base64_screenshot(data['screenshot'])
-                logger.info(f"Screenshot saved successfully: {screenshot_url}")
-            except Exception as e:
-                logger.error(f"Error saving screenshot: {str(e)}")
-
-        # Calculate risk/reward if not provided
-        risk_reward = data.get('risk_reward')
-        if not risk_reward:
-            entry = float(data['entry_price'])
-            sl = float(data['stop_loss'])
-            tp = float(data['take_profit'])
-            risk = abs(entry - sl)
-            reward = abs(tp - entry)
-            risk_reward = round(reward / risk, 2) if risk != 0 else 0
+
+        # Validate the payload, compute the risk/reward if missing (shared with async_app.py)
+        try:
+            with tracing.stage('parse_payload'):
+                trade_data = parse_trade(data)
+        except PayloadError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # A retried alert gets the original response back
+        key = alert_key('trades', data, trade_data)
+        original = original_response(key)
+        if original is not None:
+            logger.info(f"Duplicate trade alert on {data['instrument']}, replaying the original response")
+            return replay(original)
+
+        # Decode the screenshot now, upload it once the row exists
+        image_data = decode_screenshot(data)
+
+        # Label the trade with the last BOS/CHoCH on its instrument (context of the AI feedback)
+        with tracing.stage('structure_lookup'):
+            trade_data = {**trade_data, **structure_index.label(trade_data)}
+
+        if ingest_log is not None:
+            return log_alert('trades', trade_data, key, image_data, 'trade_feedback' if data.get('notes') else None)
 
         # Insert trade into Supabase
-        trade_data = {
-            "instrument": data['instrument'],
-            "direction": data['direction'],
-            "entry_price": float(data['entry_price']),
-            "stop_loss": float(data['stop_loss']),
-            "take_profit": float(data['take_profit']),
-            "screenshot_url": screenshot_url,
-            "notes": data.get('notes'),
-            "risk_reward": risk_reward
-        }
-        
-        result = supabase.insert_trade(**trade_data)
+        try:
+            result = supabase.insert_trade(**trade_data, idempotency_key=key.row_key if key else None)
+        except DuplicateRowError as e:
+            # Same alert inserted concurrently: caught by the unique idempotency_key constraint
+            get_idempotency_index().record_conflict()
+            remember_response(key, e.row)
+            return replay(e.row)
+        upload_id = queue_screenshot_upload('trades', result['id'], image_data)
         
-        # Generate AI feedback if notes are provided
-        feedback = None
+        # Queue AI feedback if notes are provided
+        job_id = None
+        ai_rate_limited = False
         if data.get('notes'):
-            try:
-                feedback = generate_trade_feedback(data)
-                # TODO: Update the trade with AI feedback
-                logger.info("AI feedback generated successfully")
-            except Exception as e:
-                logger.error(f"Error generating AI feedback: {str(e)}")
+            if admit_ai_job():
+                try:
+                    job_id = job_queue.enqueue('trade_feedback', {
+                        "row_id": result['id'], "data": trade_data, "request_id": tracing.current_request_id()
+                    })
+                except Exception as e:
+                    logger.error(f"Error queueing AI feedback: {str(e)}")
+            else:
+                # Over the AI budget: the row is kept, the backlog analyzer can fill it later
+                ai_rate_limited = True
         
-        response_data = {**result, "ai_feedback": feedback} if feedback else result
+        response_data = {**result, "ai_job_id": job_id} if job_id else result
+        if ai_rate_limited:
+            response_data = {**response_data, "ai_rate_limited": True}
+        if upload_id:
+            response_data = {**response_data, "screenshot_upload_id": upload_id}
+        remember_response(key, response_data)
         logger.info(f"Successfully processed trade: {data['direction']} {data['instrument']}")
         return jsonify(response_data), 201
         
@@ -173,6 +375,121 @@ def handle_trade():
         logger.error(f"Error processing trade webhook: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/ai/stream/<table>/<row_id>')
+def stream_analysis(table, row_id):
+    """
+    Stream the AI analysis of a stored trade or structure as server-sent events:
+    `token` events with the text as it is generated, then `done` with the full
+    text (saved on the row) and the time to first token, or `error`.
+    `?force=1` skips the LLM cache.
+    """
+    if table not in STREAMABLE_TABLES:
+        return jsonify({'error': f'Unknown table: {table}'}), 404
+    try:
+        row = supabase.get_row(table, row_id)
+    except Exception as e:
+        logger.error(f"Error fetching {table} row {row_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    if row is None:
+        return jsonify({'error': 'Row not found'}), 404
+    if not admit_ai_job():
+        return jsonify({'error': 'Rate limit exceeded', 'limit': 'ai'}), 429
+
+    bypass_cache = request.args.get('force', '').lower() in ('1', 'true', 'yes')
+    generate = generate_trade_feedback if table == 'trades' else analyze_market_structure
+
+    def events():
+        started = time.perf_counter()
+        first_token_ms = None
+        parts = []
+        try:
+            for text in generate(row, bypass_cache=bypass_cache, stream=True):
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(text)
+                yield sse_event('token', {'text': text})
+            feedback = ''.join(parts)
+            supabase.update_ai_feedback(table, row_id, feedback)
+            total_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(f"Streamed AI analysis of {table} row {row_id}: first token {first_token_ms} ms, done in {total_ms} ms")
+            yield sse_event('done', {'id': row_id, 'ai_feedback': feedback, 'first_token_ms': first_token_ms, 'total_ms': total_ms})
+        except Exception as e:
+            logger.error(f"Error streaming AI analysis: {str(e)}")
+            yield sse_event('error', {'error': str(e)})
+
+    return Response(stream_with_context(events()), headers=SSE_HEADERS)
+
+@app.route('/jobs/stats')
+def job_stats():
+    """Queue depth and wait/processing latency of the AI analysis jobs"""
+    return jsonify(job_queue.stats())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status of a single AI analysis job"""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    return jsonify(job)
+
+@app.route('/ai/cache/stats')
+def ai_cache_stats():
+    """Hit/miss counters of the LLM feedback cache"""
+    cache = get_cache()
+    if cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **cache.stats()})
+
+@app.route('/ai/routing/stats')
+def ai_routing_stats():
+    """Model tier rules, and calls, tokens, cost and latency per tier"""
+    return jsonify(get_router().stats())
+
+@app.route('/structures/index/stats')
+def structure_index_stats():
+    """Structures indexed per instrument and trades labeled with one"""
+    return jsonify(structure_index.stats())
+
+@app.route('/screenshots/stats')
+def screenshot_stats():
+    """Screenshot pipeline savings and processing time, pending uploads and upload latency"""
+    return jsonify({**get_pipeline().stats(), "uploads": screenshot_uploader.stats()})
+
+@app.route('/idempotency/stats')
+def idempotency_stats():
+    """Duplicate alerts answered from the idempotency index or caught by the database"""
+    index = get_idempotency_index()
+    if index is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **index.stats()})
+
+@app.route('/ingest/stats')
+def ingest_stats():
+    """Replay lag of the ingest log (pending entries, age of the oldest) and fsync/replay latency"""
+    if replayer is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **replayer.stats()})
+
+@app.route('/rate-limits/stats')
+def rate_limit_stats():
+    """Admitted and rejected webhooks per limit, and the AI budget counters"""
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **limiter.stats()})
+
+@app.route('/supabase/batch/stats')
+def supabase_batch_stats():
+    """Batch sizes and flush latency of the Supabase batch writer"""
+    if supabase.batch_writer is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **supabase.batch_writer.stats()})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics: request and stage latency histograms, payload sizes, OpenAI tokens, backlogs"""
+    return Response(tracing.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/test-supabase')
 def test_supabase():
     try:
@@ -0,0 +1,527 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+from functools import wraps
+import aiohttp
+from aiohttp import web
+from dotenv import load_dotenv
+
+# Local imports
+from clients import create_aiohttp_session, get_supabase_client
+from async_supabase import AsyncSupabaseClient
+from async_openai import cached_completion, stream_cached_completion
+from ai_feedback import structure_completion_request, trade_completion_request
+from payloads import PayloadError, decode_screenshot, parse_structure, parse_trade
+from screenshot_uploader import ScreenshotUploader
+from job_queue import JobQueue
+from llm_cache import get_cache
+from image_pipeline import get_pipeline
+from model_router import get_router
+from rate_limiter import get_rate_limiter, retry_after_header
+from idempotency import DuplicateRowError, get_idempotency_index, webhook_key
+from ingest_log import IngestLog, Replayer, follow_up_job_id, ingest_mode
+from sse import SSE_HEADERS, STREAMABLE_TABLES, sse_event
+from structure_context import get_structure_index
+import tracing
+
+# Configure logging (request id on every line, LOG_FORMAT=json for structured logs)
+tracing.configure_logging()
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Async variant of app.py: same webhook contracts, but every outbound call
+# (PostgREST, Storage, OpenAI) is awaited on one event loop instead of
+# holding a thread, so a burst of alerts does not queue behind a thread pool.
+# AI jobs and screenshot uploads go through the same durable JobQueue and
+# spool as the Flask server, driven by coroutines instead of threads.
+
+SESSION = web.AppKey("session", aiohttp.ClientSession)
+SUPABASE = web.AppKey("supabase", AsyncSupabaseClient)
+JOB_QUEUE = web.AppKey("job_queue", JobQueue)
+UPLOADER = web.AppKey("screenshot_uploader", ScreenshotUploader)
+REPLAYER = web.AppKey("replayer", Replayer)
+
+
+async def background_services(app: web.Application):
+    """Open the shared aiohttp session and run the AI jobs and screenshot uploads for the app's lifetime"""
+    session = create_aiohttp_session()
+    supabase = AsyncSupabaseClient(session)
+    job_queue = JobQueue()
+    uploader = ScreenshotUploader(supabase)
+
+    async def run_trade_feedback_job(payload: dict) -> dict:
+        """Generate AI feedback for a stored trade and save it on the row"""
+        tracing.start_request(payload.get('request_id'))
+        feedback = await cached_completion(session, trade_completion_request(payload['data']))
+        await supabase.update_ai_feedback('trades', payload['row_id'], feedback)
+        return {"ai_feedback": feedback}
+
+    async def run_structure_analysis_job(payload: dict) -> dict:
+        """Generate AI analysis for a stored structure and save it on the row"""
+        tracing.start_request(payload.get('request_id'))
+        analysis = await cached_completion(session, structure_completion_request(payload['data']))
+        await supabase.update_ai_feedback('structures', payload['row_id'], analysis)
+        return {"ai_feedback": analysis}
+
+    job_queue.register('trade_feedback', run_trade_feedback_job)
+    job_queue.register('structure_analysis', run_structure_analysis_job)
+
+    app[SESSION] = session
+    app[SUPABASE] = supabase
+    app[JOB_QUEUE] = job_queue
+    app[UPLOADER] = uploader
+
+    tasks = [
+        asyncio.create_task(job_queue.run_async(int(os.getenv("ASYNC_JOB_CONCURRENCY", "16")))),
+        asyncio.create_task(uploader.run_async(int(os.getenv("ASYNC_UPLOAD_CONCURRENCY", "16")))),
+    ]
+    # Structures still inside the lookback, to label incoming trades (later ones are added by the webhook)
+    if get_structure_index().enabled:
+        tasks.append(asyncio.create_task(asyncio.to_thread(get_structure_index().load_recent, get_supabase_client())))
+
+    # INGEST_MODE=wal: the replayer is a thread using the pooled sync client, batching
+    # matters more than awaiting there; its follow-ups feed the coroutine workers above
+    replayer = None
+    if ingest_mode() == 'wal':
+        def run_follow_ups(table: str, row: dict, image_data, ai_job: str) -> None:
+            """Upload the screenshot and queue the AI analysis of a row replayed from the ingest log"""
+            if image_data is not None:
+                uploader.submit(table, row['id'], image_data)
+            if ai_job:
+                data = {k: v for k, v in row.items() if k not in ('id', 'idempotency_key')}
+                job_queue.enqueue(
+                    ai_job, {"row_id": row['id'], "data": data, "request_id": tracing.current_request_id()},
+                    job_id=follow_up_job_id(ai_job, row['id'])
+                )
+
+        replayer = Replayer(IngestLog(), get_supabase_client(), on_replayed=run_follow_ups)
+        replayer.start()
+        app[REPLAYER] = replayer
+
+    # Backlogs exposed on /metrics, read at scrape time
+    tracing.registry.gauge(
+        "trademind_ai_jobs_pending", "AI jobs waiting in the job queue.", lambda: job_queue.stats()['depth']
+    )
+    tracing.registry.gauge(
+        "trademind_screenshot_uploads_pending", "Screenshots waiting to be uploaded.",
+        lambda: uploader.stats()['pending']
+    )
+    if replayer is not None:
+        tracing.registry.gauge(
+            "trademind_ingest_lag_seconds", "Age of the oldest ingest log entry not yet replayed.",
+            lambda: replayer.stats()['lag_s']
+        )
+    yield
+
+    if replayer is not None:
+        await asyncio.to_thread(replayer.stop)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await session.close()
+
+
+async def queue_screenshot_upload(app: web.Application, table: str, row_id: str, image_data) -> str:
+    """Hand a decoded screenshot to the background uploader"""
+    if image_data is None:
+        return None
+    try:
+        return await asyncio.to_thread(app[UPLOADER].submit, table, row_id, image_data)
+    except Exception as e:
+        logger.error(f"Error queueing screenshot upload: {str(e)}")
+        return None
+
+
+async def queue_ai_job(app: web.Application, kind: str, row_id: str, data: dict) -> str:
+    """Persist an AI job; returns None if it could not be queued"""
+    try:
+        payload = {"row_id": row_id, "data": data, "request_id": tracing.current_request_id()}
+        return await asyncio.to_thread(app[JOB_QUEUE].enqueue, kind, payload)
+    except Exception as e:
+        logger.error(f"Error queueing {kind} job: {str(e)}")
+        return None
+
+
+@web.middleware
+async def trace_requests(request: web.Request, handler) -> web.StreamResponse:
+    """Give the request an id (the caller's X-Request-Id if any), time it and log the stage breakdown of webhooks"""
+    started = time.perf_counter()
+    request_id = tracing.start_request(request.headers.get('X-Request-Id'))
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'unmatched'
+    webhook = route.startswith('/webhook/')
+    if webhook:
+        tracing.observe_size('webhook_body', request.content_length)
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        response.headers['X-Request-Id'] = request_id
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        tracing.REQUEST_SECONDS.observe(elapsed, route, str(status))
+        stages = tracing.finish_request()
+        if webhook:
+            logger.info(f"{request.method} {route} {status} in {elapsed * 1000:.1f} ms", extra={'stages_ms': stages})
+
+
+def admission_control(handler):
+    """Apply the webhook rate limits before the handler: 429 with Retry-After when refused"""
+    @wraps(handler)
+    async def wrapper(request: web.Request) -> web.Response:
+        limiter = get_rate_limiter()
+        if limiter is None:
+            return await handler(request)
+
+        try:
+            data = await request.json()
+        except Exception:
+            data = None
+        instrument = data.get('instrument') if isinstance(data, dict) else None
+        source = request.headers.get('X-Webhook-Source') or request.remote
+        decision = await asyncio.to_thread(limiter.admit, source, instrument)
+        if not decision.allowed:
+            logger.warning(f"Rejected webhook from {source} ({instrument}): {decision.limit} limit")
+            return web.json_response({
+                'error': 'Rate limit exceeded',
+                'limit': decision.limit,
+                'retry_after': round(decision.retry_after, 2)
+            }, status=429, headers={'Retry-After': retry_after_header(decision)})
+
+        try:
+            return await handler(request)
+        finally:
+            limiter.release()
+    return wrapper
+
+
+async def admit_ai_job() -> bool:
+    """Whether the AI analysis budget allows one more job"""
+    limiter = get_rate_limiter()
+    return limiter is None or await asyncio.to_thread(limiter.admit_ai)
+
+
+def alert_key(request: web.Request, table: str, data: dict, row: dict):
+    """Idempotency key of an alert (None when idempotency is disabled)"""
+    if get_idempotency_index() is None:
+        return None
+    return webhook_key(table, data, row, request.headers.get('Idempotency-Key'))
+
+
+async def original_response(key):
+    """Response already given to this alert, or None if it is new"""
+    if key is None:
+        return None
+    try:
+        with tracing.stage('idempotency_lookup'):
+            return await asyncio.to_thread(get_idempotency_index().get, key.index_key)
+    except Exception as e:
+        logger.error(f"Error reading idempotency index: {str(e)}")
+        return None
+
+
+async def remember_response(key, response_data: dict) -> None:
+    """Record the response so a retry of the alert gets it back"""
+    if key is None:
+        return
+    try:
+        await asyncio.to_thread(get_idempotency_index().set, key.index_key, response_data, key.ttl)
+    except Exception as e:
+        logger.error(f"Error writing idempotency index: {str(e)}")
+
+
+def replay(response_data: dict) -> web.Response:
+    """Answer a duplicate alert with the original response, without touching Supabase or OpenAI"""
+    return web.json_response(response_data, status=200, headers={'Idempotent-Replayed': 'true'})
+
+
+async def log_alert(app: web.Application, table: str, row: dict, key, image_data, ai_job: str) -> web.Response:
+    """Acknowledge an alert once it is durably in the ingest log; Supabase gets it from the replayer"""
+    ai_rate_limited = bool(ai_job) and not await admit_ai_job()
+    if key:
+        row = {**row, 'idempotency_key': key.row_key}
+    replayer = app[REPLAYER]
+    with tracing.stage('ingest_append'):
+        entry = await asyncio.to_thread(replayer.log.append, table, row, image_data, None if ai_rate_limited else ai_job)
+    replayer.wake()
+    if table == 'structures':
+        # Indexed at acknowledgement: a trade logged right after it gets labeled
+        get_structure_index().add(entry['row'])
+
+    response_data = {**entry['row'], 'ingest_seq': entry['seq'], 'status': 'queued'}
+    if ai_rate_limited:
+        # Over the AI budget: the row is kept, the backlog analyzer can fill it later
+        response_data['ai_rate_limited'] = True
+    await remember_response(key, response_data)
+    return web.json_response(response_data, status=202)
+
+
+@admission_control
+async def handle_structure(request: web.Request) -> web.Response:
+    """Webhook endpoint for BOS/ChoCH structure signals (same contract as app.py)"""
+    try:
+        data = await request.json()
+
+        try:
+            with tracing.stage('parse_payload'):
+                structure_data = parse_structure(data)
+        except PayloadError as e:
+            return web.json_response({'error': str(e)}, status=400)
+
+        # A retried alert gets the original response back
+        key = alert_key(request, 'structures', data, structure_data)
+        original = await original_response(key)
+        if original is not None:
+            logger.info(f"Duplicate structure alert on {data['instrument']}, replaying the original response")
+            return replay(original)
+
+        # Decode the screenshot now, upload it once the row exists
+        image_data = decode_screenshot(data)
+
+        if REPLAYER in request.app:
+            return await log_alert(request.app, 'structures', structure_data, key, image_data, 'structure_analysis' if data.get('notes') else None)
+
+        try:
+            row = {**structure_data, "idempotency_key": key.row_key} if key else structure_data
+            result = await request.app[SUPABASE].insert_structure(**row)
+        except DuplicateRowError as e:
+            # Same alert inserted concurrently: caught by the unique idempotency_key constraint
+            get_idempotency_index().record_conflict()
+            await remember_response(key, e.row)
+            return replay(e.row)
+        get_structure_index().add(result)
+        upload_id = await queue_screenshot_upload(request.app, 'structures', result['id'], image_data)
+
+        # Queue AI analysis if notes are provided
+        job_id = None
+        ai_rate_limited = False
+        if data.get('notes'):
+            if await admit_ai_job():
+                job_id = await queue_ai_job(request.app, 'structure_analysis', result['id'], structure_data)
+            else:
+                # Over the AI budget: the row is kept, the backlog analyzer can fill it later
+                ai_rate_limited = True
+
+        response_data = {**result, "ai_job_id": job_id} if job_id else result
+        if ai_rate_limited:
+            response_data = {**response_data, "ai_rate_limited": True}
+        if upload_id:
+            response_data = {**response_data, "screenshot_upload_id": upload_id}
+        await remember_response(key, response_data)
+        logger.info(f"Successfully processed structure: {data['structure_type']} on {data['instrument']}")
+        return web.json_response(response_data, status=201)
+
+    except Exception as e:
+        logger.error(f"Error processing structure webhook: {str(e)}")
+        return web.json_response({'error': str(e)}, status=500)
+
+
+@admission_control
+async def handle_trade(request: web.Request) -> web.Response:
+    """Webhook endpoint for trade execution signals (same contract as app.py)"""
+    try:
+        data = await request.json()
+
+        try:
+            with tracing.stage('parse_payload'):
+                trade_data = parse_trade(data)
+        except PayloadError as e:
+            return web.json_response({'error': str(e)}, status=400)
+
+        # A retried alert gets the original response back
+        key = alert_key(request, 'trades', data, trade_data)
+        original = await original_response(key)
+        if original is not None:
+            logger.info(f"Duplicate trade alert on {data['instrument']}, replaying the original response")
+            return replay(original)
+
+        # Decode the screenshot now, upload it once the row exists
+        image_data = decode_screenshot(data)
+
+        # Label the trade with the last BOS/CHoCH on its instrument (context of the AI feedback)
+        with tracing.stage('structure_lookup'):
+            trade_data = {**trade_data, **get_structure_index().label(trade_data)}
+
+        if REPLAYER in request.app:
+            return await log_alert(request.app, 'trades', trade_data, key, image_data, 'trade_feedback' if data.get('notes') else None)
+
+        try:
+            row = {**trade_data, "idempotency_key": key.row_key} if key else trade_data
+            result = await request.app[SUPABASE].insert_trade(**row)
+        except DuplicateRowError as e:
+            # Same alert inserted concurrently: caught by the unique idempotency_key constraint
+            get_idempotency_index().record_conflict()
+            await remember_response(key, e.row)
+            return replay(e.row)
+        upload_id = await queue_screenshot_upload(request.app, 'trades', result['id'], image_data)
+
+        # Queue AI feedback if notes are provided
+        job_id = None
+        ai_rate_limited = False
+        if data.get('notes'):
+            if await admit_ai_job():
+                job_id = await queue_ai_job(request.app, 'trade_feedback', result['id'], trade_data)
+            else:
+                # Over the AI budget: the row is kept, the backlog analyzer can fill it later
+                ai_rate_limited = True
+
+        response_data = {**result, "ai_job_id": job_id} if job_id else result
+        if ai_rate_limited:
+            response_data = {**response_data, "ai_rate_limited": True}
+        if upload_id:
+            response_data = {**response_data, "screenshot_upload_id": upload_id}
+        await remember_response(key, response_data)
+        logger.info(f"Successfully processed trade: {data['direction']} {data['instrument']}")
+        return web.json_response(response_data, status=201)
+
+    except Exception as e:
+        logger.error(f"Error processing trade webhook: {str(e)}")
+        return web.json_response({'error': str(e)}, status=500)
+
+
+async def stream_analysis(request: web.Request) -> web.StreamResponse:
+    """Stream the AI analysis of a stored trade or structure as server-sent events (same contract as app.py)"""
+    table, row_id = request.match_info['table'], request.match_info['row_id']
+    if table not in STREAMABLE_TABLES:
+        return web.json_response({'error': f'Unknown table: {table}'}, status=404)
+    supabase = request.app[SUPABASE]
+    try:
+        row = await supabase.get_row(table, row_id)
+    except Exception as e:
+        logger.error(f"Error fetching {table} row {row_id}: {str(e)}")
+        return web.json_response({'error': str(e)}, status=500)
+    if row is None:
+        return web.json_response({'error': 'Row not found'}, status=404)
+    if not await admit_ai_job():
+        return web.json_response({'error': 'Rate limit exceeded', 'limit': 'ai'}, status=429)
+
+    bypass_cache = request.query.get('force', '').lower() in ('1', 'true', 'yes')
+    build_request = trade_completion_request if table == 'trades' else structure_completion_request
+    response = web.StreamResponse(headers=SSE_HEADERS)
+    await response.prepare(request)
+
+    started = time.perf_counter()
+    first_token_ms = None
+    parts = []
+    try:
+        async for text in stream_cached_completion(request.app[SESSION], build_request(row), bypass_cache=bypass_cache):
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+            parts.append(text)
+            await response.write(sse_event('token', {'text': text}).encode())
+        feedback = ''.join(parts)
+        await supabase.update_ai_feedback(table, row_id, feedback)
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Streamed AI analysis of {table} row {row_id}: first token {first_token_ms} ms, done in {total_ms} ms")
+        await response.write(sse_event('done', {'id': row_id, 'ai_feedback': feedback, 'first_token_ms': first_token_ms, 'total_ms': total_ms}).encode())
+    except ConnectionResetError:
+        # Client went away: nothing left to send
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming AI analysis: {str(e)}")
+        await response.write(sse_event('error', {'error': str(e)}).encode())
+    await response.write_eof()
+    return response
+
+
+async def job_stats(request: web.Request) -> web.Response:
+    """Queue depth and wait/processing latency of the AI analysis jobs"""
+    return web.json_response(await asyncio.to_thread(request.app[JOB_QUEUE].stats))
+
+
+async def job_status(request: web.Request) -> web.Response:
+    """Status of a single AI analysis job"""
+    job_id = request.match_info['job_id']
+    job = await asyncio.to_thread(request.app[JOB_QUEUE].get_job, job_id)
+    if job is None:
+        return web.json_response({'error': f'Unknown job: {job_id}'}, status=404)
+    return web.json_response(job)
+
+
+async def ai_cache_stats(request: web.Request) -> web.Response:
+    """Hit/miss counters of the LLM feedback cache"""
+    cache = get_cache()
+    if cache is None:
+        return web.json_response({'enabled': False})
+    return web.json_response({'enabled': True, **cache.stats()})
+
+
+async def ai_routing_stats(request: web.Request) -> web.Response:
+    """Model tier rules, and calls, tokens, cost and latency per tier"""
+    return web.json_response(get_router().stats())
+
+
+async def structure_index_stats(request: web.Request) -> web.Response:
+    """Structures indexed per instrument and trades labeled with one"""
+    return web.json_response(get_structure_index().stats())
+
+
+async def screenshot_stats(request: web.Request) -> web.Response:
+    """Screenshot pipeline savings and processing time, pending uploads and upload latency"""
+    return web.json_response({**get_pipeline().stats(), "uploads": request.app[UPLOADER].stats()})
+
+
+async def idempotency_stats(request: web.Request) -> web.Response:
+    """Duplicate alerts answered from the idempotency index or caught by the database"""
+    index = get_idempotency_index()
+    if index is None:
+        return web.json_response({'enabled': False})
+    return web.json_response({'enabled': True, **await asyncio.to_thread(index.stats)})
+
+
+async def ingest_stats(request: web.Request) -> web.Response:
+    """Replay lag of the ingest log (pending entries, age of the oldest) and fsync/replay latency"""
+    if REPLAYER not in request.app:
+        return web.json_response({'enabled': False})
+    return web.json_response({'enabled': True, **await asyncio.to_thread(request.app[REPLAYER].stats)})
+
+
+async def rate_limit_stats(request: web.Request) -> web.Response:
+    """Admitted and rejected webhooks per limit, and the AI budget counters"""
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return web.json_response({'enabled': False})
+    return web.json_response({'enabled': True, **limiter.stats()})
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """Prometheus metrics: request and stage latency histograms, payload sizes, OpenAI tokens, backlogs"""
+    # Rendering reads the job queue and ingest log gauges from SQLite
+    body = await asyncio.to_thread(tracing.registry.render)
+    return web.Response(body=body.encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+def create_app() -> web.Application:
+    """Build the aiohttp application"""
+    app = web.Application(middlewares=[trace_requests], client_max_size=int(os.getenv("ASYNC_MAX_BODY_BYTES", str(20 * 1024 * 1024))))
+    app.cleanup_ctx.append(background_services)
+    app.router.add_post('/webhook/structure', handle_structure)
+    app.router.add_post('/webhook/trade', handle_trade)
+    app.router.add_get('/ai/stream/{table}/{row_id}', stream_analysis)
+    app.router.add_get('/jobs/stats', job_stats)
+    app.router.add_get('/jobs/{job_id}', job_status)
+    app.router.add_get('/ai/cache/stats', ai_cache_stats)
+    app.router.add_get('/ai/routing/stats', ai_routing_stats)
+    app.router.add_get('/structures/index/stats', structure_index_stats)
+    app.router.add_get('/screenshots/stats', screenshot_stats)
+    app.router.add_get('/rate-limits/stats', rate_limit_stats)
+    app.router.add_get('/idempotency/stats', idempotency_stats)
+    app.router.add_get('/ingest/stats', ingest_stats)
+    app.router.add_get('/metrics', metrics)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Async webhook server (same endpoints as app.py)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5002)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port, access_log=None)
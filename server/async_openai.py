@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import aiohttp
+from dotenv import load_dotenv
+
+from llm_cache import get_cache
+from model_router import get_router
+import tracing
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+class OpenAIRequestError(Exception):
+    """Non-retryable error returned by the OpenAI API."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"OpenAI API error {status}: {message}")
+        self.status = status
+
+
+class OpenAIRateLimitError(OpenAIRequestError):
+    """429 or 5xx response; retry after `retry_after` seconds."""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(status, message)
+        self.retry_after = retry_after
+
+
+def _retry_after(headers) -> Optional[float]:
+    """Parse the retry delay OpenAI sends with 429 responses."""
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            return None
+    return None
+
+
+async def chat_completion(
+    session: aiohttp.ClientSession,
+    messages: List[Dict[str, str]],
+    model: str,
+    max_tokens: int,
+    temperature: float
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Call the chat completions endpoint with aiohttp.
+
+    Args:
+        session: Shared aiohttp session
+        messages: Chat messages
+        model: Model name
+        max_tokens: Completion token budget
+        temperature: Sampling temperature
+
+    Returns:
+        Tuple of (completion text, usage dict)
+
+    Raises:
+        OpenAIRateLimitError: On 429 and 5xx responses
+        OpenAIRequestError: On any other error response
+    """
+    base_url = os.getenv("OPENAI_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+    headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"}
+    body = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+
+    async with session.post(f"{base_url}/chat/completions", json=body, headers=headers) as response:
+        if response.status == 429 or response.status >= 500:
+            raise OpenAIRateLimitError(response.status, await response.text(), _retry_after(response.headers))
+        if response.status >= 400:
+            raise OpenAIRequestError(response.status, await response.text())
+        payload = await response.json()
+
+    return payload["choices"][0]["message"]["content"], payload.get("usage", {})
+
+
+async def stream_chat_completion(
+    session: aiohttp.ClientSession,
+    messages: List[Dict[str, str]],
+    model: str,
+    max_tokens: int,
+    temperature: float
+) -> AsyncIterator[Tuple[Optional[str], Optional[Dict[str, Any]]]]:
+    """
+    Call the chat completions endpoint in streaming mode.
+
+    Args:
+        session: Shared aiohttp session
+        messages: Chat messages
+        model: Model name
+        max_tokens: Completion token budget
+        temperature: Sampling temperature
+
+    Yields:
+        (text, None) for each piece of the completion, then (None, usage dict)
+        if the API reported the usage
+
+    Raises:
+        OpenAIRateLimitError: On 429 and 5xx responses
+        OpenAIRequestError: On any other error response
+    """
+    base_url = os.getenv("OPENAI_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+    headers = {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY', '')}"}
+    body = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+
+    async with session.post(f"{base_url}/chat/completions", json=body, headers=headers) as response:
+        if response.status == 429 or response.status >= 500:
+            raise OpenAIRateLimitError(response.status, await response.text(), _retry_after(response.headers))
+        if response.status >= 400:
+            raise OpenAIRequestError(response.status, await response.text())
+        async for line in response.content:
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("usage"):
+                yield None, chunk["usage"]
+            if chunk.get("choices"):
+                text = chunk["choices"][0].get("delta", {}).get("content")
+                if text:
+                    yield text, None
+
+
+
+async def cached_completion(session: aiohttp.ClientSession, request: Dict[str, Any]) -> str:
+    """
+    Async counterpart of ai_feedback._complete: run a completion through the LLM cache.
+
+    Args:
+        session: Shared aiohttp session
+        request: Completion description from ai_feedback.trade_completion_request / structure_completion_request
+
+    Returns:
+        Completion text
+    """
+    cache = get_cache()
+    if cache:
+        cached = cache.get(request["cache_key"])
+        if cached is not None:
+            logger.info(f"LLM cache hit for {request['kind']} prompt")
+            return cached
+
+    started = time.perf_counter()
+    try:
+        with tracing.stage("openai_completion"):
+            completion, usage = await chat_completion(
+                session,
+                request["messages"],
+                request["model"],
+                request["max_tokens"],
+                request["temperature"]
+            )
+    except Exception:
+        tracing.OPENAI_REQUESTS.inc(request["kind"], "error")
+        raise
+    tracing.record_openai_usage(request["kind"], request["model"], usage or None)
+    get_router().record(request, time.perf_counter() - started, usage or None)
+    if cache and completion:
+        cache.set(request["cache_key"], completion, time.perf_counter() - started)
+    return completion
+
+async def stream_cached_completion(
+    session: aiohttp.ClientSession, request: Dict[str, Any], bypass_cache: bool = False
+) -> AsyncIterator[str]:
+    """
+    Async counterpart of ai_feedback._stream: yield the completion text as it arrives.
+
+    Args:
+        session: Shared aiohttp session
+        request: Completion description from ai_feedback.trade_completion_request / structure_completion_request
+        bypass_cache: Skip the cache lookup and always call the API (the result is still stored)
+
+    Yields:
+        Pieces of the completion text (a cache hit is one piece)
+    """
+    cache = get_cache()
+    if cache:
+        if bypass_cache:
+            cache.record_bypass()
+        else:
+            cached = cache.get(request["cache_key"])
+            if cached is not None:
+                logger.info(f"LLM cache hit for {request['kind']} prompt")
+                yield cached
+                return
+
+    started = time.perf_counter()
+    parts = []
+    usage = None
+    try:
+        with tracing.stage("openai_completion"):
+            async for text, chunk_usage in stream_chat_completion(
+                session,
+                request["messages"],
+                request["model"],
+                request["max_tokens"],
+                request["temperature"]
+            ):
+                if chunk_usage:
+                    usage = chunk_usage
+                    continue
+                if not parts:
+                    tracing.OPENAI_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, request["kind"])
+                parts.append(text)
+                yield text
+    except Exception:
+        tracing.OPENAI_REQUESTS.inc(request["kind"], "error")
+        raise
+    tracing.record_openai_usage(request["kind"], request["model"], usage)
+    get_router().record(request, time.perf_counter() - started, usage)
+    completion = "".join(parts)
+    if cache and completion:
+        cache.set(request["cache_key"], completion, time.perf_counter() - started)
+
+
+class AsyncRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter for asyncio callers.
+
+    Both budgets are token buckets refilled continuously. Token usage is
+    estimated before the call and corrected with the real usage afterwards,
+    so the bucket may briefly go negative when an estimate was too low.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        """
+        Initialize both buckets full.
+
+        Args:
+            requests_per_minute: Maximum request rate
+            tokens_per_minute: Maximum prompt + completion token rate
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens: int) -> None:
+        """
+        Wait until one request and `tokens` tokens are available, then consume them.
+
+        Args:
+            tokens: Estimated tokens for the call (capped at the per-minute budget)
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait_requests = (1 - self._requests) * 60 / self.requests_per_minute
+                wait_tokens = (tokens - self._tokens) * 60 / self.tokens_per_minute
+                await asyncio.sleep(max(wait_requests, wait_tokens, 0.01))
+
+    def adjust(self, token_delta: int) -> None:
+        """
+        Correct the token bucket once the real usage is known.
+
+        Args:
+            token_delta: Actual tokens minus the estimate passed to acquire()
+        """
+        self._tokens -= token_delta
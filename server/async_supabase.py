@@ -0,0 +1,253 @@
+import os
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+import aiohttp
+from dotenv import load_dotenv
+
+from image_pipeline import get_pipeline
+from idempotency import DuplicateRowError
+import tracing
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+BUCKET = "screenshots"
+
+
+class AsyncSupabaseError(Exception):
+    """Error response from PostgREST or Storage."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Supabase error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class AsyncSupabaseClient:
+    """
+    The subset of SupabaseClient used by the webhooks, over aiohttp.
+
+    Talks to PostgREST and Storage directly so that an insert or an upload
+    waits on the event loop instead of holding a thread. Rows, storage
+    paths and public URLs are the same as with SupabaseClient.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, url: Optional[str] = None, key: Optional[str] = None):
+        """
+        Initialize the client.
+
+        Args:
+            session: Shared aiohttp session (see clients.create_aiohttp_session)
+            url: Project URL (defaults to SUPABASE_URL)
+            key: API key (defaults to SUPABASE_KEY)
+        """
+        self.session = session
+        self.url = (url or os.getenv("SUPABASE_URL", "")).rstrip("/")
+        key = key or os.getenv("SUPABASE_KEY", "")
+        self.headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+
+    async def _request(self, method: str, path: str, **kwargs) -> Any:
+        """Send a request and decode the JSON response, raising AsyncSupabaseError on errors."""
+        headers = {**self.headers, **kwargs.pop("headers", {})}
+        async with self.session.request(method, f"{self.url}{path}", headers=headers, **kwargs) as response:
+            if response.status >= 400:
+                raise AsyncSupabaseError(response.status, await response.text())
+            if response.content_length == 0:
+                return None
+            return await response.json(content_type=None)
+
+    async def insert(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Insert one row.
+
+        Args:
+            table: Target table
+            row: Row to insert
+
+        Returns:
+            Dict containing the inserted row data
+        """
+        try:
+            with tracing.stage("supabase_insert"):
+                rows = await self._request(
+                    "POST", f"/rest/v1/{table}", json=row, headers={"Prefer": "return=representation"}
+                )
+            return rows[0]
+
+        except AsyncSupabaseError as e:
+            # A retried alert: hand back the row stored by the first attempt
+            if row.get("idempotency_key") and e.status == 409 and '"23505"' in e.message:
+                existing = await self.find_by_idempotency_key(table, row["idempotency_key"])
+                if existing is not None:
+                    raise DuplicateRowError(table, existing) from e
+            raise
+
+    async def find_by_idempotency_key(self, table: str, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the row stored for an idempotency key.
+
+        Args:
+            table: Table to search ("trades" or "structures")
+            idempotency_key: Value of the idempotency_key column
+
+        Returns:
+            The row, or None if there is none
+        """
+        rows = await self._request(
+            "GET", f"/rest/v1/{table}", params={"select": "*", "idempotency_key": f"eq.{idempotency_key}", "limit": "1"}
+        )
+        return rows[0] if rows else None
+
+    async def get_row(self, table: str, row_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch one trade or structure by id.
+
+        Args:
+            table: Table to read ("trades" or "structures")
+            row_id: Id of the row
+
+        Returns:
+            The row, or None if there is none
+        """
+        rows = await self._request(
+            "GET", f"/rest/v1/{table}", params={"select": "*", "id": f"eq.{row_id}", "limit": "1"}
+        )
+        return rows[0] if rows else None
+
+    async def insert_trade(self, **trade: Any) -> Dict[str, Any]:
+        """Insert a trade row built by payloads.parse_trade."""
+        try:
+            inserted = await self.insert("trades", trade)
+            logger.info(f"Successfully inserted {trade['direction']} trade for {trade['instrument']}")
+            return inserted
+
+        except DuplicateRowError:
+            raise
+
+        except Exception as e:
+            logger.error(f"Error inserting trade: {str(e)}")
+            raise
+
+    async def insert_structure(self, **structure: Any) -> Dict[str, Any]:
+        """Insert a structure row built by payloads.parse_structure."""
+        try:
+            inserted = await self.insert("structures", structure)
+            logger.info(f"Successfully inserted {structure['structure_type']} structure for {structure['instrument']}")
+            return inserted
+
+        except DuplicateRowError:
+            raise
+
+        except Exception as e:
+            logger.error(f"Error inserting structure: {str(e)}")
+            raise
+
+    async def _update(self, table: str, row_id: str, values: Dict[str, Any]) -> Dict[str, Any]:
+        with tracing.stage("supabase_update"):
+            rows = await self._request(
+                "PATCH", f"/rest/v1/{table}", params={"id": f"eq.{row_id}"}, json=values,
+                headers={"Prefer": "return=representation"}
+            )
+        return rows[0] if rows else {}
+
+    async def update_ai_feedback(self, table: str, row_id: str, feedback: str) -> Dict[str, Any]:
+        """
+        Store the AI feedback on an existing trade or structure.
+
+        Args:
+            table: Target table ("trades" or "structures")
+            row_id: Id of the row to update
+            feedback: AI-generated feedback text
+
+        Returns:
+            Dict containing the updated row data
+        """
+        try:
+            updated = await self._update(table, row_id, {"ai_feedback": feedback})
+            logger.info(f"Successfully updated AI feedback for {table} row {row_id}")
+            return updated
+
+        except Exception as e:
+            logger.error(f"Error updating AI feedback: {str(e)}")
+            raise
+
+    async def update_screenshot_url(self, table: str, row_id: str, screenshot_url: str) -> Dict[str, Any]:
+        """
+        Store the screenshot URL on an existing trade or structure.
+
+        Args:
+            table: Target table ("trades" or "structures")
+            row_id: Id of the row to update
+            screenshot_url: Public URL of the uploaded screenshot
+
+        Returns:
+            Dict containing the updated row data
+        """
+        try:
+            updated = await self._update(table, row_id, {"screenshot_url": screenshot_url})
+            logger.info(f"Successfully updated screenshot URL for {table} row {row_id}")
+            return updated
+
+        except Exception as e:
+            logger.error(f"Error updating screenshot URL: {str(e)}")
+            raise
+
+    async def _upload_object(self, path: str, data: bytes, content_type: str) -> bool:
+        """
+        Upload an immutable object to the screenshots bucket.
+
+        Returns:
+            False if an object already exists at this path
+        """
+        tracing.observe_size("storage_object", len(data))
+        with tracing.stage("storage_upload"):
+            try:
+                await self._request(
+                    "POST", f"/storage/v1/object/{BUCKET}/{quote(path)}", data=data,
+                    # Content-hash names never change content: cache for a year
+                    headers={"Content-Type": content_type, "Cache-Control": "max-age=31536000", "x-upsert": "false"}
+                )
+                return True
+            except AsyncSupabaseError as e:
+                # Storage reports an existing object as a 400 carrying statusCode 409
+                if e.status == 409 or '"409"' in e.message or '"Duplicate"' in e.message:
+                    return False
+                raise
+
+    def public_url(self, path: str) -> str:
+        """Public URL of an object in the screenshots bucket."""
+        return f"{self.url}/storage/v1/object/public/{BUCKET}/{quote(path)}"
+
+    async def store_screenshot(self, data: bytes) -> str:
+        """
+        Process a screenshot and store it under its content hash (see SupabaseClient.store_screenshot).
+
+        The image processing runs in a worker thread so it does not block the event loop.
+
+        Args:
+            data: Raw image bytes
+
+        Returns:
+            Public URL of the full-size image
+        """
+        pipeline = get_pipeline()
+        with tracing.stage("image_process"):
+            processed = await asyncio.to_thread(pipeline.process, data)
+        try:
+            # Thumbnail first: an existing full image implies its thumbnail exists
+            await self._upload_object(processed["thumbnail_path"], processed["thumbnail"], "image/webp")
+            if not await self._upload_object(processed["path"], processed["full"], processed["content_type"]):
+                pipeline.record_duplicate(processed)
+                logger.info(f"Screenshot {processed['hash'][:12]} already stored, reusing it")
+
+            return self.public_url(processed["path"])
+
+        except Exception as e:
+            logger.error(f"Error storing screenshot: {str(e)}")
+            raise
@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, List, Optional
+import aiohttp
+from dotenv import load_dotenv
+
+from supabase_client import SupabaseClient
+from clients import get_supabase_client
+from ai_feedback import trade_completion_request
+from async_openai import (
+    AsyncRateLimiter,
+    OpenAIRateLimitError,
+    chat_completion
+)
+from llm_cache import get_cache
+from model_router import get_router
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "backlog_checkpoint.json")
+
+
+class BacklogAnalyzer:
+    """
+    Fill `ai_feedback` on every historical trade that does not have it yet.
+
+    Trades are read page by page in (created_at, id) order. Each page is
+    analyzed with bounded concurrency under a requests/tokens-per-minute
+    limiter, results are written back in batches through a single RPC, and
+    the position of the last fully written page is checkpointed to disk so
+    a crashed run resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        supabase: SupabaseClient,
+        concurrency: int = 8,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 150000,
+        batch_size: int = 50,
+        page_size: int = 500,
+        max_retries: int = 5,
+        checkpoint_path: Optional[str] = None,
+        limit: Optional[int] = None
+    ):
+        """
+        Initialize the analyzer.
+
+        Args:
+            supabase: Supabase client used to read trades and write feedback
+            concurrency: Maximum number of OpenAI calls in flight
+            requests_per_minute: OpenAI request budget
+            tokens_per_minute: OpenAI token budget
+            batch_size: Number of results written per bulk update
+            page_size: Number of trades fetched per page
+            max_retries: Retries on 429/5xx before a trade is counted as failed
+            checkpoint_path: JSON file holding the resume position
+            limit: Stop after this many trades (None for the whole backlog)
+        """
+        self.supabase = supabase
+        self.concurrency = concurrency
+        self.limiter = AsyncRateLimiter(requests_per_minute, tokens_per_minute)
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self.checkpoint_path = checkpoint_path or DEFAULT_CHECKPOINT_PATH
+        self.limit = limit
+
+        self._pending: List[Dict[str, Any]] = []
+        self._stats = {
+            "analyzed": 0,
+            "cached": 0,
+            "failed": 0,
+            "written": 0,
+            "requests": 0,
+            "rate_limited": 0,
+            "tokens": 0,
+        }
+
+    def load_checkpoint(self) -> Dict[str, Any]:
+        """Read the resume position, or an empty checkpoint on first run."""
+        if not os.path.exists(self.checkpoint_path):
+            return {"after": None, "processed": 0, "failed_ids": []}
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def save_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        """Atomically replace the checkpoint file."""
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def _analyze(self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, trade: Dict[str, Any]) -> Optional[str]:
+        """Analyze one trade, retrying on rate limits. Returns None if it failed."""
+        trade_data = {**trade, "notes": trade.get("notes") or ""}
+        request = trade_completion_request(trade_data)
+
+        cache = get_cache()
+        if cache:
+            cached = cache.get(request["cache_key"])
+            if cached is not None:
+                self._stats["cached"] += 1
+                return cached
+
+        # Prompt tokens counted by the router, plus the output budget of the tier
+        estimate = request["prompt_tokens"] + request["max_tokens"]
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire(estimate)
+                self._stats["requests"] += 1
+                started = time.perf_counter()
+                try:
+                    feedback, usage = await chat_completion(
+                        session,
+                        request["messages"],
+                        request["model"],
+                        request["max_tokens"],
+                        request["temperature"]
+                    )
+                except OpenAIRateLimitError as e:
+                    if e.status == 429:
+                        self._stats["rate_limited"] += 1
+                    delay = e.retry_after or min(60, 2 ** attempt)
+                    logger.warning(f"OpenAI {e.status} for trade {trade['id']}, retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                except Exception as e:
+                    logger.error(f"Error analyzing trade {trade['id']}: {str(e)}")
+                    return None
+
+                get_router().record(request, time.perf_counter() - started, usage or None)
+                used = usage.get("total_tokens", estimate)
+                self.limiter.adjust(used - estimate)
+                self._stats["tokens"] += used
+                if cache and feedback:
+                    cache.set(request["cache_key"], feedback, time.perf_counter() - started)
+                return feedback
+
+        logger.error(f"Giving up on trade {trade['id']} after {self.max_retries} retries")
+        return None
+
+    async def _flush(self) -> None:
+        """Write the buffered results with one bulk update."""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        await asyncio.to_thread(self.supabase.bulk_update_ai_feedback, "trades", batch)
+        self._stats["written"] += len(batch)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Process the backlog until it is empty or `limit` is reached.
+
+        Returns:
+            Report with counters, throughput (trades/min) and 429 rate
+        """
+        checkpoint = self.load_checkpoint()
+        after = tuple(checkpoint["after"]) if checkpoint["after"] else None
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        processed = 0
+
+        timeout = aiohttp.ClientTimeout(total=120)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            while self.limit is None or processed < self.limit:
+                page_size = self.page_size if self.limit is None else min(self.page_size, self.limit - processed)
+                trades = await asyncio.to_thread(self.supabase.fetch_trades_without_feedback, after, page_size)
+                if not trades:
+                    break
+
+                tasks = [asyncio.create_task(self._analyze(session, semaphore, trade)) for trade in trades]
+                for trade, task in zip(trades, tasks):
+                    feedback = await task
+                    if feedback:
+                        self._stats["analyzed"] += 1
+                        self._pending.append({"id": trade["id"], "ai_feedback": feedback})
+                        if len(self._pending) >= self.batch_size:
+                            await self._flush()
+                    else:
+                        self._stats["failed"] += 1
+                        checkpoint["failed_ids"].append(trade["id"])
+
+                await self._flush()
+                processed += len(trades)
+                after = (trades[-1]["created_at"], trades[-1]["id"])
+                checkpoint["after"] = list(after)
+                checkpoint["processed"] += len(trades)
+                self.save_checkpoint(checkpoint)
+                logger.info(f"Backlog progress: {checkpoint['processed']} trades, {self.report(started)['trades_per_min']} trades/min")
+
+        return self.report(started)
+
+    def report(self, started: float) -> Dict[str, Any]:
+        """Summarize the run so far."""
+        elapsed = max(time.monotonic() - started, 1e-9)
+        stats = dict(self._stats)
+        stats["elapsed_s"] = round(elapsed, 2)
+        stats["trades_per_min"] = round((stats["analyzed"] + stats["failed"]) / elapsed * 60, 1)
+        stats["rate_429"] = round(stats["rate_limited"] / stats["requests"], 4) if stats["requests"] else 0.0
+        return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: python backlog_analyzer.py [options]"""
+    parser = argparse.ArgumentParser(description="Generate AI feedback for every trade that has none yet.")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BACKLOG_CONCURRENCY", "8")))
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("BACKLOG_REQUESTS_PER_MINUTE", "500")), help="OpenAI requests per minute")
+    parser.add_argument("--tpm", type=float, default=float(os.getenv("BACKLOG_TOKENS_PER_MINUTE", "150000")), help="OpenAI tokens per minute")
+    parser.add_argument("--batch-size", type=int, default=50, help="Results written per bulk update")
+    parser.add_argument("--page-size", type=int, default=500, help="Trades fetched per page")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after N trades")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="Checkpoint file")
+    parser.add_argument("--reset", action="store_true", help="Ignore the checkpoint and start from the oldest trade")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    analyzer = BacklogAnalyzer(
+        get_supabase_client(),
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        batch_size=args.batch_size,
+        page_size=args.page_size,
+        checkpoint_path=args.checkpoint,
+        limit=args.limit
+    )
+    report = asyncio.run(analyzer.run())
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import os
+import logging
+import threading
+import importlib.util
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+# httpx, openai and supabase take ~0.5s to import: they are only loaded when
+# a client is first built (see get_supabase / get_openai)
+if TYPE_CHECKING:
+    import aiohttp
+    import httpx
+    from openai import OpenAI
+    from supabase import Client
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def http_timeout(read: Optional[float] = None) -> "httpx.Timeout":
+    """
+    Timeouts shared by every outbound client.
+
+    Args:
+        read: Read timeout override in seconds (defaults to HTTP_READ_TIMEOUT)
+    """
+    import httpx
+
+    return httpx.Timeout(
+        connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+        read=read if read is not None else float(os.getenv("HTTP_READ_TIMEOUT", "30")),
+        write=float(os.getenv("HTTP_WRITE_TIMEOUT", "30")),
+        pool=float(os.getenv("HTTP_POOL_TIMEOUT", "5")),
+    )
+
+
+def http_client_options(timeout: Optional["httpx.Timeout"] = None) -> Dict[str, Any]:
+    """
+    Keyword arguments for a pooled, keep-alive httpx client.
+
+    Args:
+        timeout: Timeouts to use (defaults to http_timeout())
+    """
+    import httpx
+
+    return {
+        "timeout": timeout or http_timeout(),
+        "limits": httpx.Limits(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+        ),
+        "http2": os.getenv("HTTP2_ENABLED", "true").lower() == "true" and http2_available(),
+    }
+
+
+def create_aiohttp_session() -> "aiohttp.ClientSession":
+    """
+    Build a pooled aiohttp session for the async server (async_app.py).
+
+    Must be called from a running event loop; the session belongs to that loop.
+    """
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(
+        limit=int(os.getenv("ASYNC_MAX_CONNECTIONS", "100")),
+        keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+    )
+    timeout = aiohttp.ClientTimeout(
+        connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+        sock_read=float(os.getenv("HTTP_READ_TIMEOUT", "30")),
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+_lock = threading.Lock()
+_supabase: Optional["Client"] = None
+_supabase_client = None
+_openai: Optional["OpenAI"] = None
+
+
+def create_supabase() -> "Client":
+    """Build a new pooled supabase-py client from SUPABASE_URL and SUPABASE_KEY."""
+    from supabase.lib.client_options import ClientOptions
+    from supabase_pool import PooledSupabase
+
+    return PooledSupabase(
+        os.getenv("SUPABASE_URL", ""),
+        os.getenv("SUPABASE_KEY", ""),
+        options=ClientOptions(storage_client_timeout=int(os.getenv("HTTP_STORAGE_READ_TIMEOUT", "60")))
+    )
+
+
+def get_supabase() -> "Client":
+    """Return the process-wide supabase-py client."""
+    global _supabase
+    with _lock:
+        if _supabase is None:
+            _supabase = create_supabase()
+            logger.info(f"Created shared Supabase client (http2={http_client_options()['http2']})")
+        return _supabase
+
+
+def get_supabase_client():
+    """Return the process-wide SupabaseClient wrapper, built on get_supabase()."""
+    global _supabase_client
+    from supabase_client import SupabaseClient
+
+    supabase = get_supabase()
+    with _lock:
+        if _supabase_client is None:
+            _supabase_client = SupabaseClient(client=supabase)
+        return _supabase_client
+
+
+def get_openai() -> "OpenAI":
+    """Return the process-wide OpenAI client, on a pooled keep-alive HTTP client."""
+    global _openai
+    with _lock:
+        if _openai is None:
+            import httpx
+            from openai import OpenAI
+
+            options = http_client_options(http_timeout(read=float(os.getenv("OPENAI_READ_TIMEOUT", "60"))))
+            _openai = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=options["timeout"],
+                http_client=httpx.Client(**options),
+            )
+        return _openai
+
+
+class LazyProxy:
+    """
+    Stand-in for an object built on first attribute access.
+
+    Lets modules keep a module-level name (e.g. `supabase` in app.py) without
+    paying for the client construction and its imports at import time.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_instance_lock", threading.Lock())
+
+    def _resolve(self) -> Any:
+        instance = object.__getattribute__(self, "_instance")
+        if instance is None:
+            with object.__getattribute__(self, "_instance_lock"):
+                instance = object.__getattribute__(self, "_instance")
+                if instance is None:
+                    instance = object.__getattribute__(self, "_factory")()
+                    object.__setattr__(self, "_instance", instance)
+        return instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._resolve(), name, value)
+
+
+def warm_up() -> None:
+    """Build the shared clients (and import their libraries) ahead of the first request."""
+    try:
+        get_supabase_client()
+        get_openai()
+        logger.info("Shared clients ready")
+    except Exception as e:
+        logger.error(f"Error warming up clients: {str(e)}")
+
+
+def warm_up_in_background() -> threading.Thread:
+    """Run warm_up() in a daemon thread so the server can start accepting requests right away."""
+    thread = threading.Thread(target=warm_up, name="clients-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,468 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from supabase_client import SupabaseClient
+from ingest_log import is_permanent_error
+from payloads import TRADE_DIRECTIONS, TRADE_REQUIRED_FIELDS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "csv_import_checkpoint.json")
+
+PRICE_FIELDS = ("entry_price", "stop_loss", "take_profit")
+IMPORT_FIELDS = (*TRADE_REQUIRED_FIELDS, "risk_reward", "notes", "created_at", "exit_price", "exit_time", "quantity")
+
+# Usual broker export headers, after normalization (lower case, "_" for spaces and dashes)
+COLUMN_ALIASES = {
+    "symbol": "instrument",
+    "side": "direction",
+    "entry": "entry_price",
+    "stop": "stop_loss",
+    "sl": "stop_loss",
+    "target": "take_profit",
+    "tp": "take_profit",
+    "rr": "risk_reward",
+    "time": "created_at",
+    "timestamp": "created_at",
+    "date": "created_at",
+    "exit": "exit_price",
+    "close_price": "exit_price",
+    "close_time": "exit_time",
+    "qty": "quantity",
+    "contracts": "quantity",
+}
+
+# Broker sides accepted for the direction, on top of LONG / SHORT
+DIRECTION_ALIASES = {**{direction: direction for direction in TRADE_DIRECTIONS}, "BUY": "LONG", "SELL": "SHORT"}
+
+# Namespace of the row ids derived from the trade content (see trade_ids)
+IMPORT_NAMESPACE = uuid.UUID("6f1c7c52-3d0e-4d55-9a8e-2b7f0e1c9a41")
+
+WRITE_ATTEMPTS = 4
+
+
+def normalize_header(name: str) -> str:
+    return re.sub(r"[\s\-]+", "_", str(name).strip().lower())
+
+
+def column_mapping(header: Sequence[str], overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Map CSV columns to trade fields.
+
+    Args:
+        header: Columns of the file
+        overrides: Explicit CSV column -> field mappings (--map), checked first
+
+    Returns:
+        Dict of CSV column -> trade field, for the columns that are used
+
+    Raises:
+        ValueError: If a required field has no column
+    """
+    overrides = overrides or {}
+    mapping = {}
+    for column in header:
+        field = overrides.get(column) or normalize_header(column)
+        field = COLUMN_ALIASES.get(field, field)
+        if field in IMPORT_FIELDS and field not in mapping.values():
+            mapping[column] = field
+    missing = [field for field in TRADE_REQUIRED_FIELDS if field not in mapping.values()]
+    if missing:
+        raise ValueError(f"No column for required field(s) {', '.join(missing)} (use --map 'CSV column=field')")
+    return mapping
+
+
+def parse_timestamps(values: pd.Series, tz: str = "UTC") -> pd.Series:
+    """
+    Parse timestamps to UTC; those without an offset are in `tz`.
+
+    Returns:
+        datetime64[UTC] Series, NaT where a value cannot be parsed
+    """
+    # The offset must follow a time: the year of a dash date ("10-30-2024") is not an offset
+    has_offset = values.str.contains(r"\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:Z|[+-]\d{2}:?\d{2})$", regex=True)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns, UTC]")
+    if has_offset.any():
+        parsed[has_offset] = pd.to_datetime(values[has_offset], errors="coerce", format="mixed", utc=True)
+    if (~has_offset).any():
+        local = pd.to_datetime(values[~has_offset], errors="coerce", format="mixed")
+        parsed[~has_offset] = local.dt.tz_localize(tz, ambiguous="NaT", nonexistent="NaT").dt.tz_convert("UTC")
+    return parsed
+
+
+def validate_chunk(chunk: pd.DataFrame, tz: str = "UTC") -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Validate and normalize a chunk of trades, column by column.
+
+    Same rules as the trade webhook (payloads.parse_trade): the required
+    fields must be present, the direction must be LONG or SHORT (broker
+    BUY / SELL are accepted, case and spaces are ignored), prices must be
+    numbers, and a missing or zero risk_reward is computed as
+    round(|take_profit - entry| / |entry - stop_loss|, 2), 0 when the risk is 0.
+    A created_at column, when the file has one, is required on every row.
+    An exit (exit_price and exit_time, optional) is given in full or left
+    empty; quantity, when given, is a positive number (1 contract otherwise).
+
+    Args:
+        chunk: Rows renamed to trade fields, every value a string
+        tz: Time zone of timestamps without an offset
+
+    Returns:
+        (valid rows with typed columns, rejection reason of every other row, same index as chunk)
+    """
+    reasons = pd.Series(None, index=chunk.index, dtype=object)
+
+    def reject(mask: pd.Series, reason: str) -> None:
+        # The first failing rule is the reason given
+        reasons[mask & reasons.isna()] = reason
+
+    text = {field: chunk[field].fillna("").astype(str).str.strip() for field in chunk.columns}
+    for field in TRADE_REQUIRED_FIELDS + (["created_at"] if "created_at" in chunk else []):
+        reject(text[field] == "", f"Missing required field: {field}")
+
+    direction = text["direction"].str.upper().map(DIRECTION_ALIASES)
+    reject(direction.isna(), "Invalid direction. Must be LONG or SHORT")
+
+    prices = {}
+    for field in PRICE_FIELDS:
+        prices[field] = pd.to_numeric(text[field], errors="coerce")
+        reject(~np.isfinite(prices[field]), f"Invalid number: {field}")
+
+    given_rr = pd.to_numeric(text["risk_reward"], errors="coerce") if "risk_reward" in chunk else pd.Series(np.nan, index=chunk.index)
+    if "risk_reward" in chunk:
+        reject((text["risk_reward"] != "") & given_rr.isna(), "Invalid number: risk_reward")
+
+    created_at = None
+    if "created_at" in chunk:
+        created_at = parse_timestamps(text["created_at"], tz)
+        reject(created_at.isna() & (text["created_at"] != ""), "Invalid created_at")
+
+    exit_price = exit_time = quantity = None
+    if "exit_price" in chunk or "exit_time" in chunk:
+        exit_text = text.get("exit_price", pd.Series("", index=chunk.index))
+        time_text = text.get("exit_time", pd.Series("", index=chunk.index))
+        reject((exit_text == "") != (time_text == ""), "exit_price and exit_time must be given together")
+        exit_price = pd.to_numeric(exit_text, errors="coerce")
+        reject((exit_text != "") & ~np.isfinite(exit_price), "Invalid number: exit_price")
+        exit_time = parse_timestamps(time_text, tz)
+        reject(exit_time.isna() & (time_text != ""), "Invalid exit_time")
+    if "quantity" in chunk:
+        quantity = pd.to_numeric(text["quantity"], errors="coerce")
+        reject((text["quantity"] != "") & ~(quantity > 0), "Invalid quantity. Must be a positive number")
+
+    valid = reasons.isna()
+    entry, stop, target = (prices[field][valid].to_numpy(dtype=np.float64) for field in PRICE_FIELDS)
+    risk = np.abs(entry - stop)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        computed_rr = np.where(risk != 0, np.round(np.abs(target - entry) / risk, 2), 0.0)
+    given = given_rr[valid].to_numpy(dtype=np.float64)
+    # "if not risk_reward": empty or 0 means computed
+    risk_reward = np.where(np.isnan(given) | (given == 0), computed_rr, given)
+
+    rows = pd.DataFrame({
+        "instrument": text["instrument"][valid],
+        "direction": direction[valid],
+        "entry_price": entry,
+        "stop_loss": stop,
+        "take_profit": target,
+        "screenshot_url": None,
+        "notes": text["notes"][valid].where(text["notes"][valid] != "") if "notes" in chunk else None,
+        "risk_reward": risk_reward,
+    }, index=chunk.index[valid])
+    if created_at is not None:
+        rows["created_at"] = created_at[valid].map(lambda moment: moment.isoformat())
+    if exit_price is not None:
+        rows["exit_price"] = exit_price[valid]
+        rows["exit_time"] = exit_time[valid].map(lambda moment: moment.isoformat(), na_action="ignore")
+    if quantity is not None:
+        rows["quantity"] = quantity[valid].fillna(1.0)
+    return rows, reasons[~valid]
+
+
+def trade_ids(rows: pd.DataFrame, source: str) -> List[str]:
+    """
+    Ids derived from the content of each trade (uuid5).
+
+    Importing a file twice, resuming after a crash or importing two exports
+    that overlap sends the same ids again, which the upsert skips. Without a
+    created_at column, the file name and row number stand in for the time.
+    """
+    if "created_at" in rows:
+        moment = rows["created_at"]
+    else:
+        moment = f"{source}:" + (rows.index + 1).astype(str).to_series(index=rows.index)
+    keys = (
+        rows["instrument"] + "|" + rows["direction"] + "|" + rows["entry_price"].astype(str) + "|"
+        + rows["stop_loss"].astype(str) + "|" + rows["take_profit"].astype(str) + "|" + moment
+    )
+    return [str(uuid.uuid5(IMPORT_NAMESPACE, key)) for key in keys.tolist()]
+
+
+class CsvImporter:
+    """
+    Stream a broker CSV export into the trades table.
+
+    The file is read in chunks (pandas), each chunk is validated with
+    vectorized rules (validate_chunk), and its valid rows are written as
+    multi-row upserts, at most `concurrency` at a time. Only a bounded number
+    of batches is in flight, so memory does not grow with the file.
+
+    Each row gets an id derived from its content: rewriting a batch is
+    harmless. After the chunks up to row N are all written, N is saved in a
+    checkpoint; a run with the same checkpoint resumes after row N.
+    Rejected rows are appended to a CSV with their row number and reason.
+    """
+
+    def __init__(
+        self,
+        supabase: SupabaseClient,
+        chunk_size: int = 10000,
+        batch_size: int = 500,
+        concurrency: int = 4,
+        checkpoint_path: str = DEFAULT_CHECKPOINT_PATH,
+        column_map: Optional[Dict[str, str]] = None,
+        tz: str = "UTC"
+    ):
+        """
+        Initialize the importer.
+
+        Args:
+            supabase: Supabase client
+            chunk_size: Rows read from the file at a time
+            batch_size: Rows per insert request
+            concurrency: Insert requests in flight
+            checkpoint_path: Progress file
+            column_map: Explicit CSV column -> trade field mappings
+            tz: Time zone of timestamps without an offset
+        """
+        self.supabase = supabase
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.checkpoint_path = checkpoint_path
+        self.column_map = column_map or {}
+        self.tz = tz
+
+    @staticmethod
+    def fingerprint(path: str) -> Dict[str, Any]:
+        """Identity of the file a checkpoint belongs to"""
+        stat = os.stat(path)
+        return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    def load_checkpoint(self, path: str) -> Dict[str, Any]:
+        """Progress saved for this file, or a fresh one if the checkpoint is for another file (or version of it)"""
+        fresh = {"file": self.fingerprint(path), "rows_done": 0, "inserted": 0, "duplicates": 0, "rejected": 0, "reasons": {}}
+        if not os.path.exists(self.checkpoint_path):
+            return fresh
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("file") != fresh["file"]:
+            logger.info("Checkpoint is for another file, starting from the first row")
+            return fresh
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        """Atomically replace the checkpoint file."""
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _write(self, rows: List[Dict[str, Any]]) -> Tuple[int, int, Dict[int, str]]:
+        """
+        Upsert one batch, retrying connection errors.
+
+        Returns:
+            (rows inserted, rows already stored, {row number: reason} of rows the database rejected)
+        """
+        payload = [{key: value for key, value in row.items() if key != "row"} for row in rows]
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                inserted = self.supabase.upsert_rows("trades", payload, count_inserted=True)
+                return inserted, len(rows) - inserted, {}
+            except Exception as e:
+                if is_permanent_error(e):
+                    break
+                if attempt == WRITE_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"Insert of {len(rows)} trades failed ({str(e)}), retrying")
+                time.sleep(2 ** attempt)
+
+        # A row of the batch is refused by the database: isolate it
+        inserted, duplicates, rejected = 0, 0, {}
+        for row, values in zip(rows, payload):
+            try:
+                count = self.supabase.upsert_rows("trades", [values], count_inserted=True)
+                inserted += count
+                duplicates += 1 - count
+            except Exception as e:
+                if not is_permanent_error(e):
+                    raise
+                rejected[row["row"]] = f"Rejected by the database: {getattr(e, 'message', None) or str(e)}"
+        return inserted, duplicates, rejected
+
+    def run(self, path: str, rejects_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Import a CSV file, resuming from the checkpoint.
+
+        Args:
+            path: CSV file (header on the first line)
+            rejects_path: CSV of rejected rows (defaults to <path>.rejects.csv)
+
+        Returns:
+            Report: rows read, inserted, already stored, rejected (by reason), rows/s
+        """
+        rejects_path = rejects_path or f"{path}.rejects.csv"
+        checkpoint = self.load_checkpoint(path)
+        start_row = checkpoint["rows_done"]
+        if start_row:
+            logger.info(f"Resuming {path} after row {start_row}")
+        elif os.path.exists(rejects_path):
+            os.remove(rejects_path)
+
+        header = pd.read_csv(path, nrows=0).columns.tolist()
+        mapping = column_mapping(header, self.column_map)
+        source = os.path.basename(path)
+
+        started = time.monotonic()
+        rows_read = 0
+        pending: deque = deque()
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="csv-import")
+
+        def settle(entry: Tuple[int, pd.DataFrame, pd.Series, List[Future]]) -> None:
+            """Wait for the oldest chunk, then record its rejects and move the checkpoint past it."""
+            end_row, raw, reasons, futures = entry
+            reasons = reasons.to_dict()
+            for future in futures:
+                inserted, duplicates, rejected = future.result()
+                checkpoint["inserted"] += inserted
+                checkpoint["duplicates"] += duplicates
+                reasons.update(rejected)
+            if reasons:
+                rejects = raw.loc[sorted(reasons)].copy()
+                rejects.insert(0, "reason", [reasons[row] for row in rejects.index])
+                rejects.insert(0, "row", rejects.index + 1)
+                rejects.to_csv(rejects_path, mode="a", index=False, header=not os.path.exists(rejects_path))
+                checkpoint["rejected"] += len(reasons)
+                for reason, count in Counter(reasons.values()).items():
+                    checkpoint["reasons"][reason] = checkpoint["reasons"].get(reason, 0) + count
+            checkpoint["rows_done"] = end_row
+            self.save_checkpoint(checkpoint)
+            elapsed = time.monotonic() - started
+            logger.info(f"{end_row} rows done, {rows_read / elapsed:.0f} rows/s")
+
+        try:
+            # Every value read as text: no type guessed per chunk, the raw value is kept for the rejects file
+            reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=self.chunk_size)
+            offset = 0
+            for raw in reader:
+                raw.index = pd.RangeIndex(offset, offset + len(raw))
+                offset += len(raw)
+                if offset <= start_row:
+                    continue
+                raw = raw.loc[start_row:]
+                rows_read += len(raw)
+
+                rows, reasons = validate_chunk(raw[list(mapping)].rename(columns=mapping), self.tz)
+                rows["id"] = trade_ids(rows, source)
+                rows["row"] = rows.index
+                records = rows.replace({np.nan: None}).to_dict("records")
+                futures = [
+                    pool.submit(self._write, records[start:start + self.batch_size])
+                    for start in range(0, len(records), self.batch_size)
+                ]
+                pending.append((offset, raw, reasons, futures))
+                # Bounded work in flight: the file is never held in memory
+                while sum(len(entry[3]) for entry in pending) > self.concurrency * 2:
+                    settle(pending.popleft())
+            while pending:
+                settle(pending.popleft())
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        elapsed = time.monotonic() - started
+        return {
+            "file": path,
+            "resumed_from_row": start_row,
+            "rows": checkpoint["rows_done"],
+            "rows_read": rows_read,
+            "inserted": checkpoint["inserted"],
+            "already_stored": checkpoint["duplicates"],
+            "rejected": checkpoint["rejected"],
+            "rejected_by_reason": checkpoint["reasons"],
+            "rejects_file": rejects_path if checkpoint["rejected"] else None,
+            "elapsed_s": round(elapsed, 2),
+            "rows_per_s": round(rows_read / elapsed) if elapsed else None,
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: python csv_importer.py trades.csv [options]"""
+    from clients import get_supabase_client
+
+    parser = argparse.ArgumentParser(description="Import trades from a broker CSV export.")
+    parser.add_argument("path", help="CSV file, header on the first line")
+    parser.add_argument("--map", action="append", default=[], metavar="COLUMN=FIELD",
+                        help=f"Map a CSV column to a trade field ({', '.join(IMPORT_FIELDS)}); repeatable")
+    parser.add_argument("--timezone", default="UTC", help="Time zone of timestamps without an offset")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows read from the file at a time")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("CSV_IMPORT_BATCH_SIZE", "500")), help="Rows per insert")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("CSV_IMPORT_CONCURRENCY", "4")), help="Inserts in flight")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="Checkpoint file")
+    parser.add_argument("--rejects", default=None, help="CSV of rejected rows (default: <path>.rejects.csv)")
+    parser.add_argument("--reset", action="store_true", help="Ignore the checkpoint and start from the first row")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # One INFO line per insert request otherwise
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    column_map = {}
+    for item in args.map:
+        column, _, field = item.partition("=")
+        if field not in IMPORT_FIELDS:
+            parser.error(f"unknown field in --map {item!r}")
+        column_map[column] = field
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    importer = CsvImporter(
+        get_supabase_client(),
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint,
+        column_map=column_map,
+        tz=args.timezone
+    )
+    try:
+        report = importer.run(args.path, args.rejects)
+    except ValueError as e:
+        parser.error(str(e))
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "idempotency.sqlite3")
+
+# Disk eviction runs once every N writes instead of on every insert
+EVICTION_INTERVAL = 100
+
+
+class DuplicateRowError(Exception):
+    """Insert refused by the unique idempotency_key constraint; `row` is the row already stored."""
+
+    def __init__(self, table: str, row: Dict[str, Any]):
+        super().__init__(f"Duplicate {table} row {row.get('id')}")
+        self.table = table
+        self.row = row
+
+
+class IdempotencyKey(NamedTuple):
+    """
+    Identity of a webhook alert.
+
+    index_key: looked up in the IdempotencyIndex
+    row_key: stored in the idempotency_key column (unique in the database)
+    ttl: seconds the index remembers the alert
+    """
+    index_key: str
+    row_key: str
+    ttl: float
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def webhook_key(
+    table: str,
+    data: Dict[str, Any],
+    row: Dict[str, Any],
+    explicit_key: Optional[str] = None,
+    now: Optional[float] = None
+) -> IdempotencyKey:
+    """
+    Derive the idempotency key of a webhook alert.
+
+    An explicit key (Idempotency-Key header or `alert_id` field) identifies
+    the alert for IDEMPOTENCY_TTL_SECONDS. Otherwise the alert is identified
+    by a hash of its canonical payload (the validated row plus the
+    screenshot) for IDEMPOTENCY_WINDOW_SECONDS: the same alert sent again in
+    that window is a retry. The database key of a hashed alert includes the
+    window number so the unique constraint does not block a genuine repeat
+    alert later on.
+
+    Args:
+        table: Target table ("trades" or "structures")
+        data: Decoded JSON body
+        row: Row built by payloads.parse_trade / parse_structure
+        explicit_key: Value of the Idempotency-Key header, if any
+        now: Current time (defaults to time.time())
+
+    Returns:
+        The IdempotencyKey
+    """
+    explicit_key = explicit_key or data.get('alert_id')
+    if explicit_key:
+        key = f"{table}:alert:{_digest(str(explicit_key))}"
+        return IdempotencyKey(key, key, float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600))))
+
+    window = float(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "300"))
+    canonical = json.dumps(
+        {**row, "screenshot": _digest(data['screenshot']) if data.get('screenshot') else None},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    key = f"{table}:payload:{_digest(canonical)}"
+    window_number = int((now if now is not None else time.time()) // window)
+    return IdempotencyKey(key, f"{key}:{window_number}", window)
+
+
+class IdempotencyIndex:
+    """
+    Bounded index of the alerts already ingested and the response they got.
+
+    An in-memory LRU sits in front of a SQLite store shared by the server
+    processes, so a retried alert is answered without a round trip to
+    Supabase or OpenAI. Both tiers are bounded by a number of entries; an
+    entry expires after the TTL of its key. The unique idempotency_key
+    constraint in the database catches what the index misses (e.g. two
+    copies of an alert arriving at the same time).
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        memory_entries: Optional[int] = None,
+        max_entries: Optional[int] = None
+    ):
+        """
+        Initialize the index and create the SQLite table if needed.
+
+        Args:
+            db_path: Path of the SQLite database file
+            memory_entries: Capacity of the in-memory LRU
+            max_entries: Capacity of the persistent store
+        """
+        self.db_path = db_path or os.getenv("IDEMPOTENCY_PATH", DEFAULT_DB_PATH)
+        self.memory_entries = memory_entries or int(os.getenv("IDEMPOTENCY_MEMORY_ENTRIES", "10000"))
+        self.max_entries = max_entries or int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000"))
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "conflicts": 0,
+            "evictions": 0,
+        }
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created_at)")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up the response of an alert, first in memory then on disk.
+
+        Args:
+            key: IdempotencyKey.index_key
+
+        Returns:
+            The stored response, or None if the alert is new or expired
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[1]
+
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM idempotency_keys WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+            if row is None:
+                self._memory.pop(key, None)
+                self._stats["misses"] += 1
+                return None
+
+            response = json.loads(row[0])
+            self._remember(key, (row[1], response))
+            self._stats["disk_hits"] += 1
+            return response
+
+    def set(self, key: str, response: Dict[str, Any], ttl: float) -> None:
+        """
+        Record the response given to an alert.
+
+        Args:
+            key: IdempotencyKey.index_key
+            response: Response body returned to the first request
+            ttl: Seconds the alert is remembered
+        """
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._remember(key, (expires_at, response))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO idempotency_keys (key, response, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response, default=str), expires_at, now)
+            )
+            self._stats["stores"] += 1
+            self._writes += 1
+            if self._writes % EVICTION_INTERVAL == 0:
+                self._evict_disk(now)
+
+    def record_conflict(self) -> None:
+        """Count a duplicate caught by the database constraint instead of the index."""
+        with self._lock:
+            self._stats["conflicts"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report hit/miss counters and sizes.
+
+        Returns:
+            Dict with counters, entry counts and the share of alerts answered from the index
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._conn.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["duplicates"] = stats["memory_hits"] + stats["disk_hits"] + stats["conflicts"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        """Insert into the LRU, evicting the least recently used entry if full (caller holds the lock)."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float) -> None:
+        """Drop expired entries, then the oldest ones above max_entries (caller holds the lock)."""
+        evicted = self._conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,)).rowcount
+        evicted += self._conn.execute(
+            """
+            DELETE FROM idempotency_keys WHERE key IN (
+                SELECT key FROM idempotency_keys ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,)
+        ).rowcount
+        if evicted:
+            self._stats["evictions"] += evicted
+            logger.info(f"Evicted {evicted} idempotency key(s)")
+
+
+_index: Optional[IdempotencyIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_idempotency_index() -> Optional[IdempotencyIndex]:
+    """
+    Return the process-wide index, creating it on first use.
+
+    Returns:
+        The shared IdempotencyIndex, or None when IDEMPOTENCY_ENABLED is false
+    """
+    global _index
+    if os.getenv("IDEMPOTENCY_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = IdempotencyIndex()
+    return _index
@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from latency_tracker import LatencyTracker
+
+# Pillow is imported on first use: the dashboard only needs thumbnail_url()
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Objects are named by content hash: full/<sha256>.<ext> and thumbs/<sha256>.webp
+FULL_PREFIX = "full"
+THUMB_PREFIX = "thumbs"
+FULL_PATH_PATTERN = re.compile(rf"/{FULL_PREFIX}/([0-9a-f]{{64}})\.\w+")
+
+CONTENT_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def thumbnail_path(content_hash: str) -> str:
+    """Storage path of the thumbnail for a content hash."""
+    return f"{THUMB_PREFIX}/{content_hash}.webp"
+
+
+def thumbnail_url(screenshot_url: Optional[str]) -> Optional[str]:
+    """
+    Derive the thumbnail URL from a full-size screenshot URL.
+
+    Args:
+        screenshot_url: Public URL of a screenshot stored by the pipeline
+
+    Returns:
+        Public URL of its thumbnail, or None for screenshots uploaded before the pipeline
+    """
+    if not screenshot_url:
+        return None
+    match = FULL_PATH_PATTERN.search(screenshot_url)
+    if not match:
+        return None
+    return screenshot_url[:match.start()] + "/" + thumbnail_path(match.group(1)) + screenshot_url[match.end():]
+
+
+class ImagePipeline:
+    """
+    Screenshot processing stage run before any upload to Storage.
+
+    - Re-encodes the image to WebP (downscaled to max_dimension), keeping the
+      original bytes when they are already smaller
+    - Produces a small WebP thumbnail for the journal
+    - Names objects by the SHA-256 of the original bytes, so the same
+      screenshot sent twice maps to the same objects and is stored once
+    """
+
+    def __init__(
+        self,
+        max_dimension: Optional[int] = None,
+        quality: Optional[int] = None,
+        thumbnail_size: Optional[int] = None
+    ):
+        """
+        Initialize the pipeline.
+
+        Args:
+            max_dimension: Longest side of the stored image in pixels
+            quality: WebP quality (0-100)
+            thumbnail_size: Longest side of the thumbnail in pixels
+        """
+        self.max_dimension = max_dimension or _env_int("SCREENSHOT_MAX_DIMENSION", 1920)
+        self.quality = quality or _env_int("SCREENSHOT_QUALITY", 80)
+        self.thumbnail_size = thumbnail_size or _env_int("SCREENSHOT_THUMBNAIL_SIZE", 320)
+
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self._counters = {
+            "images": 0,
+            "deduplicated": 0,
+            "original_bytes": 0,
+            "stored_bytes": 0,
+            "thumbnail_bytes": 0,
+        }
+
+    def _encode_webp(self, image: "Image.Image", quality: int) -> bytes:
+        buffer = BytesIO()
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+        return buffer.getvalue()
+
+    def process(self, data: bytes) -> Dict[str, Any]:
+        """
+        Re-encode an image and build its thumbnail.
+
+        Args:
+            data: Raw image bytes (PNG, JPEG or WebP)
+
+        Returns:
+            Dict with hash, path, content_type, full (bytes), thumbnail_path,
+            thumbnail (bytes), original_bytes, stored_bytes, thumbnail_bytes and processing_ms
+
+        Raises:
+            ValueError: If the data is not a readable image
+        """
+        from PIL import Image, ImageOps
+
+        started = time.perf_counter()
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        try:
+            image = Image.open(BytesIO(data))
+            source_format = image.format
+            image = ImageOps.exif_transpose(image)
+        except Exception as e:
+            raise ValueError(f"Invalid image data: {str(e)}")
+
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        full_image = image.copy()
+        full_image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+        full = self._encode_webp(full_image, self.quality)
+        content_type = "image/webp"
+        extension = "webp"
+
+        # Screenshots with large flat areas can already be smaller as PNG
+        if len(data) <= len(full) and source_format in CONTENT_TYPES and full_image.size == image.size:
+            full = data
+            content_type = CONTENT_TYPES[source_format]
+            extension = "jpg" if source_format == "JPEG" else source_format.lower()
+
+        thumb_image = image.copy()
+        thumb_image.thumbnail((self.thumbnail_size, self.thumbnail_size), Image.LANCZOS)
+        thumbnail = self._encode_webp(thumb_image, self.quality)
+
+        elapsed = time.perf_counter() - started
+        self.latency.record(elapsed)
+        with self._lock:
+            self._counters["images"] += 1
+            self._counters["original_bytes"] += len(data)
+            self._counters["stored_bytes"] += len(full)
+            self._counters["thumbnail_bytes"] += len(thumbnail)
+
+        logger.info(
+            f"Processed screenshot {content_hash[:12]}: {len(data)} -> {len(full)} bytes "
+            f"(thumbnail {len(thumbnail)} bytes) in {elapsed * 1000:.1f} ms"
+        )
+        return {
+            "hash": content_hash,
+            "path": f"{FULL_PREFIX}/{content_hash}.{extension}",
+            "content_type": content_type,
+            "full": full,
+            "thumbnail_path": thumbnail_path(content_hash),
+            "thumbnail": thumbnail,
+            "original_bytes": len(data),
+            "stored_bytes": len(full),
+            "thumbnail_bytes": len(thumbnail),
+            "processing_ms": round(elapsed * 1000, 2),
+        }
+
+    def record_duplicate(self, result: Dict[str, Any]) -> None:
+        """
+        Count an image whose objects were already in Storage.
+
+        Args:
+            result: Output of process() for the duplicate image
+        """
+        with self._lock:
+            self._counters["deduplicated"] += 1
+            self._counters["stored_bytes"] -= result["stored_bytes"]
+            self._counters["thumbnail_bytes"] -= result["thumbnail_bytes"]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Processing statistics.
+
+        Returns:
+            Dict with image counts, bytes written to Storage, bytes_saved
+            (re-encoding and deduplication) and processing latency
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "bytes_saved": counters["original_bytes"] - counters["stored_bytes"],
+            "processing": self.latency.snapshot(),
+        }
+
+
+_pipeline: Optional[ImagePipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> ImagePipeline:
+    """Return the process-wide image pipeline."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = ImagePipeline()
+        return _pipeline
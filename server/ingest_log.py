@@ -0,0 +1,538 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+from latency_tracker import LatencyTracker
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ingest_log.sqlite3")
+
+STATUS_PENDING = "pending"
+# In Supabase, follow-ups (screenshot upload, AI job) not run yet: the image is kept
+STATUS_STORED = "stored"
+STATUS_REPLAYED = "replayed"
+STATUS_FAILED = "failed"
+
+
+def ingest_mode() -> str:
+    """"direct" inserts in Supabase during the webhook, "wal" acknowledges once the alert is in the local log."""
+    return os.getenv("INGEST_MODE", "direct").lower()
+
+
+def follow_up_job_id(kind: str, row_id: str) -> str:
+    """Id of the AI job queued for a replayed row, the same every time its follow-ups run (see JobQueue.enqueue)."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"ingest/{kind}/{row_id}"))
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """
+    Whether a replay error comes from the row itself rather than from the connection.
+
+    PostgREST errors carry a Postgres SQLSTATE (e.g. 22P02, 23502) or a
+    PGRST code; PGRST000-PGRST003 mean the database could not be reached.
+    Network errors and non-JSON gateway responses have no code.
+    """
+    code = getattr(error, "code", None)
+    return bool(code) and not str(code).startswith("PGRST00")
+
+
+class IngestLog:
+    """
+    Append-only log of accepted webhook alerts, in SQLite (WAL mode, synchronous=FULL).
+
+    append() returns once the entry is committed and fsynced, so the webhook
+    can be acknowledged on local disk latency alone. Each entry carries the
+    row to insert with an id assigned here, which makes the replay to
+    Supabase idempotent: replaying an entry twice never creates two rows.
+    created_at is stamped here too, so a row replayed after an outage keeps
+    the time the alert was received rather than the time of the replay.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Initialize the log and create its table if needed.
+
+        Args:
+            db_path: Path of the SQLite database file
+        """
+        self.db_path = db_path or os.getenv("INGEST_LOG_PATH", DEFAULT_DB_PATH)
+        self._local = threading.local()
+        self.append_latency = LatencyTracker()
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._init_db()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the SQLite connection owned by the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: every commit is fsynced before append() returns
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        """Create the log table and its index."""
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                row_id TEXT NOT NULL UNIQUE,
+                target TEXT NOT NULL,
+                row TEXT NOT NULL,
+                image BLOB,
+                ai_job TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                appended_at REAL NOT NULL,
+                replayed_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ingest_log_status ON ingest_log (status, seq)")
+
+    def append(
+        self,
+        table: str,
+        row: Dict[str, Any],
+        image: Optional[bytes] = None,
+        ai_job: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Durably append an alert.
+
+        Args:
+            table: Target table ("trades" or "structures")
+            row: Row to insert; an id and a created_at (UTC) are assigned if it has none
+            image: Decoded screenshot, uploaded once the row is replayed
+            ai_job: Job kind to enqueue once the row is replayed (None for no AI analysis)
+
+        Returns:
+            Dict with the log sequence number and the row (including its id)
+        """
+        started = time.perf_counter()
+        row = {
+            **row,
+            "id": row.get("id") or str(uuid.uuid4()),
+            "created_at": row.get("created_at") or datetime.now(timezone.utc).isoformat(),
+        }
+        cursor = self._connection().execute(
+            "INSERT INTO ingest_log (row_id, target, row, image, ai_job, status, appended_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (row["id"], table, json.dumps(row, default=str), image, ai_job, STATUS_PENDING, time.time())
+        )
+        self.append_latency.record(time.perf_counter() - started)
+        return {"seq": cursor.lastrowid, "row": row}
+
+    def pending(self, limit: int) -> List[sqlite3.Row]:
+        """Oldest pending entries, in log order."""
+        return self._connection().execute(
+            "SELECT * FROM ingest_log WHERE status = ? ORDER BY seq LIMIT ?",
+            (STATUS_PENDING, limit)
+        ).fetchall()
+
+    def stored(self, limit: int) -> List[sqlite3.Row]:
+        """Oldest entries stored in Supabase whose follow-ups have not run, in log order."""
+        return self._connection().execute(
+            "SELECT * FROM ingest_log WHERE status = ? ORDER BY seq LIMIT ?",
+            (STATUS_STORED, limit)
+        ).fetchall()
+
+    def mark_stored(self, seqs: List[int]) -> None:
+        """Mark entries as stored in Supabase, keeping their screenshot for the follow-ups."""
+        self._connection().executemany(
+            "UPDATE ingest_log SET status = ?, last_error = NULL WHERE seq = ?",
+            [(STATUS_STORED, seq) for seq in seqs]
+        )
+
+    def mark_replayed(self, seqs: List[int], note: Optional[str] = None) -> None:
+        """Mark entries as stored with their follow-ups done, and drop their screenshot bytes."""
+        self._connection().executemany(
+            "UPDATE ingest_log SET status = ?, replayed_at = ?, image = NULL, last_error = ? WHERE seq = ?",
+            [(STATUS_REPLAYED, time.time(), note, seq) for seq in seqs]
+        )
+
+    def mark_attempt(self, seqs: List[int], error: Exception, failed: bool = False) -> None:
+        """Count a failed replay attempt; `failed` takes the entries out of the replay."""
+        self._connection().executemany(
+            "UPDATE ingest_log SET attempts = attempts + 1, last_error = ?, status = ? WHERE seq = ?",
+            [(str(error), STATUS_FAILED if failed else STATUS_PENDING, seq) for seq in seqs]
+        )
+
+    def requeue(self, seqs: Optional[List[int]] = None) -> int:
+        """
+        Put failed entries back in the replay.
+
+        Args:
+            seqs: Entries to requeue (all failed entries when None)
+
+        Returns:
+            Number of entries requeued
+        """
+        conn = self._connection()
+        if seqs is None:
+            return conn.execute("UPDATE ingest_log SET status = ? WHERE status = ?", (STATUS_PENDING, STATUS_FAILED)).rowcount
+        return sum(
+            conn.execute(
+                "UPDATE ingest_log SET status = ? WHERE seq = ? AND status = ?", (STATUS_PENDING, seq, STATUS_FAILED)
+            ).rowcount
+            for seq in seqs
+        )
+
+    def entries(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent entries (without screenshot bytes), optionally filtered by status."""
+        query = (
+            "SELECT seq, row_id, target, row, ai_job, status, attempts, last_error, appended_at, replayed_at, "
+            "LENGTH(image) AS image_bytes FROM ingest_log"
+        )
+        params: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        rows = self._connection().execute(query + " ORDER BY seq DESC LIMIT ?", params + (limit,)).fetchall()
+        return [{**dict(row), "row": json.loads(row["row"])} for row in rows]
+
+    def compact(self, retention_s: float) -> int:
+        """Delete replayed entries older than the retention; returns the number deleted."""
+        return self._connection().execute(
+            "DELETE FROM ingest_log WHERE status = ? AND replayed_at < ?",
+            (STATUS_REPLAYED, time.time() - retention_s)
+        ).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the replay lag and the log size.
+
+        Returns:
+            Dict with counts per status, the age of the oldest pending entry
+            (replay lag), the sequence numbers of the log head and of the
+            last replayed entry, and the append (fsync) latency
+        """
+        conn = self._connection()
+        counts = {status: 0 for status in (STATUS_PENDING, STATUS_STORED, STATUS_REPLAYED, STATUS_FAILED)}
+        for row in conn.execute("SELECT status, COUNT(*) AS n FROM ingest_log GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        oldest = conn.execute(
+            "SELECT MIN(appended_at) AS oldest FROM ingest_log WHERE status = ?", (STATUS_PENDING,)
+        ).fetchone()["oldest"]
+        head = conn.execute("SELECT MAX(seq) AS seq FROM ingest_log").fetchone()["seq"]
+        replayed = conn.execute(
+            "SELECT MAX(seq) AS seq FROM ingest_log WHERE status = ?", (STATUS_REPLAYED,)
+        ).fetchone()["seq"]
+
+        return {
+            "counts": counts,
+            "lag_entries": counts[STATUS_PENDING],
+            "lag_s": round(time.time() - oldest, 2) if oldest else 0.0,
+            "head_seq": head or 0,
+            "last_replayed_seq": replayed or 0,
+            "append_latency": self.append_latency.snapshot(),
+        }
+
+
+ReplayCallback = Callable[[str, Dict[str, Any], Optional[bytes], Optional[str]], None]
+
+
+class Replayer:
+    """
+    Pushes the ingest log to Supabase in log order, in batches.
+
+    Rows are upserted on their id with duplicates ignored, so an entry
+    replayed again after a crash (stored in Supabase, not yet marked in the
+    log) is a no-op: each alert is stored exactly once. Connection errors
+    are retried with exponential backoff without giving up, so an outage
+    only delays the replay; an entry rejected by the database itself is
+    marked failed and left for inspection (see the CLI below).
+
+    A stored entry is marked `stored` before its follow-ups run, and
+    `replayed` (image dropped) once they are done. Without on_replayed
+    (the CLI), entries stay `stored` with their image until a replayer
+    that has it, the server's, runs their follow-ups. A crash between the
+    follow-ups and the marking runs them again: the AI job id is derived
+    from the row (follow_up_job_id), so it is not queued twice.
+    """
+
+    def __init__(
+        self,
+        log: IngestLog,
+        client,
+        on_replayed: Optional[ReplayCallback] = None,
+        batch_size: Optional[int] = None,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 60.0,
+        poll_interval: float = 0.5,
+        retention_s: Optional[float] = None
+    ):
+        """
+        Initialize the replayer.
+
+        Args:
+            log: Ingest log to replay
+            client: SupabaseClient used for the upserts
+            on_replayed: Called with (table, row, image, ai_job) once a row is stored,
+                         to upload its screenshot and queue its AI analysis; must be safe
+                         to call twice for the same row
+            batch_size: Maximum rows per upsert
+            retry_delay: Base delay in seconds after a connection error (doubled each time)
+            max_retry_delay: Upper bound of the retry delay
+            poll_interval: Seconds the thread sleeps when the log is empty
+            retention_s: Replayed entries older than this are deleted
+        """
+        self.log = log
+        self.client = client
+        self.on_replayed = on_replayed
+        self.batch_size = batch_size or int(os.getenv("INGEST_REPLAY_BATCH_SIZE", "50"))
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.poll_interval = poll_interval
+        self.retention_s = retention_s or float(os.getenv("INGEST_RETENTION_HOURS", "24")) * 3600
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._counters = {"replayed": 0, "duplicates": 0, "failed": 0, "batches": 0, "retries": 0}
+        self._consecutive_errors = 0
+        self._last_error: Optional[str] = None
+        self.batch_latency = LatencyTracker()
+        self.end_to_end_latency = LatencyTracker()
+
+    def start(self) -> None:
+        """Start the replay thread."""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-replayer", daemon=True)
+        self._thread.start()
+        logger.info(f"Started ingest replayer on {self.log.db_path}")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the replay thread after its current batch."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wake(self) -> None:
+        """Signal that new entries were appended."""
+        self._wakeup.set()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += n
+
+    def _stored(self, entries: List[sqlite3.Row], note: Optional[str] = None) -> None:
+        """Record entries stored in Supabase, then run their follow-up actions."""
+        now = time.time()
+        for entry in entries:
+            self.end_to_end_latency.record(now - entry["appended_at"])
+        if note is not None:
+            # Duplicates: the alert was stored, and followed up, under another id
+            self.log.mark_replayed([entry["seq"] for entry in entries], note)
+            return
+        self.log.mark_stored([entry["seq"] for entry in entries])
+        self._follow_up(entries)
+
+    def _follow_up(self, entries: List[sqlite3.Row]) -> int:
+        """
+        Upload the screenshots and queue the AI jobs of stored entries, then mark them replayed.
+
+        Returns:
+            Number of entries followed up; an entry whose follow-up fails stays stored and is retried
+        """
+        if self.on_replayed is None:
+            return 0
+        done = []
+        for entry in entries:
+            try:
+                self.on_replayed(entry["target"], json.loads(entry["row"]), entry["image"], entry["ai_job"])
+                done.append(entry["seq"])
+            except Exception as e:
+                logger.error(f"Error in follow-up of ingest entry {entry['seq']}: {str(e)}")
+        self.log.mark_replayed(done)
+        return len(done)
+
+    def _replay_run(self, table: str, entries: List[sqlite3.Row]) -> None:
+        """
+        Upsert consecutive entries of one table, falling back to row by row on a row error.
+
+        Raises:
+            Exception: On a connection error; entries not yet stored stay pending
+        """
+        try:
+            self.client.upsert_rows(table, [json.loads(entry["row"]) for entry in entries])
+            self._stored(entries)
+            self._count("replayed", len(entries))
+            return
+        except Exception as e:
+            if not is_permanent_error(e):
+                self.log.mark_attempt([entry["seq"] for entry in entries], e)
+                raise
+            logger.warning(f"Replay of {len(entries)} {table} row(s) rejected, retrying one by one: {str(e)}")
+
+        for entry in entries:
+            try:
+                self.client.upsert_rows(table, [json.loads(entry["row"])])
+                self._stored([entry])
+                self._count("replayed")
+            except Exception as e:
+                if not is_permanent_error(e):
+                    self.log.mark_attempt([entry["seq"]], e)
+                    raise
+                if getattr(e, "code", None) == "23505":
+                    # Same alert already stored under another id (idempotency_key): nothing to add
+                    self._stored([entry], note=f"duplicate: {str(e)}")
+                    self._count("duplicates")
+                    logger.info(f"Ingest entry {entry['seq']} is a duplicate, skipped")
+                else:
+                    self.log.mark_attempt([entry["seq"]], e, failed=True)
+                    self._count("failed")
+                    logger.error(f"Ingest entry {entry['seq']} rejected by {table}: {str(e)}")
+
+    def replay_once(self) -> int:
+        """
+        Replay one batch of pending entries in log order.
+
+        Entries stored without their follow-ups (replayed by the CLI, or
+        interrupted by a crash) are followed up first.
+
+        Returns:
+            Number of entries handled (0 when the log is drained)
+
+        Raises:
+            Exception: On a connection error
+        """
+        followed_up = self._follow_up(self.log.stored(self.batch_size)) if self.on_replayed is not None else 0
+        entries = self.log.pending(self.batch_size)
+        if not entries:
+            return followed_up
+
+        started = time.perf_counter()
+        # Consecutive entries of the same table and columns go in one upsert
+        # (PostgREST takes the columns of a bulk insert from its first row), keeping the log order
+        runs: List[List[sqlite3.Row]] = []
+        columns = None
+        for entry in entries:
+            entry_columns = (entry["target"], tuple(sorted(json.loads(entry["row"]))))
+            if runs and entry_columns == columns:
+                runs[-1].append(entry)
+            else:
+                runs.append([entry])
+            columns = entry_columns
+        for run in runs:
+            self._replay_run(run[0]["target"], run)
+
+        self.batch_latency.record(time.perf_counter() - started)
+        self._count("batches")
+        return followed_up + len(entries)
+
+    def _run(self) -> None:
+        """Replay until stop() is called, backing off on connection errors."""
+        last_compaction = 0.0
+        while not self._stopping.is_set():
+            try:
+                handled = self.replay_once()
+                self._consecutive_errors = 0
+            except Exception as e:
+                self._consecutive_errors += 1
+                self._last_error = str(e)
+                self._count("retries")
+                delay = min(self.retry_delay * (2 ** (self._consecutive_errors - 1)), self.max_retry_delay)
+                logger.warning(f"Ingest replay failed ({self._consecutive_errors} in a row), retrying in {delay:.1f}s: {str(e)}")
+                self._stopping.wait(delay)
+                continue
+
+            if time.time() - last_compaction > 3600:
+                last_compaction = time.time()
+                deleted = self.log.compact(self.retention_s)
+                if deleted:
+                    logger.info(f"Compacted {deleted} replayed ingest entries")
+
+            if handled == 0:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report replay progress and lag.
+
+        Returns:
+            Dict with the log statistics (lag, counts, append latency), replay
+            counters, the current error streak and latency summaries
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **self.log.stats(),
+            **counters,
+            "running": self._thread is not None,
+            "consecutive_errors": self._consecutive_errors,
+            "last_error": self._last_error,
+            "batch_latency": self.batch_latency.snapshot(),
+            "end_to_end_latency": self.end_to_end_latency.snapshot(),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Inspect or replay the ingest log from the command line."""
+    parser = argparse.ArgumentParser(description="Inspect or replay the webhook ingest log")
+    parser.add_argument("--path", help="Log file (defaults to INGEST_LOG_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Replay lag and counts per status")
+    show = commands.add_parser("list", help="Most recent entries")
+    show.add_argument("--status", choices=[STATUS_PENDING, STATUS_STORED, STATUS_REPLAYED, STATUS_FAILED])
+    show.add_argument("--limit", type=int, default=20)
+    replay = commands.add_parser("replay", help="Replay pending entries to Supabase until the log is drained")
+    replay.add_argument("--failed", action="store_true", help="Requeue failed entries first")
+    replay.add_argument("--seq", type=int, action="append", help="Requeue only this failed entry (repeatable)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    log = IngestLog(args.path)
+
+    if args.command == "stats":
+        print(json.dumps(log.stats(), indent=2))
+        return 0
+
+    if args.command == "list":
+        for entry in log.entries(args.status, args.limit):
+            print(json.dumps(entry, default=str))
+        return 0
+
+    if args.failed or args.seq:
+        print(f"Requeued {log.requeue(args.seq)} failed entries")
+
+    from clients import get_supabase_client
+
+    # Only the rows are replayed here: the entries stay `stored`, with their screenshot,
+    # until the server's replayer uploads it and queues the AI job
+    replayer = Replayer(log, get_supabase_client())
+    total = 0
+    while True:
+        handled = replayer.replay_once()
+        if not handled:
+            break
+        total += handled
+    print(json.dumps({"handled": total, **{k: v for k, v in replayer.stats().items() if k in ("replayed", "duplicates", "failed", "counts")}}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+from latency_tracker import LatencyTracker
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "jobs.sqlite3")
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+JobHandler = Callable[[Dict[str, Any]], Any]
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    """Whether the process that claimed a job ("<pid>:<queue>") is still running on this machine."""
+    try:
+        pid = int((owner or "").split(":", 1)[0])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """
+    Persistent job queue backed by SQLite with a pool of worker threads.
+
+    Jobs survive a process restart. Claiming a job happens inside an
+    immediate transaction so several processes (e.g. the Flask reloader and
+    its child) can share the same database file. A claimed job records its
+    owner (pid and queue instance) and a heartbeat refreshed while it runs;
+    a "running" job is put back to "pending", in the same transaction as a
+    claim, only once its owner process is gone or its lease has expired.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        num_workers: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        retry_delay: float = 5.0,
+        poll_interval: float = 1.0,
+        lease: Optional[float] = None
+    ):
+        """
+        Initialize the queue and create the jobs table if needed.
+
+        Args:
+            db_path: Path of the SQLite database file
+            num_workers: Number of worker threads started by start()
+            max_attempts: Attempts before a job is marked as failed
+            retry_delay: Base delay in seconds before retrying a failed job (doubled on each attempt)
+            poll_interval: Seconds a worker sleeps when the queue is empty
+            lease: Seconds without a heartbeat after which a running job is taken back
+        """
+        self.db_path = db_path or os.getenv("AI_JOB_QUEUE_PATH", DEFAULT_DB_PATH)
+        self.num_workers = num_workers or int(os.getenv("AI_JOB_WORKERS", "2"))
+        self.max_attempts = max_attempts or int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.lease = lease or float(os.getenv("AI_JOB_LEASE_SECONDS", "60"))
+        # Pid first so a later process can tell whether the owner of a running job is still alive
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._workers: List[threading.Thread] = []
+        self._async_workers = 0
+        self._heartbeat: Optional[threading.Thread] = None
+        self._notify_async: Optional[Callable[[], None]] = None
+        self.wait_latency = LatencyTracker()
+        self.run_latency = LatencyTracker()
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._init_db()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the SQLite connection owned by the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        """Create the jobs table and its index."""
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                enqueued_at REAL NOT NULL,
+                available_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                heartbeat_at REAL
+            )
+        """)
+        # Files created before the lease columns
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at)")
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """
+        Register the function that processes jobs of a given kind.
+
+        Args:
+            kind: Job kind (e.g. "trade_feedback")
+            handler: Callable receiving the job payload; its return value is stored as the job result
+                     (may be a coroutine function when the queue is run with run_async())
+        """
+        self._handlers[kind] = handler
+
+    def _requeue_interrupted(self, conn: sqlite3.Connection, now: float) -> None:
+        """Put back to pending the running jobs whose owner is gone or whose lease expired (caller holds the transaction)."""
+        stale = [
+            row["id"] for row in conn.execute(
+                "SELECT id, owner, heartbeat_at FROM jobs WHERE status = ?", (STATUS_RUNNING,)
+            )
+            if not _owner_alive(row["owner"]) or (row["heartbeat_at"] or 0) < now - self.lease
+        ]
+        if stale:
+            conn.executemany(
+                "UPDATE jobs SET status = ?, owner = NULL WHERE id = ? AND status = ?",
+                [(STATUS_PENDING, job_id, STATUS_RUNNING) for job_id in stale]
+            )
+            logger.info(f"Requeued {len(stale)} interrupted job(s)")
+
+    def _start_heartbeat(self) -> None:
+        """Start the thread renewing the lease of the jobs this queue is running."""
+        if self._heartbeat is not None and self._heartbeat.is_alive():
+            return
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stopping.wait(self.lease / 3):
+            try:
+                self._connection().execute(
+                    "UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND owner = ?",
+                    (time.time(), STATUS_RUNNING, self.owner)
+                )
+            except Exception as e:
+                logger.error(f"Error renewing job leases: {str(e)}")
+
+    def start(self) -> None:
+        """Start the worker threads (jobs left running by a crashed process are taken back when claiming)."""
+        if self._workers:
+            return
+
+        self._stopping.clear()
+        self._start_heartbeat()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Started {self.num_workers} job worker(s) on {self.db_path}")
+
+    async def run_async(self, concurrency: Optional[int] = None) -> None:
+        """
+        Run jobs on the current event loop instead of worker threads (see async_app.py).
+
+        Registered handlers may be coroutine functions; SQLite calls go through
+        asyncio.to_thread. Runs until cancelled.
+
+        Args:
+            concurrency: Number of jobs run at once (defaults to num_workers)
+        """
+        import asyncio
+
+        self._start_heartbeat()
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        self._notify_async = lambda: loop.call_soon_threadsafe(wakeup.set)
+
+        async def worker() -> None:
+            while True:
+                try:
+                    row = await asyncio.to_thread(self._claim_next)
+                except Exception as e:
+                    logger.error(f"Error claiming job: {str(e)}")
+                    row = None
+
+                if row is None:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    wakeup.clear()
+                    continue
+
+                started = self._job_started(row)
+                try:
+                    result = self._handlers[row["kind"]](json.loads(row["payload"]))
+                    if asyncio.iscoroutine(result):
+                        result = await result
+                except Exception as e:
+                    await asyncio.to_thread(self._job_failed, row, started, e)
+                else:
+                    await asyncio.to_thread(self._job_done, row, started, result)
+
+        concurrency = concurrency or self.num_workers
+        self._async_workers += concurrency
+        logger.info(f"Running {concurrency} async job worker(s) on {self.db_path}")
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            self._async_workers -= concurrency
+            self._notify_async = None
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stop the worker threads after their current job.
+
+        Args:
+            timeout: Seconds to wait for each worker to exit
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+        """
+        Persist a new job and wake up a worker.
+
+        Args:
+            kind: Job kind, must have a registered handler
+            payload: JSON-serializable job input
+            job_id: Id to use instead of a random one; a job already queued
+                    under this id is kept and not queued again
+
+        Returns:
+            The job id
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+
+        if job_id is None:
+            job_id = str(uuid.uuid4())
+        now = time.time()
+        inserted = self._connection().execute(
+            "INSERT OR IGNORE INTO jobs (id, kind, payload, status, enqueued_at, available_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload, default=str), STATUS_PENDING, now, now)
+        ).rowcount
+        if not inserted:
+            logger.info(f"{kind} job {job_id} already queued")
+            return job_id
+        self._wakeup.set()
+        if self._notify_async is not None:
+            self._notify_async()
+        logger.info(f"Enqueued {kind} job {job_id}")
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the public status of a job.
+
+        Args:
+            job_id: Id returned by enqueue()
+
+        Returns:
+            Dict describing the job, or None if it does not exist
+        """
+        row = self._connection().execute(
+            "SELECT id, kind, status, attempts, result, error, enqueued_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report queue depth per status and wait/processing latencies.
+
+        Returns:
+            Dict with counts per status, the age of the oldest pending job and latency summaries
+        """
+        conn = self._connection()
+        counts = {status: 0 for status in (STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED)}
+        for row in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row["status"]] = row["n"]
+
+        oldest = conn.execute(
+            "SELECT MIN(enqueued_at) AS oldest FROM jobs WHERE status = ?",
+            (STATUS_PENDING,)
+        ).fetchone()["oldest"]
+
+        return {
+            "depth": counts[STATUS_PENDING],
+            "counts": counts,
+            "oldest_pending_age_s": round(time.time() - oldest, 2) if oldest else 0.0,
+            "workers": len(self._workers) + self._async_workers,
+            "wait_latency": self.wait_latency.snapshot(),
+            "run_latency": self.run_latency.snapshot(),
+        }
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """Atomically take back interrupted jobs, then move the oldest available pending job to running."""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._requeue_interrupted(conn, now)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND available_at <= ? ORDER BY enqueued_at LIMIT 1",
+                (STATUS_PENDING, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1, owner = ?, heartbeat_at = ? "
+                    "WHERE id = ?",
+                    (STATUS_RUNNING, now, self.owner, now, row["id"])
+                )
+            conn.execute("COMMIT")
+            return row
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _job_started(self, row: sqlite3.Row) -> float:
+        """Record the queue wait of a claimed job; returns its start time."""
+        started = time.time()
+        self.wait_latency.record(started - row["enqueued_at"])
+        return started
+
+    def _job_done(self, row: sqlite3.Row, started: float, result: Any) -> None:
+        """Store the result of a successful job."""
+        finished = time.time()
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, finished_at = ? WHERE id = ? AND owner = ?",
+            (STATUS_DONE, json.dumps(result, default=str), finished, row["id"], self.owner)
+        )
+        self.run_latency.record(finished - started)
+        logger.info(f"Job {row['id']} ({row['kind']}) done in {finished - started:.2f}s")
+
+    def _job_failed(self, row: sqlite3.Row, started: float, error: Exception) -> None:
+        """Schedule a retry of a failed job, or mark it failed after the last attempt."""
+        conn = self._connection()
+        attempts = row["attempts"] + 1
+        finished = time.time()
+        self.run_latency.record(finished - started)
+        if attempts < self.max_attempts:
+            retry_at = finished + self.retry_delay * (2 ** (attempts - 1))
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?, owner = NULL WHERE id = ? AND owner = ?",
+                (STATUS_PENDING, str(error), retry_at, row["id"], self.owner)
+            )
+            logger.warning(f"Job {row['id']} ({row['kind']}) failed, attempt {attempts}/{self.max_attempts}: {str(error)}")
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND owner = ?",
+                (STATUS_FAILED, str(error), finished, row["id"], self.owner)
+            )
+            logger.error(f"Job {row['id']} ({row['kind']}) failed permanently: {str(error)}")
+
+    def _run_job(self, row: sqlite3.Row) -> None:
+        """Execute one claimed job and record its outcome."""
+        started = self._job_started(row)
+        try:
+            handler = self._handlers[row["kind"]]
+            result = handler(json.loads(row["payload"]))
+        except Exception as e:
+            self._job_failed(row, started, e)
+            return
+        self._job_done(row, started, result)
+
+    def _worker_loop(self) -> None:
+        """Claim and run jobs until stop() is called."""
+        while not self._stopping.is_set():
+            try:
+                row = self._claim_next()
+            except Exception as e:
+                logger.error(f"Error claiming job: {str(e)}")
+                row = None
+
+            if row is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._run_job(row)
@@ -0,0 +1,73 @@
+import threading
+from collections import deque
+from typing import Dict
+
+
+class LatencyTracker:
+    """Thread-safe rolling window of latency samples, reported in milliseconds."""
+
+    def __init__(self, window: int = 1000):
+        """
+        Initialize the tracker.
+
+        Args:
+            window: Number of most recent samples kept for percentile computation
+        """
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._total = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        """
+        Record one latency sample.
+
+        Args:
+            seconds: Measured duration in seconds
+        """
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+            self._total += seconds
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Summarize the recorded samples.
+
+        Returns:
+            Dict with the total sample count, the all-time average and the
+            p50/p95/p99/max of the rolling window, all in milliseconds
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+            total = self._total
+
+        if not samples:
+            return {"count": 0, "avg_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+
+        return {
+            "count": count,
+            "avg_ms": round(total / count * 1000, 2),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+        }
+
+
+def percentile(sorted_samples, pct: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted sequence.
+
+    Args:
+        sorted_samples: Samples sorted in ascending order
+        pct: Percentile between 0 and 100
+
+    Returns:
+        The sample at the requested percentile (0.0 if there are no samples)
+    """
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, int(round(pct / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[rank]
@@ -0,0 +1,288 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "llm_cache.sqlite3")
+
+# Disk eviction runs once every N writes instead of on every insert
+EVICTION_INTERVAL = 100
+
+# Memory hits are written to last_access on disk in batches of this many keys (and before every eviction)
+TOUCH_BATCH_SIZE = 32
+
+
+def normalize_value(value: Any) -> Any:
+    """
+    Normalize a prompt input so that equivalent values hash identically.
+
+    Numbers (including numpy scalars and numeric strings) become rounded
+    floats, strings have their whitespace collapsed, NaN becomes None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return {str(k): normalize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_value(v) for v in value]
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        text = " ".join(value.split())
+        try:
+            number = float(text)
+        except ValueError:
+            return text
+        return round(number, 6) if math.isfinite(number) else text
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return " ".join(str(value).split())
+    return None if math.isnan(number) else round(number, 6)
+
+
+def make_cache_key(inputs: Dict[str, Any], model: str, temperature: float, max_tokens: int) -> str:
+    """
+    Build the cache key for one completion.
+
+    Args:
+        inputs: Prompt inputs (kind, template version, fields used by the prompt)
+        model: OpenAI model name
+        temperature: Sampling temperature
+        max_tokens: Completion token budget
+
+    Returns:
+        Hex SHA-256 of the canonical JSON encoding of the normalized inputs and parameters
+    """
+    canonical = json.dumps(
+        {
+            "inputs": normalize_value(inputs),
+            "model": model,
+            "temperature": round(float(temperature), 3),
+            "max_tokens": int(max_tokens),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier cache for LLM completions.
+
+    An in-memory LRU sits in front of a persistent SQLite store. Entries
+    expire after a TTL; both tiers are bounded by a number of entries and
+    evict the least recently used ones.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        memory_entries: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None
+    ):
+        """
+        Initialize the cache and create the SQLite table if needed.
+
+        Args:
+            db_path: Path of the SQLite database file
+            memory_entries: Capacity of the in-memory LRU
+            max_entries: Capacity of the persistent store
+            ttl_seconds: Lifetime of an entry
+        """
+        self.db_path = db_path or os.getenv("AI_CACHE_PATH", DEFAULT_DB_PATH)
+        self.memory_entries = memory_entries or int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "256"))
+        self.max_entries = max_entries or int(os.getenv("AI_CACHE_MAX_ENTRIES", "10000"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("AI_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        # Keys served from memory since the last flush, with their access time
+        self._touched: Dict[str, float] = {}
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypasses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "latency_saved_s": 0.0,
+        }
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                latency_s REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a completion, first in memory then on disk.
+
+        Args:
+            key: Key built with make_cache_key()
+
+        Returns:
+            The cached completion, or None on a miss or an expired entry
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, latency_s, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    # Disk eviction ranks by last_access: a hot key served from memory must stay recent there too
+                    self._touched[key] = now
+                    if len(self._touched) >= TOUCH_BATCH_SIZE:
+                        self._flush_touches()
+                    self._stats["memory_hits"] += 1
+                    self._stats["latency_saved_s"] += latency_s
+                    return value
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, latency_s, expires_at FROM llm_cache WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None or row[2] <= now:
+                self._stats["misses"] += 1
+                return None
+
+            value, latency_s, expires_at = row
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._remember(key, (value, latency_s, expires_at))
+            self._stats["disk_hits"] += 1
+            self._stats["latency_saved_s"] += latency_s
+            return value
+
+    def set(self, key: str, value: str, latency_s: float) -> None:
+        """
+        Store a completion in both tiers.
+
+        Args:
+            key: Key built with make_cache_key()
+            value: Completion text
+            latency_s: How long the API call took, used to report saved latency on hits
+        """
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._remember(key, (value, latency_s, expires_at))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, latency_s, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, latency_s, expires_at, now)
+            )
+            self._stats["stores"] += 1
+            self._writes += 1
+            if self._writes % EVICTION_INTERVAL == 0:
+                self._evict_disk(now)
+
+    def record_bypass(self) -> None:
+        """Count a lookup explicitly skipped by the caller."""
+        with self._lock:
+            self._stats["bypasses"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report hit/miss counters and the API calls and latency saved.
+
+        Returns:
+            Dict of counters, hit ratio and current tier sizes
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["api_calls_saved"] = hits
+        stats["hit_ratio"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["latency_saved_s"] = round(stats["latency_saved_s"], 2)
+        return stats
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        """Insert into the memory LRU, evicting the oldest entry when full. Caller holds the lock."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _flush_touches(self) -> None:
+        """Write the pending memory-hit access times to disk in one statement. Caller holds the lock."""
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE llm_cache SET last_access = MAX(last_access, ?) WHERE key = ?",
+            [(accessed, key) for key, accessed in self._touched.items()]
+        )
+        self._touched.clear()
+
+    def _evict_disk(self, now: float) -> None:
+        """Remove expired entries and trim the store to max_entries. Caller holds the lock."""
+        self._flush_touches()
+        expired = self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+        overflow = self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            " SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.max_entries,)
+        ).rowcount
+        self._stats["evictions"] += expired + overflow
+        if expired or overflow:
+            logger.info(f"LLM cache evicted {expired} expired and {overflow} overflow entries")
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[LLMCache]:
+    """
+    Return the process-wide cache, creating it on first use.
+
+    Returns:
+        The shared LLMCache, or None when AI_CACHE_ENABLED is false
+    """
+    global _cache
+    if os.getenv("AI_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
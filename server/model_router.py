@@ -0,0 +1,316 @@
+import os
+import json
+import logging
+import threading
+import importlib.util
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from latency_tracker import LatencyTracker
+import tracing
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Model and output budget of each tier; "standard" is the model used before tiering
+DEFAULT_TIERS = {
+    "light": {"model": "gpt-3.5-turbo", "max_tokens": 250},
+    "standard": {"model": "gpt-4-turbo-preview", "max_tokens": 500},
+    "detailed": {"model": "gpt-4-turbo-preview", "max_tokens": 700},
+}
+
+# First matching rule wins. A rule may test the kind ("trade" / "structure"),
+# the instrument and the length of the notes in tokens (after compaction)
+DEFAULT_RULES = [
+    {"max_note_tokens": 15, "tier": "light"},
+    {"min_note_tokens": 150, "tier": "detailed"},
+    {"tier": "standard"},
+]
+
+# USD per 1K tokens (prompt, completion), used to report the cost of each tier
+DEFAULT_PRICES = {
+    "gpt-3.5-turbo": [0.0005, 0.0015],
+    "gpt-4-turbo-preview": [0.01, 0.03],
+    "gpt-4-turbo": [0.01, 0.03],
+    "gpt-4o": [0.005, 0.015],
+    "gpt-4o-mini": [0.00015, 0.0006],
+}
+
+# Without tiktoken, ~4 characters per token
+CHARS_PER_TOKEN = 4
+
+TRUNCATION_MARKER = " [...] "
+
+TIER_COST = tracing.registry.register(tracing.Counter(
+    "trademind_ai_tier_cost_usd_total", "Estimated OpenAI cost by routing tier.", ("tier",)
+))
+TIER_SECONDS = tracing.registry.register(tracing.Histogram(
+    "trademind_ai_tier_duration_seconds", "OpenAI call duration by routing tier and model.", ("tier", "model")
+))
+
+
+@dataclass(frozen=True)
+class Route:
+    """Tier picked for one completion."""
+
+    tier: str
+    model: str
+    max_tokens: int
+
+
+def _env_json(name: str, default: Any) -> Any:
+    """Parse a JSON environment variable, falling back to the default when unset or invalid."""
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        return json.loads(raw)
+    except ValueError:
+        logger.error(f"Ignoring invalid JSON in {name}")
+        return default
+
+
+def compact_prompt(text: str) -> str:
+    """
+    Strip the indentation of a prompt template and collapse blank lines.
+
+    The templates in ai_feedback.py are indented f-strings: the leading
+    spaces of every line are sent (and billed) as prompt tokens.
+    """
+    lines = []
+    for line in text.strip().splitlines():
+        line = " ".join(line.split())
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+class ModelRouter:
+    """
+    Pick the model tier and output budget of each AI completion.
+
+    Notes are compacted (whitespace) and truncated to AI_NOTES_MAX_TOKENS
+    before routing, then the first rule matching the kind, instrument and
+    note length gives the tier. Every API call is recorded per tier:
+    latency, prompt/completion tokens and estimated cost.
+    """
+
+    def __init__(
+        self,
+        tiers: Optional[Dict[str, Dict[str, Any]]] = None,
+        rules: Optional[List[Dict[str, Any]]] = None,
+        prices: Optional[Dict[str, List[float]]] = None,
+        notes_max_tokens: Optional[int] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Initialize the router.
+
+        Args:
+            tiers: Tier name -> {"model", "max_tokens"} (defaults to AI_MODEL_TIERS merged over DEFAULT_TIERS)
+            rules: Ordered routing rules (defaults to AI_ROUTING_RULES or DEFAULT_RULES)
+            prices: Model -> [prompt, completion] USD per 1K tokens (defaults to AI_MODEL_PRICES merged over DEFAULT_PRICES)
+            notes_max_tokens: Notes longer than this are truncated (defaults to AI_NOTES_MAX_TOKENS or 300)
+            enabled: Route by rules; when False every call uses the "standard" tier (defaults to AI_ROUTING_ENABLED)
+        """
+        self.tiers = tiers or {**DEFAULT_TIERS, **_env_json("AI_MODEL_TIERS", {})}
+        self.rules = rules or _env_json("AI_ROUTING_RULES", DEFAULT_RULES)
+        self.prices = prices or {**DEFAULT_PRICES, **_env_json("AI_MODEL_PRICES", {})}
+        self.notes_max_tokens = notes_max_tokens if notes_max_tokens is not None else int(os.getenv("AI_NOTES_MAX_TOKENS", "300"))
+        if enabled is None:
+            enabled = os.getenv("AI_ROUTING_ENABLED", "true").lower() not in ("0", "false", "no")
+        self.enabled = enabled
+
+        if self.notes_max_tokens <= 0:
+            raise ValueError(f"AI_NOTES_MAX_TOKENS must be positive, got {self.notes_max_tokens}")
+
+        unknown = {rule.get("tier") for rule in self.rules} - set(self.tiers)
+        if unknown:
+            raise ValueError(f"Routing rules use unknown tiers: {sorted(unknown)}")
+
+        self._encoding = None
+        self._tokenizer_checked = False
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, Any]] = {}
+
+    def _tokenizer(self):
+        """tiktoken's cl100k_base encoding if tiktoken is installed, else None"""
+        if not self._tokenizer_checked:
+            if importlib.util.find_spec("tiktoken") is not None:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            self._tokenizer_checked = True
+        return self._encoding
+
+    def count_tokens(self, text: Optional[str]) -> int:
+        """
+        Count the tokens of a text.
+
+        Exact with tiktoken (cl100k_base, the encoding of the GPT-3.5/GPT-4
+        models), otherwise estimated from its length.
+        """
+        if not text:
+            return 0
+        encoding = self._tokenizer()
+        if encoding is not None:
+            return len(encoding.encode(text))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def compact_notes(self, notes: Optional[str]) -> Tuple[str, int]:
+        """
+        Collapse the whitespace of the notes and truncate them to the token limit.
+
+        Oversized notes keep their beginning (setup, reasons for the entry) and
+        their end (outcome, lessons), joined by a [...] marker. A budget too
+        small for the marker keeps the beginning only.
+
+        Returns:
+            Tuple of (compacted notes, their token count)
+        """
+        notes = " ".join(str(notes or "").split())
+        tokens = self.count_tokens(notes)
+        if tokens <= self.notes_max_tokens:
+            return notes, tokens
+
+        # Cut by characters in proportion to the token budget, 2/3 head and 1/3 tail
+        budget = int(len(notes) * self.notes_max_tokens / tokens)
+        keep = budget - len(TRUNCATION_MARKER)
+        if keep <= 0:
+            truncated = notes[:budget].rstrip()
+        else:
+            head = keep * 2 // 3
+            tail = keep - head
+            truncated = notes[:head].rstrip() + TRUNCATION_MARKER + notes[len(notes) - tail:].lstrip()
+        logger.info(f"Truncated notes from {tokens} to ~{self.notes_max_tokens} tokens")
+        return truncated, self.count_tokens(truncated)
+
+    def route(self, kind: str, instrument: Optional[str], note_tokens: int) -> Route:
+        """
+        Pick the tier of a completion.
+
+        Args:
+            kind: "trade" or "structure"
+            instrument: Instrument of the trade or structure
+            note_tokens: Token count of the compacted notes
+
+        Returns:
+            The Route of the first matching rule ("standard" if none matches or routing is disabled)
+        """
+        tier = "standard"
+        if self.enabled:
+            for rule in self.rules:
+                if self._matches(rule, kind, instrument, note_tokens):
+                    tier = rule["tier"]
+                    break
+        settings = self.tiers[tier]
+        return Route(tier, settings["model"], int(settings["max_tokens"]))
+
+    @staticmethod
+    def _matches(rule: Dict[str, Any], kind: str, instrument: Optional[str], note_tokens: int) -> bool:
+        if "kind" in rule and rule["kind"] != kind:
+            return False
+        if "instruments" in rule and instrument not in rule["instruments"]:
+            return False
+        if "min_note_tokens" in rule and note_tokens < rule["min_note_tokens"]:
+            return False
+        if "max_note_tokens" in rule and note_tokens > rule["max_note_tokens"]:
+            return False
+        return True
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """Estimated cost in USD of one call (0 for a model without a price)"""
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+    def record(self, request: Dict[str, Any], seconds: float, usage) -> None:
+        """
+        Record one API call of a routed completion.
+
+        Args:
+            request: Completion description (with "tier", "model", "kind" and the estimated "prompt_tokens")
+            seconds: Duration of the call
+            usage: `usage` of the OpenAI response (object or dict), may be None
+        """
+        tier, model = request.get("tier", "standard"), request["model"]
+        if usage is None:
+            prompt_tokens, completion_tokens = request.get("prompt_tokens", 0), 0
+        elif isinstance(usage, dict):
+            prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        else:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+
+        with self._lock:
+            stats = self._tiers.get(tier)
+            if stats is None:
+                stats = self._tiers[tier] = {
+                    "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+                    "models": {}, "latency": LatencyTracker()
+                }
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["cost_usd"] += cost
+            stats["models"][model] = stats["models"].get(model, 0) + 1
+        stats["latency"].record(seconds)
+        TIER_SECONDS.observe(seconds, tier, model)
+        TIER_COST.inc(tier, amount=cost)
+        logger.info(
+            f"AI {request['kind']} call on tier {tier} ({model}): {prompt_tokens} prompt + "
+            f"{completion_tokens} completion tokens, ${cost:.5f}, {seconds * 1000:.0f} ms"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the calls of each tier.
+
+        Returns:
+            Dict with the routing settings and, per tier, calls, models used,
+            tokens, total and average cost, and latency percentiles
+        """
+        with self._lock:
+            tiers = {name: {**stats, "models": dict(stats["models"])} for name, stats in self._tiers.items()}
+        report = {}
+        for name, stats in tiers.items():
+            report[name] = {
+                "calls": stats["calls"],
+                "models": stats["models"],
+                "prompt_tokens": stats["prompt_tokens"],
+                "completion_tokens": stats["completion_tokens"],
+                "avg_prompt_tokens": round(stats["prompt_tokens"] / stats["calls"], 1),
+                "avg_completion_tokens": round(stats["completion_tokens"] / stats["calls"], 1),
+                "cost_usd": round(stats["cost_usd"], 5),
+                "avg_cost_usd": round(stats["cost_usd"] / stats["calls"], 6),
+                "latency": stats["latency"].snapshot(),
+            }
+        return {
+            "enabled": self.enabled,
+            "tokenizer": "tiktoken" if self._tokenizer() is not None else "estimate",
+            "notes_max_tokens": self.notes_max_tokens,
+            "tier_settings": self.tiers,
+            "rules": self.rules,
+            "tiers": report,
+        }
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    """
+    Return the process-wide router, creating it on first use.
+
+    Returns:
+        The shared ModelRouter
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
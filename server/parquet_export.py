@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "parquet")
+
+EXPORT_TABLES = ("trades", "structures")
+
+# Typed columns; every other column is stored as text
+TIMESTAMP_COLUMNS = {"created_at", "updated_at", "structure_at", "exit_time"}
+FLOAT_COLUMNS = {
+    "entry_price", "stop_loss", "take_profit", "risk_reward", "computed_rr", "structure_price", "price_level",
+    "exit_price", "quantity",
+}
+# Derived in the database (full text search), not worth storing
+SKIPPED_COLUMNS = {"search_vector"}
+
+TIMESTAMP_TYPE = pa.timestamp("us", tz="UTC")
+PARTITIONING = ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive")
+
+# Written next to the partitions; the leading underscore keeps it out of the dataset
+STATE_FILE = "_export_state.json"
+
+
+def export_dir() -> str:
+    return os.getenv("PARQUET_EXPORT_DIR", DEFAULT_EXPORT_DIR)
+
+
+def _iso(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+def _column_type(column: str) -> pa.DataType:
+    if column in TIMESTAMP_COLUMNS:
+        return TIMESTAMP_TYPE
+    if column in FLOAT_COLUMNS:
+        return pa.float64()
+    return pa.string()
+
+
+def to_table(rows: Sequence[Dict[str, Any]]) -> pa.Table:
+    """
+    Convert PostgREST rows to an Arrow table with stable column types.
+
+    Types come from the column name, not from the values, so a month where a
+    column is always null still gets the same schema as the others.
+
+    Args:
+        rows: Rows as returned by the API
+
+    Returns:
+        Table with one column per key, minus SKIPPED_COLUMNS
+    """
+    df = pd.DataFrame(rows)
+    arrays, fields = [], []
+    for column in df.columns:
+        if column in SKIPPED_COLUMNS:
+            continue
+        values = df[column]
+        if column in TIMESTAMP_COLUMNS:
+            values = pd.to_datetime(values, utc=True, format="ISO8601")
+        elif column in FLOAT_COLUMNS:
+            values = pd.to_numeric(values, errors="coerce")
+        else:
+            values = values.map(lambda value: None if value is None or value != value else str(value))
+        arrays.append(pa.array(values, type=_column_type(column), from_pandas=True))
+        fields.append(pa.field(column, _column_type(column)))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def _month(created_at: pd.Series) -> pd.Series:
+    return pd.to_datetime(created_at, utc=True, format="ISO8601").dt.strftime("%Y-%m")
+
+
+class ParquetExporter:
+    """
+    Export `trades` and `structures` to month-partitioned Parquet files.
+
+    Layout: <root>/<table>/month=YYYY-MM/data.parquet, one file per month
+    sorted by (created_at, id), plus <root>/<table>/_export_state.json.
+
+    A run exports the rows created before a cutoff (now minus a lag, so rows
+    of transactions still in flight are not skipped). The next run only
+    fetches rows created before its own cutoff and updated since the
+    previous one: new rows, and old rows edited since (AI feedback, notes,
+    screenshot). The months they fall in are rewritten, merged by id. The
+    state file is written last: a reader that trusts its cutoff finds every
+    row created before it in the files, in a version no older than the
+    cutoff, and gets later changes from Supabase (updated_at >= cutoff).
+    """
+
+    def __init__(self, supabase, root: Optional[str] = None, lag_minutes: Optional[float] = None, page_size: int = 1000):
+        """
+        Initialize the exporter.
+
+        Args:
+            supabase: SupabaseClient
+            root: Export directory (defaults to PARQUET_EXPORT_DIR)
+            lag_minutes: Age below which a row is left to the next run (defaults to PARQUET_EXPORT_LAG_MINUTES or 10)
+            page_size: Rows fetched per request
+        """
+        self.supabase = supabase
+        self.root = root or export_dir()
+        if lag_minutes is None:
+            lag_minutes = float(os.getenv("PARQUET_EXPORT_LAG_MINUTES", "10"))
+        self.lag = timedelta(minutes=lag_minutes)
+        self.page_size = page_size
+
+    def _fetch(self, table: str, cutoff: str, since: Optional[str]) -> List[Dict[str, Any]]:
+        """Rows created before the cutoff and, for an incremental run, updated since the previous cutoff."""
+        rows = []
+        after = None
+        while True:
+            query = self.supabase.client.table(table).select("*").lt("created_at", cutoff)
+            if since:
+                query = query.gte("updated_at", since)
+            if after:
+                query = query.gt("id", after)
+            page = query.order("id").limit(self.page_size).execute().data
+            rows.extend(page)
+            if len(page) < self.page_size:
+                return rows
+            after = page[-1]["id"]
+
+    def _write_month(self, path: str, changed: pa.Table, merge: bool = True) -> int:
+        """Merge changed rows into a month file (by id), atomically. Returns the rows in the file."""
+        if merge and os.path.exists(path):
+            existing = pq.read_table(path)
+            kept = existing.filter(pc.invert(pc.is_in(existing["id"], value_set=changed["id"])))
+            changed = pa.concat_tables([kept, changed], promote_options="default")
+        changed = changed.sort_by([("created_at", "ascending"), ("id", "ascending")])
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+        pq.write_table(changed, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+        return changed.num_rows
+
+    def export_table(self, table: str, full: bool = False) -> Dict[str, Any]:
+        """
+        Export one table.
+
+        Args:
+            table: Table name
+            full: Ignore the previous cutoff and rewrite every month
+
+        Returns:
+            Report with the cutoff, rows fetched and months rewritten
+        """
+        started = time.monotonic()
+        table_dir = os.path.join(self.root, table)
+        state = None if full else read_state(table, self.root)
+        since = state["cutoff"] if state else None
+        cutoff = _iso(datetime.now(timezone.utc) - self.lag)
+
+        rows = self._fetch(table, cutoff, since)
+        months = {}
+        if rows:
+            data = to_table(rows)
+            month_of_row = pa.array(_month(data["created_at"].to_pandas()))
+            for month in sorted(set(month_of_row.to_pylist())):
+                path = os.path.join(table_dir, f"month={month}", "data.parquet")
+                months[month] = self._write_month(path, data.filter(pc.equal(month_of_row, month)), merge=not full)
+        if full and os.path.isdir(table_dir):
+            # Months without any row left (deleted in Supabase)
+            for path in _month_files(table_dir):
+                if os.path.basename(os.path.dirname(path))[len("month="):] not in months:
+                    os.remove(path)
+
+        total = _count_rows(table_dir)
+        save_state(table, {"cutoff": cutoff, "exported_at": _iso(datetime.now(timezone.utc)), "rows": total}, self.root)
+
+        report = {
+            "table": table,
+            "cutoff": cutoff,
+            "incremental": since is not None,
+            "rows_fetched": len(rows),
+            "months_written": sorted(months),
+            "rows": total,
+            "elapsed_s": round(time.monotonic() - started, 2),
+        }
+        logger.info(f"Exported {len(rows)} {table} rows to {len(months)} month(s), cutoff {cutoff}")
+        return report
+
+    def run(self, tables: Sequence[str] = EXPORT_TABLES, full: bool = False) -> List[Dict[str, Any]]:
+        """Export every table, one report per table"""
+        return [self.export_table(table, full=full) for table in tables]
+
+
+def _count_rows(table_dir: str) -> int:
+    if not os.path.isdir(table_dir):
+        return 0
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in _month_files(table_dir))
+
+
+def _month_files(table_dir: str) -> List[str]:
+    return sorted(
+        os.path.join(table_dir, name, "data.parquet")
+        for name in os.listdir(table_dir)
+        if name.startswith("month=") and os.path.exists(os.path.join(table_dir, name, "data.parquet"))
+    )
+
+
+def read_state(table: str, root: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Cutoff, time and size of the last export of a table, or None if it was never exported"""
+    path = os.path.join(root or export_dir(), table, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(table: str, state: Dict[str, Any], root: Optional[str] = None) -> None:
+    """Atomically replace the export state of a table."""
+    path = os.path.join(root or export_dir(), table, STATE_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_history(
+    table: str = "trades",
+    columns: Optional[Sequence[str]] = None,
+    since: Optional[datetime] = None,
+    root: Optional[str] = None
+) -> Tuple[pd.DataFrame, Optional[str]]:
+    """
+    Read the exported history of a table.
+
+    Only the requested columns are decoded, and with `since` the months
+    before it are not opened at all (partition pruning) while row groups
+    before it are skipped from their statistics.
+
+    Args:
+        table: Table name
+        columns: Columns to read (all by default); missing ones come back as nulls
+        since: Only rows created at or after this time
+        root: Export directory (defaults to PARQUET_EXPORT_DIR)
+
+    Returns:
+        (rows as a DataFrame shaped like the API rows, with ISO timestamps;
+        cutoff of the export), or (empty DataFrame, None) if the table was never exported.
+        Rows changed since the cutoff must be fetched from Supabase (updated_at >= cutoff).
+    """
+    root = root or export_dir()
+    # State first: files written after it only hold newer versions of the rows
+    state = read_state(table, root)
+    table_dir = os.path.join(root, table)
+    if state is None or not os.path.isdir(table_dir):
+        return pd.DataFrame(), None
+
+    files = _month_files(table_dir)
+    if not files:
+        return pd.DataFrame(), state["cutoff"]
+    # Months written before a migration lack its columns: read them as nulls
+    schema = pa.unify_schemas([pq.read_schema(path) for path in files], promote_options="default")
+    schema = schema.append(pa.field("month", pa.string()))
+    dataset = ds.dataset(files, schema=schema, format="parquet", partitioning=PARTITIONING, partition_base_dir=table_dir)
+
+    filter_expression = None
+    if since is not None:
+        since = pd.Timestamp(since)
+        since = since.tz_convert("UTC") if since.tzinfo else since.tz_localize("UTC")
+        filter_expression = (ds.field("month") >= since.strftime("%Y-%m")) & (ds.field("created_at") >= since.to_pydatetime())
+    columns = [column for column in (columns or schema.names) if column in schema.names and column != "month"]
+
+    data = dataset.to_table(columns=columns, filter=filter_expression)
+    for column in TIMESTAMP_COLUMNS & set(data.column_names):
+        # Same text form as the API, so the dashboard handles both sources alike (%S has the microseconds)
+        position = data.schema.get_field_index(column)
+        data = data.set_column(position, column, pc.strftime(data[column], format="%Y-%m-%dT%H:%M:%S+00:00"))
+    return data.to_pandas(), state["cutoff"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: python parquet_export.py [--table trades] [--full]"""
+    from clients import get_supabase_client
+
+    parser = argparse.ArgumentParser(description="Export trades and structures to month-partitioned Parquet files.")
+    parser.add_argument("--table", action="append", choices=EXPORT_TABLES, help="Table to export (repeatable, default: all)")
+    parser.add_argument("--full", action="store_true", help="Ignore the previous export and rewrite every month")
+    parser.add_argument("--dir", default=None, help="Export directory (default: PARQUET_EXPORT_DIR)")
+    parser.add_argument("--lag-minutes", type=float, default=None, help="Leave rows younger than this to the next run")
+    parser.add_argument("--page-size", type=int, default=1000, help="Rows fetched per page")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    exporter = ParquetExporter(get_supabase_client(), root=args.dir, lag_minutes=args.lag_minutes, page_size=args.page_size)
+    report = exporter.run(args.table or EXPORT_TABLES, full=args.full)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
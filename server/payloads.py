@@ -0,0 +1,108 @@
+import logging
+from typing import Any, Dict, Optional
+
+from screenshot_handler import decode_base64_screenshot
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Webhook payload validation shared by the Flask app (app.py) and the async server (async_app.py)
+
+STRUCTURE_REQUIRED_FIELDS = ['instrument', 'structure_type', 'price_level', 'direction']
+TRADE_REQUIRED_FIELDS = ['instrument', 'direction', 'entry_price', 'stop_loss', 'take_profit']
+TRADE_DIRECTIONS = ['LONG', 'SHORT']
+
+
+class PayloadError(ValueError):
+    """Invalid webhook payload; the message is returned to the caller with a 400."""
+
+
+def parse_structure(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate a structure webhook payload and build the row to insert.
+
+    Args:
+        data: Decoded JSON body
+
+    Returns:
+        Structure row (screenshot_url left empty, set after upload)
+
+    Raises:
+        PayloadError: If a field is missing or invalid
+    """
+    # Validate required fields
+    for field in STRUCTURE_REQUIRED_FIELDS:
+        if field not in data:
+            raise PayloadError(f'Missing required field: {field}')
+
+    # Validate structure_type
+    if data['structure_type'] not in ['BOS', 'CHoCH']:
+        raise PayloadError('Invalid structure_type. Must be BOS or CHoCH')
+
+    # Validate direction
+    if data['direction'] not in ['BULLISH', 'BEARISH']:
+        raise PayloadError('Invalid direction. Must be BULLISH or BEARISH')
+
+    return {
+        "instrument": data['instrument'],
+        "structure_type": data['structure_type'],
+        "price_level": float(data['price_level']),
+        "direction": data['direction'],
+        "screenshot_url": None,
+        "notes": data.get('notes')
+    }
+
+
+def parse_trade(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate a trade webhook payload and build the row to insert.
+
+    Args:
+        data: Decoded JSON body
+
+    Returns:
+        Trade row (screenshot_url left empty, set after upload)
+
+    Raises:
+        PayloadError: If a field is missing or invalid
+    """
+    # Validate required fields
+    for field in TRADE_REQUIRED_FIELDS:
+        if field not in data:
+            raise PayloadError(f'Missing required field: {field}')
+
+    # Validate direction
+    if data['direction'] not in TRADE_DIRECTIONS:
+        raise PayloadError('Invalid direction. Must be LONG or SHORT')
+
+    # Calculate risk/reward if not provided
+    risk_reward = data.get('risk_reward')
+    if not risk_reward:
+        entry = float(data['entry_price'])
+        sl = float(data['stop_loss'])
+        tp = float(data['take_profit'])
+        risk = abs(entry - sl)
+        reward = abs(tp - entry)
+        risk_reward = round(reward / risk, 2) if risk != 0 else 0
+
+    return {
+        "instrument": data['instrument'],
+        "direction": data['direction'],
+        "entry_price": float(data['entry_price']),
+        "stop_loss": float(data['stop_loss']),
+        "take_profit": float(data['take_profit']),
+        "screenshot_url": None,
+        "notes": data.get('notes'),
+        "risk_reward": risk_reward
+    }
+
+
+def decode_screenshot(data: Dict[str, Any]) -> Optional[bytes]:
+    """Decode the optional base64 screenshot of a webhook payload (None if absent or invalid)"""
+    if not data.get('screenshot'):
+        return None
+    try:
+        return decode_base64_screenshot(data['screenshot'])
+    except Exception as e:
+        logger.error(f"Error decoding screenshot: {str(e)}")
+        return None
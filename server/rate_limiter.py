@@ -0,0 +1,279 @@
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "rate_limits.sqlite3")
+
+
+class Bucket(NamedTuple):
+    """A token bucket: `rate` tokens per second refilled up to `burst`."""
+    rate: float
+    burst: float
+
+
+class Decision(NamedTuple):
+    """Outcome of an admission check; `limit` names the bucket that refused."""
+    allowed: bool
+    limit: Optional[str] = None
+    retry_after: float = 0.0
+
+
+class TokenBuckets:
+    """
+    Token buckets stored in SQLite, shared by every process using the same file.
+
+    A bucket is one row (tokens, updated_at) refilled lazily when it is read,
+    so a check costs one primary-key lookup and one write per bucket. Several
+    buckets are checked in a single immediate transaction and are only
+    debited when all of them have a token, so a refusal by one bucket does
+    not consume the others.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Initialize the store and create the buckets table if needed.
+
+        Args:
+            db_path: Path of the SQLite database file
+        """
+        self.db_path = db_path or os.getenv("RATE_LIMIT_PATH", DEFAULT_DB_PATH)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return the SQLite connection owned by the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Losing the last refills on a crash only resets the buckets
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def take(self, checks: List[Tuple[str, str, Bucket]], cost: float = 1.0) -> Decision:
+        """
+        Take `cost` tokens from every bucket, or from none of them.
+
+        Args:
+            checks: (limit name, bucket key, bucket) triples, checked in order
+            cost: Tokens needed in each bucket
+
+        Returns:
+            Decision naming the first bucket without enough tokens and when it will have them
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for name, key, bucket in checks:
+                row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = bucket.burst if row is None else min(bucket.burst, row[0] + (now - row[1]) * bucket.rate)
+                if tokens < cost:
+                    conn.execute("COMMIT")
+                    return Decision(False, name, (cost - tokens) / bucket.rate)
+                levels.append((key, tokens - cost))
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                [(key, tokens, now) for key, tokens in levels]
+            )
+            conn.execute("COMMIT")
+            return Decision(True)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class WebhookLimiter:
+    """
+    Admission control in front of the webhook handlers, off unless
+    RATE_LIMIT_ENABLED is set (see get_rate_limiter).
+
+    - Per-source and per-instrument token buckets, shared across processes
+      through TokenBuckets, so an alert firing on every tick is refused
+      with a 429 before it reaches Supabase
+    - A cap on webhooks in progress in this process
+    - A separate, tighter bucket for the AI analysis step: an alert over
+      that budget is still stored, only its AI job is skipped
+
+    TradingView sends every alert from a handful of shared addresses, and
+    many alerts fire together at bar close: the default buckets are sized
+    for those bursts, tighten them only after watching /rate-limits/stats.
+    """
+
+    def __init__(
+        self,
+        buckets: Optional[TokenBuckets] = None,
+        source: Optional[Bucket] = None,
+        instrument: Optional[Bucket] = None,
+        ai: Optional[Bucket] = None,
+        max_concurrent: Optional[int] = None
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            buckets: Shared bucket store
+            source: Bucket applied to each alert source
+            instrument: Bucket applied to each instrument
+            ai: Bucket applied to all AI analysis jobs
+            max_concurrent: Webhooks processed at once by this process
+        """
+        self.buckets = buckets or TokenBuckets()
+        self.source = source or Bucket(
+            float(os.getenv("RATE_LIMIT_SOURCE_PER_SECOND", "20")),
+            float(os.getenv("RATE_LIMIT_SOURCE_BURST", "200"))
+        )
+        self.instrument = instrument or Bucket(
+            float(os.getenv("RATE_LIMIT_INSTRUMENT_PER_SECOND", "5")),
+            float(os.getenv("RATE_LIMIT_INSTRUMENT_BURST", "50"))
+        )
+        self.ai = ai or Bucket(
+            float(os.getenv("RATE_LIMIT_AI_PER_MINUTE", "20")) / 60,
+            float(os.getenv("RATE_LIMIT_AI_BURST", "5"))
+        )
+        self.max_concurrent = max_concurrent or int(os.getenv("RATE_LIMIT_MAX_CONCURRENT", "64"))
+        for name, bucket in (("source", self.source), ("instrument", self.instrument), ("ai", self.ai)):
+            # A zero rate never refills (and its Retry-After would divide by zero): disable the limiter instead
+            if not bucket.rate > 0 or not bucket.burst >= 1:
+                raise ValueError(
+                    f"Rate limit bucket '{name}' needs a positive rate and a burst of at least 1, got {tuple(bucket)}; "
+                    f"set RATE_LIMIT_ENABLED=false to turn limiting off"
+                )
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters: Dict[str, int] = {
+            "admitted": 0,
+            "rejected_source": 0,
+            "rejected_instrument": 0,
+            "rejected_concurrency": 0,
+            "ai_admitted": 0,
+            "ai_rejected": 0,
+            "errors": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _take(self, checks: List[Tuple[str, str, Bucket]]) -> Decision:
+        try:
+            return self.buckets.take(checks)
+        except Exception as e:
+            # Fail open: a locked or broken state file must not drop alerts
+            self._count("errors")
+            logger.error(f"Rate limiter error, admitting request: {str(e)}")
+            return Decision(True)
+
+    def admit(self, source: str, instrument: Optional[str]) -> Decision:
+        """
+        Check the source and instrument buckets and take a concurrency slot.
+
+        Call release() once the request is done if the decision allows it.
+
+        Args:
+            source: Alert source (e.g. the client address)
+            instrument: Instrument of the alert, if present
+
+        Returns:
+            Decision; when refused, `limit` is "concurrency", "source" or "instrument"
+        """
+        with self._lock:
+            if self._in_flight >= self.max_concurrent:
+                self._counters["rejected_concurrency"] += 1
+                return Decision(False, "concurrency", 1.0)
+            self._in_flight += 1
+
+        checks = [("source", f"source:{source}", self.source)]
+        if instrument:
+            checks.append(("instrument", f"instrument:{instrument}", self.instrument))
+        decision = self._take(checks)
+
+        with self._lock:
+            if decision.allowed:
+                self._counters["admitted"] += 1
+            else:
+                self._in_flight -= 1
+                self._counters[f"rejected_{decision.limit}"] += 1
+        return decision
+
+    def release(self) -> None:
+        """Give back the concurrency slot taken by an admitted request."""
+        with self._lock:
+            self._in_flight -= 1
+
+    def admit_ai(self) -> bool:
+        """Take a token from the AI analysis budget; False means the job should be skipped."""
+        decision = self._take([("ai", "ai", self.ai)])
+        self._count("ai_admitted" if decision.allowed else "ai_rejected")
+        return decision.allowed
+
+    def stats(self) -> Dict[str, object]:
+        """
+        Report admission counters of this process.
+
+        Returns:
+            Dict with admitted/rejected counts per limit, AI budget counts and requests in flight
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            in_flight = self._in_flight
+        rejected = counters["rejected_source"] + counters["rejected_instrument"] + counters["rejected_concurrency"]
+        return {
+            **counters,
+            "rejected": rejected,
+            "in_flight": in_flight,
+            "max_concurrent": self.max_concurrent,
+            "limits": {
+                "source": self.source._asdict(),
+                "instrument": self.instrument._asdict(),
+                "ai": self.ai._asdict(),
+            },
+        }
+
+
+def retry_after_header(decision: Decision) -> str:
+    """Retry-After value (whole seconds, at least 1) for a refused request."""
+    return str(max(1, math.ceil(decision.retry_after)))
+
+
+_limiter: Optional[WebhookLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[WebhookLimiter]:
+    """
+    Return the process-wide limiter, creating it on first use.
+
+    Returns:
+        The shared WebhookLimiter, or None unless RATE_LIMIT_ENABLED is true
+    """
+    global _limiter
+    if os.getenv("RATE_LIMIT_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = WebhookLimiter()
+    return _limiter
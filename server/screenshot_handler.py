@@ -1,47 +1,53 @@
-import os
 import base64
-from io import BytesIO
-from datetime import datetime
 import logging
 from supabase_client import SupabaseClient
+import tracing
 
 logger = logging.getLogger(__name__)
 
-def save_base64_screenshot(base64_string: str, trade_id: str = None) -> str:
+def decode_base64_screenshot(base64_string: str) -> bytes:
+    """
+    Decode a base64 encoded screenshot
+    
+    Args:
+        base64_string: Base64 encoded image string, with or without a data: URL prefix
+        
+    Returns:
+        Raw image bytes
+    """
+    with tracing.stage("decode_screenshot"):
+        # Remove data:image/png;base64, if present
+        if ',' in base64_string:
+            base64_string = base64_string.split(',')[1]
+        image_data = base64.b64decode(base64_string, validate=True)
+    tracing.observe_size("screenshot", len(image_data))
+    return image_data
+
+def save_base64_screenshot(base64_string: str, client: SupabaseClient, trade_id: str = None) -> str:
     """
     Save a base64 encoded screenshot to Supabase Storage
     
+    The image goes through the processing pipeline (WebP re-encode, thumbnail)
+    and is stored under its content hash, so a screenshot sent twice is stored once.
+    
     Args:
         base64_string: Base64 encoded image string
-        trade_id: Optional trade ID to include in filename
+        client: SupabaseClient used for the upload
+        trade_id: Optional trade ID, used for logging
         
     Returns:
         Public URL of the uploaded screenshot
     """
     try:
-        # Remove data:image/png;base64, if present
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-            
         # Decode base64 string
-        image_data = base64.b64decode(base64_string)
-        
-        # Create BytesIO object
-        image_buffer = BytesIO(image_data)
-        
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{trade_id}.png" if trade_id else f"{timestamp}.png"
+        image_data = decode_base64_screenshot(base64_string)
         
-        # Upload to Supabase Storage
-        public_url = SupabaseClient.upload_screenshot(
-            file=image_buffer,
-            filename=filename
-        )
+        # Process and upload to Supabase Storage
+        public_url = client.store_screenshot(image_data)
         
-        logger.info(f"Successfully uploaded screenshot: {filename}")
+        logger.info(f"Successfully saved screenshot{f' for {trade_id}' if trade_id else ''}: {public_url}")
         return public_url
         
     except Exception as e:
         logger.error(f"Error saving screenshot: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
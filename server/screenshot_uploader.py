@@ -0,0 +1,446 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+from latency_tracker import LatencyTracker
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "screenshot_spool")
+
+# Seconds between two scans of the spool's incoming/ directory for requeued uploads
+SPOOL_RESCAN_INTERVAL = 30.0
+
+
+class ScreenshotUploader:
+    """
+    Background uploader for webhook screenshots.
+
+    The webhook inserts the row without waiting for Storage, then hands the
+    decoded image to submit(). Every screenshot is spooled to disk first
+    (<id>.bin + <id>.json) and removed only once `screenshot_url` has been
+    patched on the row, so pending uploads survive a restart. Failed
+    attempts are retried with exponential backoff capped at max_retry_delay,
+    for as long as it takes Storage to come back. Only unreadable images
+    (ValueError), or uploads past an explicit max_attempts, are moved to the
+    spool's failed/ directory; `python screenshot_uploader.py requeue` moves
+    them to incoming/, which the running uploader scans periodically. Only
+    incoming/ is rescanned: entries in the spool itself may belong to another
+    process sharing the spool (e.g. the Flask reloader) and are loaded at
+    startup only.
+    """
+
+    def __init__(
+        self,
+        client,
+        spool_dir: Optional[str] = None,
+        num_workers: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        retry_delay: float = 2.0,
+        max_retry_delay: float = 300.0,
+        poll_interval: float = 1.0
+    ):
+        """
+        Initialize the uploader and load any screenshot left in the spool.
+
+        Args:
+            client: SupabaseClient used to store images and patch rows (AsyncSupabaseClient with run_async())
+            spool_dir: Directory holding pending uploads
+            num_workers: Number of upload threads started by start()
+            max_attempts: Attempts before an upload is moved to failed/ (0: retry until it succeeds)
+            retry_delay: Base delay in seconds before a retry (doubled on each attempt)
+            max_retry_delay: Upper bound of the retry delay
+            poll_interval: Seconds a worker sleeps when nothing is due
+        """
+        self.client = client
+        self.spool_dir = spool_dir or os.getenv("SCREENSHOT_SPOOL_DIR", DEFAULT_SPOOL_DIR)
+        self.failed_dir = os.path.join(self.spool_dir, "failed")
+        self.incoming_dir = os.path.join(self.spool_dir, "incoming")
+        self.num_workers = num_workers or int(os.getenv("SCREENSHOT_UPLOAD_WORKERS", "2"))
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv("SCREENSHOT_UPLOAD_MAX_ATTEMPTS", "0"))
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.poll_interval = poll_interval
+
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._in_flight: set = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._workers: List[threading.Thread] = []
+        self._async_workers = 0
+        self._notify_async: Optional[Callable[[], None]] = None
+        self._counters = {"uploaded": 0, "failed_attempts": 0, "failed": 0}
+        self._last_scan = 0.0
+        self.upload_latency = LatencyTracker()
+        self.end_to_end_latency = LatencyTracker()
+
+        os.makedirs(self.failed_dir, exist_ok=True)
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        self._load_spool()
+
+    def _paths(self, upload_id: str, directory: Optional[str] = None):
+        directory = directory or self.spool_dir
+        return os.path.join(directory, f"{upload_id}.bin"), os.path.join(directory, f"{upload_id}.json")
+
+    def _write_meta(self, entry: Dict[str, Any]) -> None:
+        """Atomically rewrite the metadata file of an entry."""
+        _, meta_path = self._paths(entry["id"])
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, meta_path)
+
+    def _load_spool(self) -> None:
+        """Pick up uploads left pending by a previous process, then those requeued from failed/."""
+        loaded = 0
+        for name in os.listdir(self.spool_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.spool_dir, name)) as f:
+                    entry = json.load(f)
+                if os.path.exists(self._paths(entry["id"])[0]):
+                    with self._lock:
+                        self._entries[entry["id"]] = entry
+                    loaded += 1
+            except Exception as e:
+                logger.error(f"Error loading spooled screenshot {name}: {str(e)}")
+        if loaded:
+            logger.info(f"Loaded {loaded} pending screenshot upload(s) from {self.spool_dir}")
+        self._scan_incoming()
+
+    def _scan_incoming(self) -> None:
+        """Move uploads requeued into incoming/ to the spool and schedule them."""
+        self._last_scan = time.monotonic()
+        loaded = 0
+        for name in os.listdir(self.incoming_dir):
+            if not name.endswith(".json"):
+                continue
+            upload_id = name[:-len(".json")]
+            incoming_data, incoming_meta = self._paths(upload_id, self.incoming_dir)
+            data_path, meta_path = self._paths(upload_id)
+            try:
+                # Renaming the metadata claims the entry: another process scanning the same
+                # spool gets FileNotFoundError and leaves it alone
+                os.replace(incoming_meta, meta_path)
+            except FileNotFoundError:
+                continue
+            try:
+                os.replace(incoming_data, data_path)
+                with open(meta_path) as f:
+                    entry = json.load(f)
+                with self._lock:
+                    self._entries[entry["id"]] = entry
+                loaded += 1
+            except Exception as e:
+                logger.error(f"Error loading requeued screenshot {name}: {str(e)}")
+        if loaded:
+            logger.info(f"Loaded {loaded} requeued screenshot upload(s) from {self.incoming_dir}")
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """Start the upload threads."""
+        if self._workers:
+            return
+        self._stopping.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"screenshot-uploader-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Started {self.num_workers} screenshot upload worker(s) on {self.spool_dir}")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Stop the upload threads after their current upload.
+
+        Args:
+            timeout: Seconds to wait for each worker to exit
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def submit(self, table: str, row_id: str, data: bytes) -> str:
+        """
+        Spool a screenshot and schedule its upload.
+
+        Args:
+            table: Table of the row to patch ("trades" or "structures")
+            row_id: Id of the row whose screenshot_url is set after upload
+            data: Decoded image bytes
+
+        Returns:
+            The upload id
+        """
+        upload_id = str(uuid.uuid4())
+        now = time.time()
+        entry = {
+            "id": upload_id,
+            "table": table,
+            "row_id": row_id,
+            "attempts": 0,
+            "submitted_at": now,
+            "next_attempt_at": now,
+            "last_error": None,
+        }
+        data_path, _ = self._paths(upload_id)
+        with open(data_path, "wb") as f:
+            f.write(data)
+        self._write_meta(entry)
+
+        with self._lock:
+            self._entries[upload_id] = entry
+        self._wakeup.set()
+        if self._notify_async is not None:
+            self._notify_async()
+        logger.info(f"Queued screenshot upload {upload_id} for {table} row {row_id}")
+        return upload_id
+
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        """Take the oldest due entry that no other worker is uploading."""
+        if time.monotonic() - self._last_scan >= SPOOL_RESCAN_INTERVAL:
+            self._scan_incoming()
+        now = time.time()
+        with self._lock:
+            due = [
+                entry for upload_id, entry in self._entries.items()
+                if upload_id not in self._in_flight and entry["next_attempt_at"] <= now
+            ]
+            if not due:
+                return None
+            entry = min(due, key=lambda e: e["next_attempt_at"])
+            self._in_flight.add(entry["id"])
+            return entry
+
+    def _read(self, entry: Dict[str, Any]) -> bytes:
+        """Read the spooled image of an entry."""
+        with open(self._paths(entry["id"])[0], "rb") as f:
+            return f.read()
+
+    def _succeeded(self, entry: Dict[str, Any], started: float) -> None:
+        """Record a finished upload and drop its spool files."""
+        finished = time.time()
+        self.upload_latency.record(finished - started)
+        self.end_to_end_latency.record(finished - entry["submitted_at"])
+        for path in self._paths(entry["id"]):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already removed by another process that uploaded the same entry
+                pass
+        with self._lock:
+            self._entries.pop(entry["id"], None)
+            self._in_flight.discard(entry["id"])
+            self._counters["uploaded"] += 1
+        logger.info(f"Screenshot upload {entry['id']} done in {finished - started:.2f}s")
+
+    def _failed(self, entry: Dict[str, Any], error: Exception) -> None:
+        """Schedule a retry, or move the entry to failed/ if it cannot succeed."""
+        data_path, meta_path = self._paths(entry["id"])
+        entry["attempts"] += 1
+        entry["last_error"] = str(error)
+        with self._lock:
+            self._counters["failed_attempts"] += 1
+
+        try:
+            # An unreadable image will not get better with retries; anything else (Storage or
+            # Supabase down, timeouts) is retried until it succeeds unless max_attempts is set
+            if isinstance(error, ValueError) or (self.max_attempts and entry["attempts"] >= self.max_attempts):
+                self._write_meta(entry)
+                failed_data, failed_meta = self._paths(entry["id"], self.failed_dir)
+                os.replace(data_path, failed_data)
+                os.replace(meta_path, failed_meta)
+                with self._lock:
+                    self._entries.pop(entry["id"], None)
+                    self._counters["failed"] += 1
+                logger.error(f"Screenshot upload {entry['id']} failed permanently: {str(error)}")
+                return
+
+            delay = min(self.retry_delay * (2 ** (entry["attempts"] - 1)), self.max_retry_delay)
+            entry["next_attempt_at"] = time.time() + delay
+            self._write_meta(entry)
+            limit = f"/{self.max_attempts}" if self.max_attempts else ""
+            logger.warning(
+                f"Screenshot upload {entry['id']} failed, attempt {entry['attempts']}{limit}, "
+                f"retrying in {delay:.0f}s: {str(error)}"
+            )
+
+        finally:
+            with self._lock:
+                self._in_flight.discard(entry["id"])
+
+    def _upload(self, entry: Dict[str, Any]) -> None:
+        """Upload one spooled screenshot and patch its row, or schedule a retry."""
+        started = time.time()
+        try:
+            url = self.client.store_screenshot(self._read(entry))
+            self.client.update_screenshot_url(entry["table"], entry["row_id"], url)
+        except Exception as e:
+            self._failed(entry, e)
+            return
+        self._succeeded(entry, started)
+
+    def _worker_loop(self) -> None:
+        """Upload due screenshots until stop() is called."""
+        while not self._stopping.is_set():
+            entry = self._claim_next()
+            if entry is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._upload(entry)
+
+    async def run_async(self, concurrency: Optional[int] = None) -> None:
+        """
+        Upload on the current event loop instead of threads (see async_app.py).
+
+        The client must then be an AsyncSupabaseClient, whose store_screenshot
+        and update_screenshot_url are coroutines. Runs until cancelled.
+
+        Args:
+            concurrency: Number of uploads in flight at once (defaults to num_workers)
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        self._notify_async = lambda: loop.call_soon_threadsafe(wakeup.set)
+
+        async def worker() -> None:
+            while True:
+                entry = self._claim_next()
+                if entry is None:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    wakeup.clear()
+                    continue
+
+                started = time.time()
+                try:
+                    data = await asyncio.to_thread(self._read, entry)
+                    url = await self.client.store_screenshot(data)
+                    await self.client.update_screenshot_url(entry["table"], entry["row_id"], url)
+                except Exception as e:
+                    await asyncio.to_thread(self._failed, entry, e)
+                    continue
+                await asyncio.to_thread(self._succeeded, entry, started)
+
+        concurrency = concurrency or self.num_workers
+        self._async_workers += concurrency
+        logger.info(f"Running {concurrency} async screenshot upload worker(s) on {self.spool_dir}")
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            self._async_workers -= concurrency
+            self._notify_async = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report pending uploads and upload latencies.
+
+        Returns:
+            Dict with pending/in-flight/retrying counts, totals, the age of the
+            oldest pending upload and latency summaries
+        """
+        now = time.time()
+        with self._lock:
+            entries = list(self._entries.values())
+            in_flight = len(self._in_flight)
+            counters = dict(self._counters)
+        oldest = min((e["submitted_at"] for e in entries), default=None)
+
+        return {
+            "pending": len(entries),
+            "in_flight": in_flight,
+            "retrying": sum(1 for e in entries if e["attempts"] > 0),
+            **counters,
+            "oldest_pending_age_s": round(now - oldest, 2) if oldest else 0.0,
+            "workers": len(self._workers) + self._async_workers,
+            "upload_latency": self.upload_latency.snapshot(),
+            "end_to_end_latency": self.end_to_end_latency.snapshot(),
+        }
+
+
+def requeue_failed(spool_dir: Optional[str] = None, upload_ids: Optional[List[str]] = None) -> int:
+    """
+    Move uploads from failed/ to the spool's incoming/ directory with their attempts reset.
+
+    A running uploader claims them on its next scan of incoming/ (every
+    SPOOL_RESCAN_INTERVAL seconds), otherwise the next one to start.
+
+    Args:
+        spool_dir: Spool directory (defaults to SCREENSHOT_SPOOL_DIR)
+        upload_ids: Only these uploads (all failed uploads by default)
+
+    Returns:
+        Number of uploads requeued
+    """
+    spool_dir = spool_dir or os.getenv("SCREENSHOT_SPOOL_DIR", DEFAULT_SPOOL_DIR)
+    failed_dir = os.path.join(spool_dir, "failed")
+    incoming_dir = os.path.join(spool_dir, "incoming")
+    if not os.path.isdir(failed_dir):
+        return 0
+    os.makedirs(incoming_dir, exist_ok=True)
+    requeued = 0
+    for name in sorted(os.listdir(failed_dir)):
+        upload_id = name[:-len(".json")]
+        if not name.endswith(".json") or (upload_ids and upload_id not in upload_ids):
+            continue
+        data_path = os.path.join(failed_dir, f"{upload_id}.bin")
+        if not os.path.exists(data_path):
+            continue
+        with open(os.path.join(failed_dir, name)) as f:
+            entry = json.load(f)
+        entry.update(attempts=0, next_attempt_at=time.time())
+        # Image first: the uploader claims an entry through its metadata file
+        os.replace(data_path, os.path.join(incoming_dir, f"{upload_id}.bin"))
+        tmp_path = os.path.join(incoming_dir, f"{upload_id}.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, os.path.join(incoming_dir, name))
+        os.remove(os.path.join(failed_dir, name))
+        requeued += 1
+    return requeued
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """List or requeue failed screenshot uploads from the command line."""
+    parser = argparse.ArgumentParser(description="Inspect or requeue failed screenshot uploads")
+    parser.add_argument("--spool-dir", help="Spool directory (defaults to SCREENSHOT_SPOOL_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Failed uploads and their last error")
+    requeue = commands.add_parser("requeue", help="Move failed uploads back to the spool (incoming/)")
+    requeue.add_argument("--id", action="append", help="Requeue only this upload (repeatable)")
+    args = parser.parse_args(argv)
+
+    spool_dir = args.spool_dir or os.getenv("SCREENSHOT_SPOOL_DIR", DEFAULT_SPOOL_DIR)
+    if args.command == "list":
+        failed_dir = os.path.join(spool_dir, "failed")
+        for name in sorted(os.listdir(failed_dir)) if os.path.isdir(failed_dir) else []:
+            if name.endswith(".json"):
+                with open(os.path.join(failed_dir, name)) as f:
+                    print(f.read().strip())
+        return 0
+
+    print(f"Requeued {requeue_failed(spool_dir, args.id)} failed upload(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import json
+from typing import Any, Dict
+
+# Headers of a server-sent events response; X-Accel-Buffering stops nginx from
+# holding the tokens back until the response completes
+SSE_HEADERS = {
+    "Content-Type": "text/event-stream; charset=utf-8",
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+# Tables whose rows can be analyzed, with the kind of analysis
+STREAMABLE_TABLES = ("trades", "structures")
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """
+    Format one server-sent event.
+
+    Args:
+        event: Event name ("token", "done" or "error")
+        data: JSON-serializable payload
+
+    Returns:
+        The event, terminated by a blank line
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,222 @@
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from supabase_client import SupabaseClient
+from clients import get_supabase_client
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# (day, instrument, direction)
+GroupKey = Tuple[str, str, str]
+
+STAT_COLUMNS = ("trade_count", "rr_sum", "rr_count", "win_count")
+
+# rr_sum is NUMERIC in the database and a float sum here
+RR_SUM_TOLERANCE = 1e-6
+
+
+def _day(created_at: str) -> str:
+    """UTC day of an ISO timestamp, as the triggers compute it"""
+    moment = datetime.fromisoformat(created_at)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.date().isoformat()
+
+
+def aggregate_trades(trades: Iterable[Dict[str, Any]]) -> Dict[GroupKey, Dict[str, float]]:
+    """
+    Aggregate raw trades per (day, instrument, direction), with the rules of the triggers.
+
+    Args:
+        trades: Rows with created_at, instrument, direction and computed_rr
+
+    Returns:
+        Dict of group key -> {"trade_count", "rr_sum", "rr_count", "win_count"}
+    """
+    groups: Dict[GroupKey, Dict[str, float]] = {}
+    for trade in trades:
+        if not trade.get("created_at") or trade.get("instrument") is None or trade.get("direction") is None:
+            continue
+        key = (_day(trade["created_at"]), trade["instrument"], trade["direction"])
+        stats = groups.get(key)
+        if stats is None:
+            stats = groups[key] = {"trade_count": 0, "rr_sum": 0.0, "rr_count": 0, "win_count": 0}
+        stats["trade_count"] += 1
+        rr = trade.get("computed_rr")
+        if rr is not None:
+            rr = float(rr)
+            stats["rr_sum"] += rr
+            stats["rr_count"] += 1
+            if rr >= 1:
+                stats["win_count"] += 1
+    return groups
+
+
+def _same(expected: Optional[Dict[str, float]], stored: Optional[Dict[str, float]]) -> bool:
+    if expected is None or stored is None:
+        return expected is None and stored is None
+    for column in STAT_COLUMNS:
+        tolerance = RR_SUM_TOLERANCE * max(1.0, abs(expected[column])) if column == "rr_sum" else 0
+        if abs(float(expected[column]) - float(stored[column])) > tolerance:
+            return False
+    return True
+
+
+class StatsReconciler:
+    """
+    Check `trade_daily_stats` against the trades table, and rebuild it.
+
+    The check aggregates every trade in Python (keyset pagination on id)
+    and compares the result with the stored aggregates group by group.
+    Groups that differ are read again once before being reported, so a
+    trade written during the scan is not mistaken for a drift of the
+    triggers. The rebuild recomputes the whole table in the database
+    (`rebuild_trade_daily_stats` RPC).
+    """
+
+    def __init__(self, supabase: SupabaseClient, page_size: int = 1000):
+        """
+        Initialize the reconciler.
+
+        Args:
+            supabase: Supabase client
+            page_size: Trades fetched per page during the check
+        """
+        self.supabase = supabase
+        self.page_size = page_size
+
+    def _scan_trades(self) -> Tuple[Dict[GroupKey, Dict[str, float]], int]:
+        """Aggregate the whole trades table, page by page."""
+        groups: Dict[GroupKey, Dict[str, float]] = {}
+        count = 0
+        after = None
+        while True:
+            query = self.supabase.client.table("trades").select("id, created_at, instrument, direction, computed_rr")
+            if after:
+                query = query.gt("id", after)
+            page = query.order("id").limit(self.page_size).execute().data
+            for key, stats in aggregate_trades(page).items():
+                total = groups.setdefault(key, {column: 0 for column in STAT_COLUMNS})
+                for column in STAT_COLUMNS:
+                    total[column] += stats[column]
+            count += len(page)
+            if len(page) < self.page_size:
+                return groups, count
+            after = page[-1]["id"]
+
+    def _stored(self) -> Dict[GroupKey, Dict[str, float]]:
+        return {
+            (str(row["day"]), row["instrument"], row["direction"]): {column: row[column] for column in STAT_COLUMNS}
+            for row in self.supabase.fetch_daily_stats()
+        }
+
+    def _recheck(self, key: GroupKey) -> Tuple[Optional[Dict[str, float]], Optional[Dict[str, float]]]:
+        """Read one group again: its trades and its stored aggregate."""
+        day, instrument, direction = key
+        start = datetime.fromisoformat(day).replace(tzinfo=timezone.utc)
+        trades = (
+            self.supabase.client.table("trades")
+            .select("id, created_at, instrument, direction, computed_rr")
+            .gte("created_at", start.isoformat())
+            .lt("created_at", (start + timedelta(days=1)).isoformat())
+            .eq("instrument", instrument)
+            .eq("direction", direction)
+            .execute().data
+        )
+        rows = (
+            self.supabase.client.table("trade_daily_stats")
+            .select(", ".join(STAT_COLUMNS))
+            .eq("day", day).eq("instrument", instrument).eq("direction", direction)
+            .execute().data
+        )
+        return aggregate_trades(trades).get(key), rows[0] if rows else None
+
+    def check(self) -> Dict[str, Any]:
+        """
+        Compare the stored aggregates with the raw trades.
+
+        Returns:
+            Report with the number of trades and groups scanned and the list
+            of groups that still differ after a second read
+        """
+        started = time.monotonic()
+        expected, trade_count = self._scan_trades()
+        stored = self._stored()
+
+        mismatches = []
+        for key in sorted(set(expected) | set(stored)):
+            if _same(expected.get(key), stored.get(key)):
+                continue
+            fresh_expected, fresh_stored = self._recheck(key)
+            if _same(fresh_expected, fresh_stored):
+                continue
+            day, instrument, direction = key
+            mismatches.append({
+                "day": day, "instrument": instrument, "direction": direction,
+                "expected": fresh_expected, "stored": fresh_stored,
+            })
+            logger.warning(f"Daily stats mismatch for {day} {instrument} {direction}: expected {fresh_expected}, stored {fresh_stored}")
+
+        return {
+            "trades": trade_count,
+            "groups_expected": len(expected),
+            "groups_stored": len(stored),
+            "mismatches": mismatches,
+            "elapsed_s": round(time.monotonic() - started, 2),
+        }
+
+    def run(self, rebuild: bool = False, repair: bool = False) -> Dict[str, Any]:
+        """
+        Reconcile the aggregates.
+
+        Args:
+            rebuild: Rebuild the table before checking it
+            repair: Rebuild the table if the check finds mismatches, then check again
+
+        Returns:
+            The check report, with "rebuilt" (groups written) when the table was rebuilt
+        """
+        rebuilt = None
+        if rebuild:
+            rebuilt = self.supabase.rebuild_daily_stats()
+        report = self.check()
+        if repair and report["mismatches"] and rebuilt is None:
+            logger.info(f"Rebuilding daily stats after {len(report['mismatches'])} mismatches")
+            rebuilt = self.supabase.rebuild_daily_stats()
+            report = {**self.check(), "repaired": len(report["mismatches"])}
+        if rebuilt is not None:
+            report["rebuilt"] = rebuilt
+        return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: python stats_reconciler.py [--rebuild | --repair]"""
+    parser = argparse.ArgumentParser(description="Check the trade_daily_stats aggregates against the trades table.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--rebuild", action="store_true", help="Rebuild the aggregates from scratch, then check them")
+    group.add_argument("--repair", action="store_true", help="Rebuild the aggregates only if the check finds mismatches")
+    parser.add_argument("--page-size", type=int, default=1000, help="Trades fetched per page")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    report = StatsReconciler(get_supabase_client(), page_size=args.page_size).run(
+        rebuild=args.rebuild, repair=args.repair
+    )
+    print(json.dumps(report, indent=2, default=str))
+    # Non-zero exit status for a scheduled run: the aggregates have drifted
+    return 1 if report["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,400 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from bisect import bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from dotenv import load_dotenv
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Columns of the trades table holding the label (see supabase/migrations)
+LABEL_COLUMNS = ("structure_id", "structure_type", "structure_direction", "structure_price", "structure_at")
+
+STRUCTURE_COLUMNS = "id, created_at, instrument, structure_type, direction, price_level"
+
+EMPTY_LABEL = {column: None for column in LABEL_COLUMNS}
+
+
+def _epoch(value: Union[str, float, int, datetime]) -> float:
+    """Seconds since the epoch of an ISO timestamp (naive timestamps are UTC)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _iso(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+def _entry(structure: Dict[str, Any], created_at: str) -> Dict[str, Any]:
+    """The fields of a structure the index keeps"""
+    return {
+        "id": structure["id"],
+        "structure_type": structure["structure_type"],
+        "direction": structure["direction"],
+        "price_level": structure["price_level"],
+        "created_at": created_at,
+    }
+
+
+def label_columns(structure: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Trade columns labeling a trade with its preceding structure.
+
+    Args:
+        structure: Structure found by StructureIndex.lookup / join, or None
+
+    Returns:
+        Dict of the LABEL_COLUMNS (all None without a structure)
+    """
+    if structure is None:
+        return dict(EMPTY_LABEL)
+    return {
+        "structure_id": structure["id"],
+        "structure_type": structure["structure_type"],
+        "structure_direction": structure["direction"],
+        "structure_price": structure["price_level"],
+        "structure_at": structure["created_at"],
+    }
+
+
+class StructureIndex:
+    """
+    As-of join of trades to the most recent BOS/CHoCH on their instrument.
+
+    Structures are kept per instrument in a list sorted by time: a single
+    trade is labeled with one binary search (bisect), a batch of trades with
+    one np.searchsorted per instrument, so years of structures and trades
+    are joined in milliseconds instead of a trades x structures scan. A
+    structure only labels trades less than `lookback` seconds after it.
+
+    Structures received by the webhook server are added one at a time
+    (a bisect insertion, an append in practice); bulk loads are appended then sorted once.
+    """
+
+    def __init__(self, lookback_minutes: Optional[float] = None):
+        """
+        Initialize the index.
+
+        Args:
+            lookback_minutes: Maximum age of the structure at the time of the trade
+                (defaults to STRUCTURE_LOOKBACK_MINUTES or 120; 0 disables labeling)
+        """
+        if lookback_minutes is None:
+            lookback_minutes = float(os.getenv("STRUCTURE_LOOKBACK_MINUTES", "120"))
+        self.lookback = lookback_minutes * 60
+        self.enabled = self.lookback > 0
+
+        self._times: Dict[str, List[float]] = {}
+        self._rows: Dict[str, List[Dict[str, Any]]] = {}
+        # numpy copy of each instrument's times, rebuilt after a change, for batch joins
+        self._arrays: Dict[str, Any] = {}
+        self._ids = set()
+        self._lock = threading.Lock()
+        self._counters = {"structures": 0, "lookups": 0, "labeled": 0}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, structure: Dict[str, Any], at: Optional[float] = None) -> bool:
+        """
+        Add one structure.
+
+        Args:
+            structure: Structure row (id, instrument, structure_type, direction, price_level, created_at)
+            at: Time of the structure in epoch seconds (defaults to its created_at, else now)
+
+        Returns:
+            False if the structure was already indexed
+        """
+        if at is None:
+            at = _epoch(structure["created_at"]) if structure.get("created_at") else time.time()
+        entry = _entry(structure, structure.get("created_at") or _iso(at))
+        instrument = structure["instrument"]
+        with self._lock:
+            if entry["id"] in self._ids:
+                return False
+            self._ids.add(entry["id"])
+            times = self._times.setdefault(instrument, [])
+            rows = self._rows.setdefault(instrument, [])
+            position = bisect_right(times, at)
+            times.insert(position, at)
+            rows.insert(position, entry)
+            self._arrays.pop(instrument, None)
+            self._counters["structures"] += 1
+        return True
+
+    def add_many(self, structures: Sequence[Dict[str, Any]]) -> int:
+        """
+        Add structures loaded in bulk, sorting each instrument once.
+
+        Returns:
+            Number of structures that were not indexed yet
+        """
+        added = 0
+        with self._lock:
+            touched = set()
+            for structure in structures:
+                if structure["id"] in self._ids:
+                    continue
+                self._ids.add(structure["id"])
+                instrument = structure["instrument"]
+                self._times.setdefault(instrument, []).append(_epoch(structure["created_at"]))
+                self._rows.setdefault(instrument, []).append(_entry(structure, structure["created_at"]))
+                touched.add(instrument)
+                added += 1
+            for instrument in touched:
+                # Timsort: nearly linear on rows that mostly arrive in time order
+                order = sorted(range(len(self._times[instrument])), key=self._times[instrument].__getitem__)
+                self._times[instrument] = [self._times[instrument][i] for i in order]
+                self._rows[instrument] = [self._rows[instrument][i] for i in order]
+                self._arrays.pop(instrument, None)
+            self._counters["structures"] += added
+        return added
+
+    def lookup(self, instrument: str, at: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Most recent structure on an instrument at a given time, within the lookback.
+
+        Args:
+            instrument: Instrument of the trade
+            at: Time of the trade in epoch seconds (defaults to now)
+
+        Returns:
+            The structure, or None
+        """
+        if not self.enabled:
+            return None
+        at = time.time() if at is None else at
+        with self._lock:
+            self._counters["lookups"] += 1
+            times = self._times.get(instrument)
+            if not times:
+                return None
+            position = bisect_right(times, at) - 1
+            if position < 0 or at - times[position] > self.lookback:
+                return None
+            self._counters["labeled"] += 1
+            return self._rows[instrument][position]
+
+    def join(self, instruments: Sequence[str], times: Sequence[float]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Label a batch of trades (as-of join).
+
+        Args:
+            instruments: Instrument of each trade
+            times: Time of each trade in epoch seconds
+
+        Returns:
+            The preceding structure of each trade (or None), in the order of the trades
+        """
+        result: List[Optional[Dict[str, Any]]] = [None] * len(times)
+        if not self.enabled or not len(times):
+            return result
+        # Imported here: the webhook servers only use lookup() and start faster without numpy
+        import numpy as np
+
+        instruments = np.asarray(instruments, dtype=object)
+        trade_times = np.asarray(times, dtype=np.float64)
+        with self._lock:
+            for instrument in set(instruments.tolist()) & set(self._times):
+                structure_times = self._arrays.get(instrument)
+                if structure_times is None:
+                    structure_times = self._arrays[instrument] = np.asarray(self._times[instrument], dtype=np.float64)
+                rows = self._rows[instrument]
+                selected = np.flatnonzero(instruments == instrument)
+                at = trade_times[selected]
+                positions = np.searchsorted(structure_times, at, side="right") - 1
+                valid = positions >= 0
+                valid[valid] = at[valid] - structure_times[positions[valid]] <= self.lookback
+                for trade_index, position in zip(selected[valid].tolist(), positions[valid].tolist()):
+                    result[trade_index] = rows[position]
+        return result
+
+    def label(self, trade: Dict[str, Any], at: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Label columns of a trade about to be stored.
+
+        Args:
+            trade: Trade row (payloads.parse_trade)
+            at: Time of the trade in epoch seconds (defaults to now)
+
+        Returns:
+            Dict of the LABEL_COLUMNS (None without a preceding structure), empty
+            when labeling is disabled: every row of a bulk insert or ingest log
+            replay then has the same keys
+        """
+        if not self.enabled:
+            return {}
+        return label_columns(self.lookup(trade["instrument"], at))
+
+    def load(self, supabase, since: Optional[float] = None, page_size: int = 1000) -> int:
+        """
+        Load the structures stored in Supabase.
+
+        Args:
+            supabase: SupabaseClient
+            since: Only load structures created after this time (epoch seconds)
+            page_size: Rows per request
+
+        Returns:
+            Number of structures added
+        """
+        rows = []
+        after = None
+        while True:
+            query = supabase.client.table("structures").select(STRUCTURE_COLUMNS)
+            if since is not None:
+                query = query.gte("created_at", _iso(since))
+            if after:
+                query = query.gt("id", after)
+            page = query.order("id").limit(page_size).execute().data
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+            after = page[-1]["id"]
+        added = self.add_many(rows)
+        logger.info(f"Indexed {added} structures")
+        return added
+
+    def load_recent(self, supabase) -> int:
+        """Load the structures that can still label a new trade (those inside the lookback)."""
+        if not self.enabled:
+            return 0
+        try:
+            return self.load(supabase, since=time.time() - self.lookback)
+        except Exception as e:
+            logger.error(f"Error loading recent structures: {str(e)}")
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Indexed structures per instrument, lookups and labeled trades"""
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            return {
+                "lookback_minutes": self.lookback / 60,
+                "instruments": {instrument: len(times) for instrument, times in self._times.items()},
+                **self._counters,
+            }
+
+
+def describe(trade: Dict[str, Any]) -> Optional[str]:
+    """
+    One-line description of the preceding structure of a labeled trade, for the AI prompt.
+
+    Returns:
+        e.g. "BOS BULLISH at 4500.25 (2026-10-18 14:32 UTC)", or None if the trade has no label
+    """
+    if not trade.get("structure_type"):
+        return None
+    formed = datetime.fromtimestamp(_epoch(trade["structure_at"]), timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    return f"{trade['structure_type']} {trade['structure_direction']} at {trade['structure_price']} ({formed})"
+
+
+_index: Optional[StructureIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_structure_index() -> StructureIndex:
+    """
+    Return the process-wide index of the webhook servers, creating it on first use.
+
+    Returns:
+        The shared StructureIndex
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = StructureIndex()
+    return _index
+
+
+def label_history(supabase, index: StructureIndex, relabel: bool = False, page_size: int = 1000, batch_size: int = 500) -> Dict[str, Any]:
+    """
+    Label the stored trades with the batch join.
+
+    Args:
+        supabase: SupabaseClient
+        index: Index holding every structure
+        relabel: Recompute every trade, not only those without a label
+        page_size: Trades fetched per page
+        batch_size: Labels written per bulk update
+
+    Returns:
+        Report with trades scanned, trades labeled, join and total time
+    """
+    started = time.monotonic()
+    report = {"trades": 0, "labeled": 0, "written": 0, "join_s": 0.0}
+    after = None
+    while True:
+        query = supabase.client.table("trades").select("id, created_at, instrument, structure_id")
+        if not relabel:
+            query = query.is_("structure_id", "null")
+        if after:
+            query = query.gt("id", after)
+        trades = query.order("id").limit(page_size).execute().data
+        if not trades:
+            break
+
+        join_started = time.perf_counter()
+        structures = index.join([t["instrument"] for t in trades], [_epoch(t["created_at"]) for t in trades])
+        report["join_s"] += time.perf_counter() - join_started
+
+        updates = [
+            {"id": trade["id"], **label_columns(structure)}
+            for trade, structure in zip(trades, structures)
+            if structure is not None or trade.get("structure_id") is not None
+        ]
+        for start in range(0, len(updates), batch_size):
+            report["written"] += supabase.bulk_update_trade_structures(updates[start:start + batch_size])
+        report["trades"] += len(trades)
+        report["labeled"] += sum(structure is not None for structure in structures)
+        if len(trades) < page_size:
+            break
+        after = trades[-1]["id"]
+
+    report["join_s"] = round(report["join_s"], 4)
+    report["elapsed_s"] = round(time.monotonic() - started, 2)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: python structure_context.py [--relabel] [--lookback-minutes N]"""
+    from clients import get_supabase_client
+
+    parser = argparse.ArgumentParser(description="Label stored trades with their preceding BOS/CHoCH structure.")
+    parser.add_argument("--relabel", action="store_true", help="Recompute the label of every trade, not only unlabeled ones")
+    parser.add_argument("--lookback-minutes", type=float, default=None, help="Maximum structure age (default: STRUCTURE_LOOKBACK_MINUTES)")
+    parser.add_argument("--page-size", type=int, default=1000, help="Trades fetched per page")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    supabase = get_supabase_client()
+    index = StructureIndex(args.lookback_minutes)
+    if not index.enabled:
+        parser.error("the lookback is 0: labeling is disabled")
+    index.load(supabase)
+    report = label_history(supabase, index, relabel=args.relabel, page_size=args.page_size)
+    report["structures"] = len(index)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
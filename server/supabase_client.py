@@ -1,10 +1,23 @@
 import os
+import time
+import uuid
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
-from typing import Optional, Dict, Any, BinaryIO
+from typing import TYPE_CHECKING, Optional, Dict, Any, BinaryIO, List, Tuple
 from dotenv import load_dotenv
-from supabase import create_client, Client
 import logging
 
+from latency_tracker import LatencyTracker
+from text_search import FIELD_WEIGHTS, InvertedIndex
+from image_pipeline import get_pipeline
+from clients import get_supabase
+from idempotency import DuplicateRowError
+import tracing
+
+if TYPE_CHECKING:
+    from supabase import Client
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -12,13 +25,367 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+def or_filter(query, filters: str):
+    """
+    Add a PostgREST `or=(...)` filter to a query (postgrest-py 0.11 has no or_()).
+
+    Args:
+        query: postgrest request builder
+        filters: Comma-separated PostgREST conditions
+
+    Returns:
+        The same query builder
+    """
+    query.params = query.params.add("or", f"({filters})")
+    return query
+
+def or_groups_filter(query, groups: List[str]):
+    """
+    Require every group of OR conditions to match (AND of ORs).
+
+    PostgREST does not combine two `or` parameters, so several groups are
+    sent as a single `and=(or(...),or(...))` filter.
+
+    Args:
+        query: postgrest request builder
+        groups: Comma-separated PostgREST conditions, one string per group
+
+    Returns:
+        The same query builder
+    """
+    if len(groups) == 1:
+        return or_filter(query, groups[0])
+    if groups:
+        query.params = query.params.add("and", "(" + ",".join(f"or({group})" for group in groups) + ")")
+    return query
+
+def order_by(query, *columns: str, desc: bool = False):
+    """
+    Order a query by several columns with a single `order` parameter.
+
+    Calling .order() repeatedly would send one parameter per column, which
+    PostgREST does not combine.
+
+    Args:
+        query: postgrest request builder
+        columns: Column names, most significant first
+        desc: Sort every column in descending order
+
+    Returns:
+        The same query builder
+    """
+    query.params = query.params.add("order", ",".join(f"{column}.desc" if desc else column for column in columns))
+    return query
+
+class BatchWriter:
+    """
+    Buffer inserted rows and flush them as multi-row inserts.
+
+    Rows are grouped per table (and per column set, since PostgREST requires
+    every object of a bulk insert to have the same keys). A group is flushed
+    by a background thread as soon as it reaches `max_batch_size` rows or its
+    oldest row has waited `max_wait_ms`. Each caller gets a Future resolved
+    with its own inserted row.
+
+    Every row gets its id before it is sent, and is written with an upsert
+    that skips ids already stored: when a request fails after the server
+    committed it (read timeout), the row-by-row retry finds the rows in place
+    instead of inserting them a second time.
+    """
+
+    def __init__(self, client: "Client", max_batch_size: int = 50, max_wait_ms: float = 20):
+        """
+        Initialize the writer and start its flush thread.
+
+        Args:
+            client: Supabase client used for the inserts
+            max_batch_size: Flush a group once it holds this many rows
+            max_wait_ms: Flush a group once its oldest row has waited this long
+        """
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.flush_latency = LatencyTracker()
+
+        self._groups: Dict[Tuple[str, Tuple[str, ...]], List[Tuple[Dict[str, Any], Future, float]]] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._batches = 0
+        self._rows = 0
+        self._max_batch = 0
+        self._fallbacks = 0
+
+        self._thread = threading.Thread(target=self._run, name="supabase-batch-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, table: str, row: Dict[str, Any]) -> Future:
+        """
+        Queue a row for insertion.
+
+        Args:
+            table: Target table
+            row: Row to insert
+
+        Returns:
+            Future resolved with the inserted row (or the insert error); cancelling
+            it before its batch is sent withdraws the row
+        """
+        future: Future = Future()
+        row = {**row, "id": row.get("id") or str(uuid.uuid4())}
+        key = (table, tuple(sorted(row)))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BatchWriter is closed")
+            group = self._groups.setdefault(key, [])
+            group.append((row, future, time.monotonic()))
+            if len(group) >= self.max_batch_size or len(group) == 1:
+                self._condition.notify()
+        return future
+
+    def flush(self) -> None:
+        """Insert every buffered row now, from the calling thread."""
+        with self._condition:
+            groups, self._groups = self._groups, {}
+        for (table, _), entries in groups.items():
+            for start in range(0, len(entries), self.max_batch_size):
+                self._insert_batch(table, entries[start:start + self.max_batch_size])
+
+    def close(self) -> None:
+        """Flush remaining rows and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report batch sizes and flush latency.
+
+        Returns:
+            Dict with batch/row counts, average and max batch size, buffered rows and flush latency
+        """
+        with self._condition:
+            buffered = sum(len(entries) for entries in self._groups.values())
+            batches, rows = self._batches, self._rows
+            stats = {
+                "batches": batches,
+                "rows": rows,
+                "avg_batch_size": round(rows / batches, 2) if batches else 0.0,
+                "max_batch_size": self._max_batch,
+                "fallbacks": self._fallbacks,
+                "buffered_rows": buffered,
+            }
+        stats["flush_latency"] = self.flush_latency.snapshot()
+        return stats
+
+    def _due_groups(self, now: float) -> List[Tuple[str, List[Tuple[Dict[str, Any], Future, float]]]]:
+        """Pop the groups that are full or old enough. Caller holds the lock."""
+        due = []
+        for key in list(self._groups):
+            entries = self._groups[key]
+            if self._closed or len(entries) >= self.max_batch_size or now - entries[0][2] >= self.max_wait:
+                del self._groups[key]
+                due.append((key[0], entries))
+        return due
+
+    def _next_deadline(self, now: float) -> Optional[float]:
+        """Seconds until the oldest buffered row is due. Caller holds the lock."""
+        if not self._groups:
+            return None
+        oldest = min(entries[0][2] for entries in self._groups.values())
+        return max(0.0, oldest + self.max_wait - now)
+
+    def _run(self) -> None:
+        """Background loop flushing groups as they become due."""
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                due = self._due_groups(now)
+                while not due and not self._closed:
+                    self._condition.wait(self._next_deadline(now))
+                    now = time.monotonic()
+                    due = self._due_groups(now)
+                closed = self._closed
+
+            for table, entries in due:
+                for start in range(0, len(entries), self.max_batch_size):
+                    self._insert_batch(table, entries[start:start + self.max_batch_size])
+            if closed:
+                return
+
+    def _write(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Upsert rows on their id, skipping those already stored.
+
+        Returns:
+            The stored row for each input row, in order (rows skipped as
+            already stored are read back)
+        """
+        inserted = self.client.table(table).upsert(rows, on_conflict="id", ignore_duplicates=True).execute().data
+        stored = {row["id"]: row for row in inserted}
+        missing = [row["id"] for row in rows if row["id"] not in stored]
+        if missing:
+            for row in self.client.table(table).select("*").in_("id", missing).execute().data:
+                stored[row["id"]] = row
+        if len(stored) < len(rows):
+            raise RuntimeError(f"Expected {len(rows)} stored rows, got {len(stored)}")
+        return [stored[row["id"]] for row in rows]
+
+    def _insert_batch(self, table: str, entries: List[Tuple[Dict[str, Any], Future, float]]) -> None:
+        """Insert one batch and resolve its futures, falling back to row-by-row writes on error."""
+        # Rows whose caller gave up before the batch was sent are dropped
+        entries = [entry for entry in entries if entry[1].set_running_or_notify_cancel()]
+        if not entries:
+            return
+        started = time.perf_counter()
+        rows = [row for row, _, _ in entries]
+        try:
+            for (_, future, _), stored in zip(entries, self._write(table, rows)):
+                future.set_result(stored)
+
+        except Exception as e:
+            # One invalid row must not fail the whole batch: retry each row on its own.
+            # Rows the failed request did store are skipped by the upsert and read back.
+            logger.warning(f"Batch insert of {len(rows)} {table} rows failed, retrying one by one: {str(e)}")
+            with self._condition:
+                self._fallbacks += 1
+            for row, future, _ in entries:
+                try:
+                    future.set_result(self._write(table, [row])[0])
+                except Exception as row_error:
+                    future.set_exception(row_error)
+
+        self.flush_latency.record(time.perf_counter() - started)
+        with self._condition:
+            self._batches += 1
+            self._rows += len(rows)
+            self._max_batch = max(self._max_batch, len(rows))
+        logger.info(f"Flushed batch of {len(rows)} {table} rows in {time.perf_counter() - started:.3f}s")
+
+def _is_unique_violation(error: Exception) -> bool:
+    """Whether a PostgREST error is a unique constraint violation (Postgres code 23505)."""
+    return getattr(error, "code", None) == "23505"
+
+
+def _is_duplicate_error(error: Exception) -> bool:
+    """Whether a Storage error means the object already exists."""
+    details = error.args[0] if error.args and isinstance(error.args[0], dict) else {}
+    return str(details.get("statusCode")) == "409" or details.get("error") == "Duplicate"
+
+
 class SupabaseClient:
-    def __init__(self):
-        """Initialize Supabase client with environment variables."""
-        self.client = create_client(
-            os.getenv("SUPABASE_URL", ""),
-            os.getenv("SUPABASE_KEY", "")
-        )
+    def __init__(self, batch_writes: Optional[bool] = None, client: Optional["Client"] = None):
+        """
+        Initialize Supabase client with environment variables.
+
+        Args:
+            batch_writes: Buffer inserts in a BatchWriter (defaults to the SUPABASE_BATCH_WRITES variable)
+            client: Existing supabase-py client to reuse instead of creating one
+        """
+        # Default to the process-wide pooled client (see clients.py)
+        self.client = client or get_supabase()
+
+        # "postgres" uses the search RPCs, "local" an in-process index (local stand-ins without RPCs)
+        self.search_backend = os.getenv("SEARCH_BACKEND", "postgres")
+        self._search_indexes: Dict[str, InvertedIndex] = {}
+        self._search_watermarks: Dict[str, Optional[str]] = {}
+        self._search_lock = threading.Lock()
+
+        if batch_writes is None:
+            batch_writes = os.getenv("SUPABASE_BATCH_WRITES", "false").lower() in ("1", "true", "yes")
+        self.batch_writer = BatchWriter(
+            self.client,
+            max_batch_size=int(os.getenv("SUPABASE_BATCH_MAX_ROWS", "50")),
+            max_wait_ms=float(os.getenv("SUPABASE_BATCH_MAX_WAIT_MS", "20"))
+        ) if batch_writes else None
+
+    def _insert(self, table: str, row: Dict[str, Any], force_sync: bool = False) -> Dict[str, Any]:
+        """
+        Insert one row, through the batch writer when it is enabled.
+
+        Args:
+            table: Target table
+            row: Row to insert
+            force_sync: Bypass the batch writer and insert immediately
+
+        Returns:
+            Dict containing the inserted row data
+        """
+        try:
+            with tracing.stage("supabase_insert"):
+                if self.batch_writer is not None and not force_sync:
+                    future = self.batch_writer.submit(table, row)
+                    try:
+                        return future.result(timeout=30)
+                    except FutureTimeoutError:
+                        # Still buffered: withdraw it, so the error returned to the caller leaves no row behind
+                        if future.cancel():
+                            raise
+                        # Already sent: wait for the outcome of that request
+                        return future.result()
+                result = self.client.table(table).insert(row).execute()
+                return result.data[0]
+
+        except Exception as e:
+            # A retried alert: hand back the row stored by the first attempt
+            if row.get("idempotency_key") and _is_unique_violation(e):
+                existing = self.find_by_idempotency_key(table, row["idempotency_key"])
+                if existing is not None:
+                    raise DuplicateRowError(table, existing) from e
+            raise
+
+    def find_by_idempotency_key(self, table: str, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the row stored for an idempotency key.
+
+        Args:
+            table: Table to search ("trades" or "structures")
+            idempotency_key: Value of the idempotency_key column
+
+        Returns:
+            The row, or None if there is none
+        """
+        result = self.client.table(table).select("*").eq("idempotency_key", idempotency_key).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def get_row(self, table: str, row_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch one trade or structure by id.
+
+        Args:
+            table: Table to read ("trades" or "structures")
+            row_id: Id of the row
+
+        Returns:
+            The row, or None if there is none
+        """
+        result = self.client.table(table).select("*").eq("id", row_id).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def upsert_rows(self, table: str, rows: List[Dict[str, Any]], count_inserted: bool = False) -> Optional[int]:
+        """
+        Insert rows that carry their own id, skipping ids already stored.
+
+        Used by the ingest log replay (see ingest_log.py) and the CSV import
+        (csv_importer.py): a row sent twice is ignored instead of duplicated,
+        and an existing row keeps the AI feedback or screenshot URL set on it since.
+
+        Args:
+            table: Target table
+            rows: Rows to insert, each with an "id"
+            count_inserted: Return the number of rows actually inserted (the
+                inserted rows come back in the response instead of nothing)
+
+        Returns:
+            Number of rows inserted if count_inserted, else None
+        """
+        with tracing.stage("supabase_upsert"):
+            response = self.client.table(table).upsert(
+                rows, on_conflict="id", ignore_duplicates=True,
+                returning="representation" if count_inserted else "minimal"
+            ).execute()
+        return len(response.data) if count_inserted else None
 
     def insert_trade(
         self,
@@ -29,7 +396,10 @@ class SupabaseClient:
         take_profit: float,
         screenshot_url: Optional[str] = None,
         notes: Optional[str] = None,
-        risk_reward: Optional[float] = None
+        risk_reward: Optional[float] = None,
+        idempotency_key: Optional[str] = None,
+        force_sync: bool = False,
+        **structure: Any
     ) -> Dict[str, Any]:
         """
         Insert a new trade into the trades table.
@@ -43,6 +413,9 @@ class SupabaseClient:
             screenshot_url: Optional URL to the trade screenshot
             notes: Optional trading notes
             risk_reward: Optional risk/reward ratio
+            idempotency_key: Optional key of the alert (unique, see idempotency.py)
+            force_sync: Insert immediately even when batch writes are enabled
+            structure: Label of the preceding structure (StructureIndex.label), if any
             
         Returns:
             Dict containing the inserted trade data
@@ -58,11 +431,17 @@ class SupabaseClient:
                 "notes": notes,
                 "risk_reward": risk_reward
             }
+            if idempotency_key:
+                trade_data["idempotency_key"] = idempotency_key
+            trade_data.update(structure)
             
-            result = self.client.table("trades").insert(trade_data).execute()
+            inserted = self._insert("trades", trade_data, force_sync)
             logger.info(f"Successfully inserted trade for {instrument}")
-            return result.data[0]
+            return inserted
             
+        except DuplicateRowError:
+            raise
+
         except Exception as e:
             logger.error(f"Error inserting trade: {str(e)}")
             raise
@@ -74,7 +453,9 @@ class SupabaseClient:
         price_level: float,
         direction: str,  # "BULLISH" or "BEARISH"
         screenshot_url: Optional[str] = None,
-        notes: Optional[str] = None
+        notes: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        force_sync: bool = False
     ) -> Dict[str, Any]:
         """
         Insert a new market structure into the structures table.
@@ -86,6 +467,8 @@ class SupabaseClient:
             direction: Structure direction ("BULLISH" or "BEARISH")
             screenshot_url: Optional URL to structure screenshot
             notes: Optional notes about the structure
+            idempotency_key: Optional key of the alert (unique, see idempotency.py)
+            force_sync: Insert immediately even when batch writes are enabled
             
         Returns:
             Dict containing the inserted structure data
@@ -99,15 +482,276 @@ class SupabaseClient:
                 "screenshot_url": screenshot_url,
                 "notes": notes
             }
+            if idempotency_key:
+                structure_data["idempotency_key"] = idempotency_key
             
-            result = self.client.table("structures").insert(structure_data).execute()
+            inserted = self._insert("structures", structure_data, force_sync)
             logger.info(f"Successfully inserted {structure_type} structure for {instrument}")
-            return result.data[0]
+            return inserted
             
+        except DuplicateRowError:
+            raise
+
         except Exception as e:
             logger.error(f"Error inserting structure: {str(e)}")
             raise
 
+    def update_ai_feedback(
+        self,
+        table: str,
+        row_id: str,
+        feedback: str
+    ) -> Dict[str, Any]:
+        """
+        Store the AI feedback on an existing trade or structure.
+
+        Args:
+            table: Target table ("trades" or "structures")
+            row_id: Id of the row to update
+            feedback: AI-generated feedback text
+
+        Returns:
+            Dict containing the updated row data
+        """
+        try:
+            with tracing.stage("supabase_update"):
+                result = self.client.table(table).update({"ai_feedback": feedback}).eq("id", row_id).execute()
+            logger.info(f"Successfully updated AI feedback for {table} row {row_id}")
+            return result.data[0] if result.data else {}
+
+        except Exception as e:
+            logger.error(f"Error updating AI feedback: {str(e)}")
+            raise
+
+    def update_screenshot_url(
+        self,
+        table: str,
+        row_id: str,
+        screenshot_url: str
+    ) -> Dict[str, Any]:
+        """
+        Store the screenshot URL on an existing trade or structure.
+
+        Args:
+            table: Target table ("trades" or "structures")
+            row_id: Id of the row to update
+            screenshot_url: Public URL of the uploaded screenshot
+
+        Returns:
+            Dict containing the updated row data
+        """
+        try:
+            with tracing.stage("supabase_update"):
+                result = self.client.table(table).update({"screenshot_url": screenshot_url}).eq("id", row_id).execute()
+            logger.info(f"Successfully updated screenshot URL for {table} row {row_id}")
+            return result.data[0] if result.data else {}
+
+        except Exception as e:
+            logger.error(f"Error updating screenshot URL: {str(e)}")
+            raise
+
+    def bulk_update_ai_feedback(
+        self,
+        table: str,
+        updates: List[Dict[str, Any]]
+    ) -> int:
+        """
+        Store AI feedback on many rows in a single round trip.
+
+        Uses the `bulk_update_ai_feedback` RPC (see supabase/migrations).
+
+        Args:
+            table: Target table ("trades" or "structures")
+            updates: List of {"id": ..., "ai_feedback": ...} dicts
+
+        Returns:
+            Number of rows updated
+        """
+        if not updates:
+            return 0
+        try:
+            result = self.client.rpc(
+                "bulk_update_ai_feedback",
+                {"target_table": table, "updates": updates}
+            ).execute()
+            logger.info(f"Successfully updated AI feedback for {len(updates)} {table} rows")
+            return result.data or 0
+
+        except Exception as e:
+            logger.error(f"Error bulk updating AI feedback: {str(e)}")
+            raise
+
+    def fetch_trades_without_feedback(
+        self,
+        after: Optional[Tuple[str, str]] = None,
+        limit: int = 500
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch the next page of trades that have no AI feedback yet.
+
+        Rows are ordered by (created_at, id) and paginated by keyset, so the
+        page size stays constant however deep the backlog is.
+
+        Args:
+            after: (created_at, id) of the last row of the previous page
+            limit: Page size
+
+        Returns:
+            List of trade rows
+        """
+        try:
+            query = (
+                self.client.table("trades")
+                .select(
+                    "id, created_at, instrument, direction, entry_price, stop_loss, take_profit, risk_reward, notes, "
+                    "structure_type, structure_direction, structure_price, structure_at"
+                )
+                .is_("ai_feedback", "null")
+            )
+            if after:
+                created_at, row_id = after
+                query = or_filter(query, f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{row_id})')
+            result = order_by(query, "created_at", "id").limit(limit).execute()
+            return result.data
+
+        except Exception as e:
+            logger.error(f"Error fetching trades without feedback: {str(e)}")
+            raise
+
+    def bulk_update_trade_structures(self, updates: List[Dict[str, Any]]) -> int:
+        """
+        Store the preceding-structure label of many trades in a single round trip.
+
+        Uses the `bulk_update_trade_structures` RPC (see supabase/migrations).
+
+        Args:
+            updates: List of {"id", "structure_id", "structure_type", "structure_direction", "structure_price", "structure_at"} dicts
+
+        Returns:
+            Number of trades updated
+        """
+        if not updates:
+            return 0
+        try:
+            result = self.client.rpc("bulk_update_trade_structures", {"updates": updates}).execute()
+            logger.info(f"Successfully labeled {len(updates)} trades with their preceding structure")
+            return result.data or 0
+
+        except Exception as e:
+            logger.error(f"Error bulk updating trade structures: {str(e)}")
+            raise
+
+    def fetch_daily_stats(self) -> List[Dict[str, Any]]:
+        """
+        Fetch the per-day trade aggregates maintained by the `trade_daily_stats` triggers.
+
+        One row per (day, instrument, direction): a few hundred rows for years
+        of trading, read page by page past the PostgREST row cap.
+
+        Returns:
+            List of {"day", "instrument", "direction", "trade_count", "rr_sum", "rr_count", "win_count"} dicts
+        """
+        try:
+            rows = []
+            start = 0
+            while True:
+                query = self.client.table("trade_daily_stats").select(
+                    "day, instrument, direction, trade_count, rr_sum, rr_count, win_count"
+                )
+                query = order_by(query, "day", "instrument", "direction").limit(1000)
+                # offset/limit rather than range(): range(start, end) excludes `end` in postgrest-py 0.11
+                query.params = query.params.add("offset", start)
+                page = query.execute().data
+                rows.extend(page)
+                if len(page) < 1000:
+                    return rows
+                start += 1000
+
+        except Exception as e:
+            logger.error(f"Error fetching daily trade stats: {str(e)}")
+            raise
+
+    def rebuild_daily_stats(self) -> int:
+        """
+        Recompute `trade_daily_stats` from the trades table.
+
+        Uses the `rebuild_trade_daily_stats` RPC, which holds writes to
+        trades for the duration of the rebuild.
+
+        Returns:
+            Number of aggregate rows written
+        """
+        try:
+            result = self.client.rpc("rebuild_trade_daily_stats", {}).execute()
+            logger.info(f"Rebuilt daily trade stats: {result.data} groups")
+            return result.data or 0
+
+        except Exception as e:
+            logger.error(f"Error rebuilding daily trade stats: {str(e)}")
+            raise
+
+    def search_trades(self, query: str, limit: int = 200) -> List[Dict[str, Any]]:
+        """
+        Full-text search over trade notes and AI feedback.
+
+        Args:
+            query: Free-text query (all terms must match)
+            limit: Maximum number of results
+
+        Returns:
+            List of {"id", "rank"} dicts, best match first
+        """
+        return self._search("trades", "search_trades", FIELD_WEIGHTS, query, limit)
+
+    def search_structures(self, query: str, limit: int = 200) -> List[Dict[str, Any]]:
+        """
+        Full-text search over structure notes.
+
+        Args:
+            query: Free-text query (all terms must match)
+            limit: Maximum number of results
+
+        Returns:
+            List of {"id", "rank"} dicts, best match first
+        """
+        return self._search("structures", "search_structures", {"notes": 1.0}, query, limit)
+
+    def _search(self, table: str, rpc: str, fields: Dict[str, float], query: str, limit: int) -> List[Dict[str, Any]]:
+        """Run a search through the RPC or the local inverted index."""
+        if not query or not query.strip():
+            return []
+        try:
+            if self.search_backend == "local":
+                return self._sync_search_index(table, fields).search(query, limit)
+            result = self.client.rpc(rpc, {"search_query": query, "max_results": limit}).execute()
+            return result.data or []
+
+        except Exception as e:
+            logger.error(f"Error searching {table}: {str(e)}")
+            raise
+
+    def _sync_search_index(self, table: str, fields: Dict[str, float]) -> InvertedIndex:
+        """Bring the local index of a table up to date with rows changed since the last sync."""
+        with self._search_lock:
+            index = self._search_indexes.setdefault(table, InvertedIndex(fields))
+            watermark = self._search_watermarks.get(table)
+            start = 0
+            while True:
+                query = self.client.table(table).select(", ".join(["id", "updated_at", *fields]))
+                if watermark:
+                    query = query.gte("updated_at", watermark)
+                query = order_by(query, "updated_at", "id").limit(1000)
+                # offset/limit rather than range(): range(start, end) excludes `end` in postgrest-py 0.11,
+                # pages held 999 rows and the sync stopped after the first one
+                query.params = query.params.add("offset", start)
+                rows = query.execute().data
+                index.add_many(rows)
+                if rows:
+                    self._search_watermarks[table] = rows[-1]["updated_at"]
+                if len(rows) < 1000:
+                    return index
+                start += 1000
+
     def upload_screenshot(
         self,
         file: BinaryIO,
@@ -140,3 +784,53 @@ class SupabaseClient:
         except Exception as e:
             logger.error(f"Error uploading screenshot: {str(e)}")
             raise
+
+    def _upload_object(self, path: str, data: bytes, content_type: str) -> bool:
+        """
+        Upload an immutable object to the screenshots bucket.
+
+        Returns:
+            False if an object already exists at this path
+        """
+        tracing.observe_size("storage_object", len(data))
+        with tracing.stage("storage_upload"):
+            try:
+                self.client.storage.from_("screenshots").upload(
+                    path=path,
+                    file=data,
+                    # Content-hash names never change content: cache for a year
+                    file_options={"content-type": content_type, "cache-control": "31536000"}
+                )
+                return True
+            except Exception as e:
+                if _is_duplicate_error(e):
+                    return False
+                raise
+
+    def store_screenshot(self, data: bytes) -> str:
+        """
+        Process a screenshot (re-encode, thumbnail) and store it under its content hash.
+
+        A screenshot already in Storage is not uploaded again.
+
+        Args:
+            data: Raw image bytes
+
+        Returns:
+            Public URL of the full-size image (see image_pipeline.thumbnail_url)
+        """
+        pipeline = get_pipeline()
+        with tracing.stage("image_process"):
+            processed = pipeline.process(data)
+        try:
+            # Thumbnail first: an existing full image implies its thumbnail exists
+            self._upload_object(processed["thumbnail_path"], processed["thumbnail"], "image/webp")
+            if not self._upload_object(processed["path"], processed["full"], processed["content_type"]):
+                pipeline.record_duplicate(processed)
+                logger.info(f"Screenshot {processed['hash'][:12]} already stored, reusing it")
+
+            return self.client.storage.from_("screenshots").get_public_url(processed["path"])
+
+        except Exception as e:
+            logger.error(f"Error storing screenshot: {str(e)}")
+            raise
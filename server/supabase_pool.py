@@ -0,0 +1,43 @@
+from typing import Any, Dict
+
+from postgrest import SyncPostgrestClient
+from postgrest.utils import SyncClient as PostgrestSession
+from storage3.utils import SyncClient as StorageSession
+from supabase import Client
+from supabase.lib.storage_client import SupabaseStorageClient
+
+from clients import http_client_options, http_timeout
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    """PostgREST client whose session uses the shared pool settings."""
+
+    def create_session(self, base_url: str, headers: Dict[str, str], timeout: Any) -> PostgrestSession:
+        return PostgrestSession(base_url=base_url, headers=headers, **http_client_options())
+
+
+class PooledStorageClient(SupabaseStorageClient):
+    """Storage client whose session uses the shared pool settings."""
+
+    def _create_session(self, base_url: str, headers: Dict[str, str], timeout: int) -> StorageSession:
+        # Uploads are slower than table queries: keep the Storage read timeout
+        return StorageSession(base_url=base_url, headers=headers, **http_client_options(http_timeout(read=float(timeout))))
+
+
+class PooledSupabase(Client):
+    """
+    supabase-py client built on pooled keep-alive sessions.
+
+    supabase-py already keeps one PostgREST and one Storage session per
+    Client; this subclass only swaps in the shared limits, timeouts and
+    HTTP/2 setting. Reusing the Client (see get_supabase) is what keeps
+    connections and TLS sessions warm.
+    """
+
+    @staticmethod
+    def _init_postgrest_client(rest_url: str, headers: Dict[str, str], schema: str, timeout: Any = None) -> SyncPostgrestClient:
+        return PooledPostgrestClient(rest_url, headers=headers, schema=schema)
+
+    @staticmethod
+    def _init_storage_client(storage_url: str, headers: Dict[str, str], storage_client_timeout: int = 20) -> SupabaseStorageClient:
+        return PooledStorageClient(storage_url, headers, storage_client_timeout)
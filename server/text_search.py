@@ -0,0 +1,155 @@
+import re
+import math
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+# Same tokenization as PostgreSQL's 'simple' text search configuration:
+# lowercased word characters, no stemming, no stop words
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# ts_rank default weights for the A and B labels used in the migration
+FIELD_WEIGHTS = {"notes": 1.0, "ai_feedback": 0.4}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Split text into search tokens.
+
+    Args:
+        text: Text to tokenize (None is treated as empty)
+
+    Returns:
+        List of lowercased tokens
+    """
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def prefix_tsquery(text: Optional[str]) -> str:
+    """
+    Build a PostgreSQL tsquery where every term must match as a word prefix.
+
+    "break retest" gives "break:* & retest:*", so "break" finds "breakout".
+    Tokens are word characters only and need no quoting.
+
+    Args:
+        text: Free-text query
+
+    Returns:
+        The tsquery, or an empty string when the text holds no term
+    """
+    return " & ".join(f"{token}:*" for token in dict.fromkeys(tokenize(text)))
+
+
+class InvertedIndex:
+    """
+    In-process full-text index used when running against a local stand-in
+    instead of Supabase (no `search_trades` RPC available).
+
+    Mirrors the SQL search: every query term must match as a word prefix
+    (like prefix_tsquery) and results are ranked by weighted term frequency
+    with an IDF factor, best first.
+    """
+
+    def __init__(self, fields: Optional[Dict[str, float]] = None):
+        """
+        Initialize an empty index.
+
+        Args:
+            fields: Indexed fields and their weights
+        """
+        self.fields = fields or FIELD_WEIGHTS
+        self._postings: Dict[str, Dict[Any, float]] = {}
+        self._documents: Dict[Any, Counter] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, doc_id: Any, document: Dict[str, Any]) -> None:
+        """
+        Index a document, replacing any previous version.
+
+        Args:
+            doc_id: Document id
+            document: Dict holding the indexed fields
+        """
+        weights = Counter()
+        for field, weight in self.fields.items():
+            for token in tokenize(document.get(field)):
+                weights[token] += weight
+
+        with self._lock:
+            self._remove(doc_id)
+            self._documents[doc_id] = weights
+            for token, weight in weights.items():
+                self._postings.setdefault(token, {})[doc_id] = weight
+
+    def add_many(self, documents: Iterable[Dict[str, Any]], id_field: str = "id") -> None:
+        """Index several documents."""
+        for document in documents:
+            self.add(document[id_field], document)
+
+    def remove(self, doc_id: Any) -> None:
+        """Remove a document from the index."""
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: Any) -> None:
+        """Caller holds the lock."""
+        previous = self._documents.pop(doc_id, None)
+        if not previous:
+            return
+        for token in previous:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+
+    def _prefix_postings(self, term: str) -> Dict[Any, float]:
+        """Caller holds the lock. Weights of the tokens starting with term, summed per document."""
+        merged: Dict[Any, float] = {}
+        for token, postings in self._postings.items():
+            if token.startswith(term):
+                for doc_id, weight in postings.items():
+                    merged[doc_id] = merged.get(doc_id, 0.0) + weight
+        return merged
+
+    def search(self, query: str, limit: int = 200) -> List[Dict[str, Any]]:
+        """
+        Find the documents matching every term of the query (as a word prefix).
+
+        Args:
+            query: Free-text query
+            limit: Maximum number of results
+
+        Returns:
+            List of {"id", "rank"} dicts, best match first
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            postings = [self._prefix_postings(term) for term in terms]
+            if not all(postings):
+                return []
+            # Intersect starting from the rarest term
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for p in postings[1:]:
+                candidates &= p.keys()
+
+            total = len(self._documents)
+            scores = {}
+            for doc_id in candidates:
+                scores[doc_id] = sum(
+                    p[doc_id] * math.log(1 + total / len(p))
+                    for p in postings
+                )
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"id": doc_id, "rank": round(score, 4)} for doc_id, score in ranked]
@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Request id of the alert being handled, and the stage durations recorded for it
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("stages", default=None)
+
+# Seconds: from a SQLite write (~100 µs) to a slow OpenAI completion (~30 s)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes: a bare alert (~200 B) to a full-size base64 screenshot (~10 MB)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+# Tokens per completion
+TOKEN_BUCKETS = (50, 100, 200, 400, 800, 1600, 3200)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Prometheus histogram with fixed buckets, one series per label values.
+
+    observe() is a bisect and two additions under a lock (~1 µs); the
+    cumulative bucket counts are only computed when /metrics is scraped.
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        Record one observation.
+
+        Args:
+            value: Observed value (seconds, bytes, tokens...)
+            label_values: Values of the histogram labels, in order
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (not cumulative), the +Inf bucket, then the sum
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter, one series per label values."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Add `amount` to the series of these label values."""
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        with self._lock:
+            return self._series.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for label_values, value in sorted(series.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Prometheus gauge read from a callback when /metrics is scraped (queue depths, replay lag...)."""
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception:
+            # A failing source must not break the whole scrape
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_format_value(value)}"]
+
+
+class Registry:
+    """The metrics of the process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        """Register (or replace) a gauge read at scrape time."""
+        return self.register(Gauge(name, help, read))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    "trademind_http_request_duration_seconds", "HTTP request duration by route and status.", ("route", "status")
+))
+STAGE_SECONDS = registry.register(Histogram(
+    "trademind_stage_duration_seconds",
+    "Duration of each processing stage (decode, insert, upload, OpenAI call...).", ("stage",)
+))
+STAGE_ERRORS = registry.register(Counter(
+    "trademind_stage_errors_total", "Exceptions raised in each processing stage.", ("stage",)
+))
+PAYLOAD_BYTES = registry.register(Histogram(
+    "trademind_payload_bytes", "Size of webhook request bodies and decoded screenshots.", ("kind",), SIZE_BUCKETS
+))
+OPENAI_TOKENS = registry.register(Counter(
+    "trademind_openai_tokens_total", "OpenAI tokens used, by model and type (prompt/completion).", ("model", "type")
+))
+OPENAI_COMPLETION_TOKENS = registry.register(Histogram(
+    "trademind_openai_completion_tokens", "Completion tokens per OpenAI call, by model.", ("model",), TOKEN_BUCKETS
+))
+OPENAI_FIRST_TOKEN_SECONDS = registry.register(Histogram(
+    "trademind_openai_time_to_first_token_seconds",
+    "Time from a streamed OpenAI call to its first token, by kind (trade/structure).", ("kind",)
+))
+OPENAI_REQUESTS = registry.register(Counter(
+    "trademind_openai_requests_total", "OpenAI calls by kind (trade/structure) and outcome.", ("kind", "outcome")
+))
+
+
+class stage:
+    """
+    Time a block as a processing stage.
+
+        with tracing.stage("supabase_insert"):
+            ...
+
+    The duration goes to the stage histogram and, inside a request, to the
+    per-request breakdown logged when the request ends; an exception is
+    counted as an error of the stage and re-raised.
+    """
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "stage":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, self.name)
+        # GeneratorExit: a stream abandoned by its consumer is not an error of the stage
+        if exc_type is not None and issubclass(exc_type, Exception):
+            STAGE_ERRORS.inc(self.name)
+        stages = _stages.get()
+        if stages is not None:
+            stages[self.name] = stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+def observe_size(kind: str, size: Optional[int]) -> None:
+    """Record a payload size in bytes (ignored when unknown)."""
+    if size is not None:
+        PAYLOAD_BYTES.observe(size, kind)
+
+
+def record_openai_usage(kind: str, model: str, usage) -> None:
+    """
+    Count the tokens of a completion.
+
+    Args:
+        kind: "trade" or "structure"
+        model: Model name
+        usage: `usage` of the OpenAI response (object or dict), may be None
+    """
+    OPENAI_REQUESTS.inc(kind, "ok")
+    if usage is None:
+        return
+    prompt = usage["prompt_tokens"] if isinstance(usage, dict) else usage.prompt_tokens
+    completion = usage["completion_tokens"] if isinstance(usage, dict) else usage.completion_tokens
+    OPENAI_TOKENS.inc(model, "prompt", amount=prompt)
+    OPENAI_TOKENS.inc(model, "completion", amount=completion)
+    OPENAI_COMPLETION_TOKENS.observe(completion, model)
+
+
+def start_request(request_id: Optional[str] = None) -> str:
+    """
+    Start tracing a request (or a background job) in the current context.
+
+    Args:
+        request_id: Id received from the caller (X-Request-Id) or carried by a job
+
+    Returns:
+        The request id, generated if none was given
+    """
+    request_id = request_id or uuid.uuid4().hex[:16]
+    _request_id.set(request_id)
+    _stages.set({})
+    return request_id
+
+
+def finish_request() -> Dict[str, float]:
+    """Stop tracing the current request and return its stage durations in milliseconds."""
+    stages = _stages.get() or {}
+    _stages.set(None)
+    return {name: round(seconds * 1000, 2) for name, seconds in stages.items()}
+
+
+def current_request_id() -> Optional[str]:
+    """Request id of the current context, or None outside a request."""
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Add the current request id to every log record (`-` outside a request)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """The text format of the servers, with the stage breakdown appended when present."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        stages = getattr(record, "stages_ms", None)
+        if stages:
+            line += " (" + ", ".join(f"{name} {ms} ms" for name, ms in stages.items()) + ")"
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the request id and the stage breakdown when present."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if getattr(record, "stages_ms", None) is not None:
+            entry["stages_ms"] = record.stages_ms
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """
+    Send the process logs to stderr with the request id of each record.
+
+    LOG_FORMAT=json writes one JSON object per line; the default is the
+    text format of the servers with the request id in brackets.
+    """
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter('%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'))
+    # force: modules imported earlier may already have called basicConfig
+    logging.basicConfig(level=level, handlers=[handler], force=True)
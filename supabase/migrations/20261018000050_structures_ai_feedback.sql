@@ -0,0 +1,3 @@
+-- Ajouter la colonne ai_feedback à la table structures
+ALTER TABLE structures
+ADD COLUMN IF NOT EXISTS ai_feedback TEXT;
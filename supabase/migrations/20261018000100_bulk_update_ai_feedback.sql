@@ -0,0 +1,30 @@
+-- Mise à jour groupée du feedback IA (analyse du backlog)
+-- updates : tableau JSON de {"id": uuid, "ai_feedback": text}
+CREATE OR REPLACE FUNCTION bulk_update_ai_feedback(target_table TEXT, updates JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    IF target_table NOT IN ('trades', 'structures') THEN
+        RAISE EXCEPTION 'Unsupported table: %', target_table;
+    END IF;
+
+    EXECUTE format(
+        'UPDATE %I AS t
+         SET ai_feedback = u.ai_feedback
+         FROM jsonb_to_recordset($1) AS u(id UUID, ai_feedback TEXT)
+         WHERE t.id = u.id',
+        target_table
+    ) USING updates;
+
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$;
+
+-- Index partiel pour parcourir rapidement les trades sans feedback
+CREATE INDEX IF NOT EXISTS idx_trades_missing_feedback
+ON trades (created_at, id)
+WHERE ai_feedback IS NULL;
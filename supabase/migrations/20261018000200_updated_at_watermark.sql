@@ -0,0 +1,35 @@
+-- Maintenir updated_at sur trades et structures pour la synchronisation par delta du dashboard
+-- La colonne est ajoutée sans défaut puis remplie depuis created_at : avec DEFAULT now() dans ADD COLUMN,
+-- toutes les lignes existantes recevraient l'heure de la migration (même watermark pour tout l'historique)
+-- et le remplissage ne trouverait aucune ligne NULL. Le remplissage précède la création des triggers.
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$;
+
+ALTER TABLE trades ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+UPDATE trades SET updated_at = created_at WHERE updated_at IS NULL;
+ALTER TABLE trades ALTER COLUMN updated_at SET DEFAULT now();
+
+DROP TRIGGER IF EXISTS trades_set_updated_at ON trades;
+CREATE TRIGGER trades_set_updated_at
+BEFORE UPDATE ON trades
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_trades_updated_at ON trades (updated_at, id);
+
+ALTER TABLE structures ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+UPDATE structures SET updated_at = created_at WHERE updated_at IS NULL;
+ALTER TABLE structures ALTER COLUMN updated_at SET DEFAULT now();
+
+DROP TRIGGER IF EXISTS structures_set_updated_at ON structures;
+CREATE TRIGGER structures_set_updated_at
+BEFORE UPDATE ON structures
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_structures_updated_at ON structures (updated_at, id);
@@ -0,0 +1,16 @@
+-- R:R calculé en base, avec la même formule que le dashboard (metrics.compute_risk_reward),
+-- pour filtrer gagnants / perdants côté serveur
+ALTER TABLE trades
+ADD COLUMN IF NOT EXISTS computed_rr NUMERIC GENERATED ALWAYS AS (
+    CASE
+        WHEN abs(entry_price - stop_loss) = 0 THEN 0
+        ELSE abs(take_profit - entry_price) / abs(entry_price - stop_loss)
+    END
+) STORED;
+
+-- Pagination keyset du journal : ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_trades_created_at_id ON trades (created_at DESC, id DESC);
+
+-- Filtres instrument / direction combinés à l'ordre du journal
+CREATE INDEX IF NOT EXISTS idx_trades_instrument_direction_created_at
+ON trades (instrument, direction, created_at DESC, id DESC);
@@ -0,0 +1,54 @@
+-- Recherche plein texte indexée sur les notes et le feedback IA
+-- Configuration 'simple' : notes en français, feedback IA en anglais, pas de stemming spécifique
+-- Chaque mot de la recherche est un préfixe (« break » trouve « breakout ») : même requête que
+-- text_search.prefix_tsquery, utilisée par le filtre fts du journal (search_vector=fts(simple).break:*)
+
+ALTER TABLE trades
+ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(notes, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(ai_feedback, '')), 'B')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_trades_search_vector ON trades USING GIN (search_vector);
+
+ALTER TABLE structures
+ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(notes, '')), 'A')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_structures_search_vector ON structures USING GIN (search_vector);
+
+-- « break retest » -> 'break':* & 'retest':* (requête vide, donc aucun résultat, sans mot)
+CREATE OR REPLACE FUNCTION prefix_tsquery(search_query TEXT)
+RETURNS TSQUERY
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT coalesce(string_agg(quote_literal(lexeme) || ':*', ' & '), '')::tsquery
+    FROM unnest(to_tsvector('simple', coalesce(search_query, '')));
+$$;
+
+-- Résultats classés par pertinence (ts_rank), puis du plus récent au plus ancien
+CREATE OR REPLACE FUNCTION search_trades(search_query TEXT, max_results INTEGER DEFAULT 200)
+RETURNS TABLE (id UUID, rank REAL)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT t.id, ts_rank(t.search_vector, q) AS rank
+    FROM trades t, prefix_tsquery(search_query) q
+    WHERE t.search_vector @@ q
+    ORDER BY rank DESC, t.created_at DESC
+    LIMIT max_results;
+$$;
+
+CREATE OR REPLACE FUNCTION search_structures(search_query TEXT, max_results INTEGER DEFAULT 200)
+RETURNS TABLE (id UUID, rank REAL)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT s.id, ts_rank(s.search_vector, q) AS rank
+    FROM structures s, prefix_tsquery(search_query) q
+    WHERE s.search_vector @@ q
+    ORDER BY rank DESC, s.created_at DESC
+    LIMIT max_results;
+$$;
@@ -0,0 +1,17 @@
+-- Clé d'idempotence des webhooks : une alerte TradingView rejouée ne crée pas de deuxième ligne
+-- (alert_id / en-tête Idempotency-Key, ou hash du payload par fenêtre de temps ; voir server/idempotency.py)
+ALTER TABLE trades ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+ALTER TABLE structures ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+
+-- Contraintes UNIQUE (et non index partiels) pour pouvoir servir de cible à ON CONFLICT ;
+-- les lignes sans clé (NULL) ne sont pas concernées
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'trades_idempotency_key_key') THEN
+        ALTER TABLE trades ADD CONSTRAINT trades_idempotency_key_key UNIQUE (idempotency_key);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'structures_idempotency_key_key') THEN
+        ALTER TABLE structures ADD CONSTRAINT structures_idempotency_key_key UNIQUE (idempotency_key);
+    END IF;
+END;
+$$;
@@ -0,0 +1,156 @@
+-- Agrégats des statistiques du dashboard par jour (UTC), instrument et direction,
+-- tenus à jour par triggers : le dashboard lit quelques centaines de lignes au lieu du journal entier
+CREATE TABLE IF NOT EXISTS trade_daily_stats (
+    day DATE NOT NULL,
+    instrument TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    trade_count BIGINT NOT NULL DEFAULT 0,
+    -- Somme et nombre des R:R connus (computed_rr est NULL si un prix manque)
+    rr_sum NUMERIC NOT NULL DEFAULT 0,
+    rr_count BIGINT NOT NULL DEFAULT 0,
+    -- Trades « gagnants » du dashboard : R:R >= 1 (metrics.calculate_win_rate)
+    win_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (day, instrument, direction)
+);
+
+-- Contribution d'un trade à son groupe : sign = 1 pour une ligne ajoutée, -1 pour une ligne retirée
+CREATE OR REPLACE FUNCTION trade_daily_stats_delta(
+    created_at TIMESTAMPTZ, instrument TEXT, direction TEXT, computed_rr NUMERIC, sign INTEGER
+)
+RETURNS trade_daily_stats
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT ROW(
+        (created_at AT TIME ZONE 'UTC')::date, instrument, direction,
+        sign,
+        sign * coalesce(computed_rr, 0),
+        sign * (computed_rr IS NOT NULL)::int,
+        sign * coalesce(computed_rr >= 1, false)::int,
+        now()
+    )::trade_daily_stats;
+$$;
+
+-- Additionne les contributions d'une instruction, groupe par groupe
+CREATE OR REPLACE FUNCTION apply_trade_daily_stats(deltas trade_daily_stats[])
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO trade_daily_stats AS s (day, instrument, direction, trade_count, rr_sum, rr_count, win_count, updated_at)
+    SELECT day, instrument, direction,
+           sum(trade_count), sum(rr_sum), sum(rr_count), sum(win_count), now()
+    FROM unnest(deltas)
+    WHERE day IS NOT NULL AND instrument IS NOT NULL AND direction IS NOT NULL
+    GROUP BY day, instrument, direction
+    -- Une mise à jour des notes ou du feedback IA ne touche à aucun agrégat
+    HAVING sum(trade_count) <> 0 OR sum(rr_sum) <> 0 OR sum(rr_count) <> 0 OR sum(win_count) <> 0
+    -- Ordre fixe des verrous : deux lots concurrents ne se bloquent pas mutuellement
+    ORDER BY day, instrument, direction
+    ON CONFLICT (day, instrument, direction) DO UPDATE SET
+        trade_count = s.trade_count + EXCLUDED.trade_count,
+        rr_sum = s.rr_sum + EXCLUDED.rr_sum,
+        rr_count = s.rr_count + EXCLUDED.rr_count,
+        win_count = s.win_count + EXCLUDED.win_count,
+        updated_at = now();
+
+    DELETE FROM trade_daily_stats WHERE trade_count <= 0;
+END;
+$$;
+
+-- Triggers par instruction avec tables de transition : une insertion groupée de 50 trades
+-- (BatchWriter, rejeu du journal d'ingestion) met à jour chaque groupe une seule fois.
+-- Une fonction par événement : chacune ne lit que les tables de transition qui existent pour lui
+CREATE OR REPLACE FUNCTION trades_daily_stats_on_insert()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM apply_trade_daily_stats(ARRAY(
+        SELECT trade_daily_stats_delta(r.created_at, r.instrument, r.direction, r.computed_rr, 1)
+        FROM new_rows r
+    ));
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION trades_daily_stats_on_update()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM apply_trade_daily_stats(ARRAY(
+        SELECT trade_daily_stats_delta(r.created_at, r.instrument, r.direction, r.computed_rr, 1)
+        FROM new_rows r
+        UNION ALL
+        SELECT trade_daily_stats_delta(r.created_at, r.instrument, r.direction, r.computed_rr, -1)
+        FROM old_rows r
+    ));
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION trades_daily_stats_on_delete()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM apply_trade_daily_stats(ARRAY(
+        SELECT trade_daily_stats_delta(r.created_at, r.instrument, r.direction, r.computed_rr, -1)
+        FROM old_rows r
+    ));
+    RETURN NULL;
+END;
+$$;
+
+-- PostgreSQL n'accepte pas de tables de transition sur un trigger multi-événements
+DROP TRIGGER IF EXISTS trades_daily_stats_insert ON trades;
+CREATE TRIGGER trades_daily_stats_insert
+AFTER INSERT ON trades
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trades_daily_stats_on_insert();
+
+DROP TRIGGER IF EXISTS trades_daily_stats_update ON trades;
+CREATE TRIGGER trades_daily_stats_update
+AFTER UPDATE ON trades
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trades_daily_stats_on_update();
+
+DROP TRIGGER IF EXISTS trades_daily_stats_delete ON trades;
+CREATE TRIGGER trades_daily_stats_delete
+AFTER DELETE ON trades
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION trades_daily_stats_on_delete();
+
+-- Reconstruction complète depuis trades (réconciliation : server/stats_reconciler.py --rebuild).
+-- Le verrou SHARE sur trades met les écritures en attente le temps du recalcul,
+-- pour qu'aucun delta ne soit appliqué à des agrégats en cours de remplacement
+CREATE OR REPLACE FUNCTION rebuild_trade_daily_stats()
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    group_count INTEGER;
+BEGIN
+    LOCK TABLE trades IN SHARE MODE;
+    DELETE FROM trade_daily_stats;
+
+    INSERT INTO trade_daily_stats (day, instrument, direction, trade_count, rr_sum, rr_count, win_count, updated_at)
+    SELECT (created_at AT TIME ZONE 'UTC')::date, instrument, direction,
+           count(*),
+           coalesce(sum(computed_rr), 0),
+           count(computed_rr),
+           count(*) FILTER (WHERE computed_rr >= 1),
+           now()
+    FROM trades
+    WHERE created_at IS NOT NULL AND instrument IS NOT NULL AND direction IS NOT NULL
+    GROUP BY 1, 2, 3;
+
+    GET DIAGNOSTICS group_count = ROW_COUNT;
+    RETURN group_count;
+END;
+$$;
+
+-- Remplissage initial avec les trades existants
+SELECT rebuild_trade_daily_stats();
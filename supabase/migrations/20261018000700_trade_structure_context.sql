@@ -0,0 +1,41 @@
+-- Structure BOS/CHoCH précédant chaque trade (même instrument, dans la fenêtre STRUCTURE_LOOKBACK_MINUTES),
+-- calculée par server/structure_context.py à la réception du trade ou par `python structure_context.py`
+ALTER TABLE trades
+ADD COLUMN IF NOT EXISTS structure_id UUID,
+ADD COLUMN IF NOT EXISTS structure_type TEXT,
+ADD COLUMN IF NOT EXISTS structure_direction TEXT,
+ADD COLUMN IF NOT EXISTS structure_price NUMERIC,
+ADD COLUMN IF NOT EXISTS structure_at TIMESTAMPTZ;
+
+-- Filtre « Structure » du journal combiné à l'ordre du journal
+CREATE INDEX IF NOT EXISTS idx_trades_structure_type_created_at
+ON trades (structure_type, created_at DESC, id DESC);
+
+-- Chargement des structures récentes au démarrage des serveurs webhook
+CREATE INDEX IF NOT EXISTS idx_structures_created_at ON structures (created_at);
+
+-- Écriture groupée des étiquettes (étiquetage de l'historique)
+-- updates : tableau JSON de {"id", "structure_id", "structure_type", "structure_direction", "structure_price", "structure_at"}
+CREATE OR REPLACE FUNCTION bulk_update_trade_structures(updates JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    UPDATE trades AS t
+    SET structure_id = u.structure_id,
+        structure_type = u.structure_type,
+        structure_direction = u.structure_direction,
+        structure_price = u.structure_price,
+        structure_at = u.structure_at
+    FROM jsonb_to_recordset(updates) AS u(
+        id UUID, structure_id UUID, structure_type TEXT, structure_direction TEXT,
+        structure_price NUMERIC, structure_at TIMESTAMPTZ
+    )
+    WHERE t.id = u.id;
+
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$;
@@ -0,0 +1,14 @@
+-- Sortie réelle des trades : résultat réalisé (R, points, dollars), equity et drawdown calculés par app/pnl.py
+-- quantity : nombre de contrats (1 par défaut, valeur du point par contrat dans pnl.POINT_VALUES)
+ALTER TABLE trades
+ADD COLUMN IF NOT EXISTS exit_price NUMERIC,
+ADD COLUMN IF NOT EXISTS exit_time TIMESTAMPTZ,
+ADD COLUMN IF NOT EXISTS quantity NUMERIC NOT NULL DEFAULT 1 CHECK (quantity > 0);
+
+-- Une sortie se renseigne en entier : prix et heure ensemble
+ALTER TABLE trades DROP CONSTRAINT IF EXISTS trades_exit_complete;
+ALTER TABLE trades
+ADD CONSTRAINT trades_exit_complete CHECK ((exit_price IS NULL) = (exit_time IS NULL));
+
+-- Trades clôturés dans l'ordre des sorties (courbe d'equity)
+CREATE INDEX IF NOT EXISTS idx_trades_exit_time ON trades (exit_time, id) WHERE exit_time IS NOT NULL;